@@ -0,0 +1,53 @@
+"""Run the benchmark suite.
+
+``python -m benchmarks [-o results.json] [--compare baseline.json] [name ...]``
+runs every benchmark, or those whose module name is given, prints each
+result and optionally writes them as JSON.  With --compare, the change
+from a previous run is printed, and the exit status is 1 when a
+benchmark lost more than --threshold of its throughput.
+"""
+import argparse
+import importlib
+import json
+import sys
+from benchmarks.runner import Runner, compare
+
+SUITE = ['protocol_bench', 'parser_bench', 'stream_bench', 'read_bench', 'dispatch_bench', 'command_bench',
+         'metrics_bench', 'latency_bench', 'manager_bench']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run the benchmark suite.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run, from: ' + ', '.join(SUITE))
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='throughput lost that counts as a regression (default 0.1)')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='one round and fewer samples')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in SUITE]
+    if unknown:
+        parser.error('unknown benchmark: {}'.format(', '.join(unknown)))
+
+    runner = Runner(rounds=args.rounds, quick=args.quick)
+    for name in args.names or SUITE:
+        module = importlib.import_module('benchmarks.' + name)
+        module.run(runner)
+    if args.output:
+        runner.write(args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(baseline, runner.report(), args.threshold)
+        print('\ncompared with {}:'.format(args.compare))
+        for line in lines:
+            print(line)
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
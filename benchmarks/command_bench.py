@@ -0,0 +1,64 @@
+"""Measure IrcBot command handling: handle_privmsg and the params parsers.
+
+Each operation parses a PRIVMSG line and runs handle_privmsg, which
+parses the command's parameters with its make_params_parser parser and
+calls a handler that does nothing.  Part of the suite run by
+``python -m benchmarks``; run alone with ``python -m benchmarks.command_bench``.
+"""
+import asyncio
+import irc.bot
+import irc.command
+import irc.messages
+import irc.protocol
+from benchmarks.runner import Runner
+
+COMMANDS = [
+    ('ping', None, irc.command.LastParamType.normal, None, ''),
+    ('roll', ['dice', 'sides'], irc.command.LastParamType.normal, [None, '6'], '2'),
+    ('say', ['target', 'text'], irc.command.LastParamType.string, None, '#channel hello there everyone'),
+    ('op', ['channel', 'nicks'], irc.command.LastParamType.list_, None, '#channel nick1 nick2 nick3'),
+]
+
+
+@asyncio.coroutine
+def noop(bot, command):
+    pass
+
+
+def drive(coro):
+    """Run a coroutine that never waits, without the event loop."""
+    try:
+        coro.send(None)
+    except StopIteration:
+        return
+    raise RuntimeError('coroutine waited')
+
+
+def make_bot(loop):
+    bot = irc.bot.IrcBot('irc.example.com', 'TulipBot', loop=loop, config={'STARTING_CHANNELS': []})
+    bot.nick = 'TulipBot'
+    for name, param_names, last_collects, default_values, _ in COMMANDS:
+        bot.add_command_handler(name, noop, param_names, last_collects=last_collects,
+                                default_values=default_values)
+    return bot
+
+
+def run(runner, count=20000):
+    loop = asyncio.new_event_loop()
+    try:
+        bot = make_bot(loop)
+        for name, param_names, last_collects, default_values, params in COMMANDS:
+            text = ';{} {}'.format(name, params).strip()
+            raw = irc.messages.PrivMsg('#channel', text, prefix='nick!user@host.example.com').encode()
+            runner.measure('bot command {}'.format(name),
+                           lambda line: drive(irc.bot.handle_privmsg(bot, irc.protocol.split_message(line))),
+                           [raw] * count)
+            if param_names:
+                parser = irc.command.make_params_parser(name, param_names, last_collects, default_values)
+                runner.measure('params parser {}'.format(name), parser, [params] * count)
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    run(Runner())
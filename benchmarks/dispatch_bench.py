@@ -0,0 +1,116 @@
+"""Measure IrcClient.dispatch_message with 0, 1 and 10 handlers.
+
+The previous handle_message (if/elif chain plus an unconditional gather)
+is kept here for comparison.  Run with ``python -m benchmarks.dispatch_bench``;
+run() is the part in the suite run by ``python -m benchmarks``.
+"""
+import asyncio
+import time
+import irc.client
+import irc.codes
+import irc.messages
+import irc.protocol
+
+
+@asyncio.coroutine
+def legacy_handle_message(client, message):
+    if message.command == 'PING':
+        yield from client.send_message(irc.messages.Pong(message.params))
+    elif message.command == irc.codes.RPL_WELCOME:
+        client.registered = True
+    elif message.command in [irc.codes.ERR_NICKNAMEINUSE, irc.codes.ERR_ERRONEUSNICKNAME]:
+        yield from client.send_nick(client.attempted_nick + '_')
+    elif message.command == 'NICK' and message.nick == client.nick:
+        client.nick = message.params[0]
+    elif message.command == irc.codes.ERR_PASSWDMISMATCH:
+        raise irc.codes.PasswordMismatchError
+
+    handlers = client.msg_handlers.get(message.command, [])
+    return asyncio.gather(*[h(client, message) for h in handlers], loop=client.loop)
+
+
+@asyncio.coroutine
+def noop(client, message):
+    pass
+
+
+@asyncio.coroutine
+def legacy_run(client, messages):
+    for message in messages:
+        handler_task = yield from legacy_handle_message(client, message)
+        client.tasks.add(handler_task)
+        handler_task.add_done_callback(client.cleanup_handler_task)
+    yield from client.tasks.join()
+
+
+@asyncio.coroutine
+def dispatch_run(client, messages):
+    for message in messages:
+        handler_task = client.dispatch_message(message)
+        if handler_task is not None:
+            client.tasks.add(handler_task)
+            handler_task.add_done_callback(client.cleanup_handler_task)
+    yield from client.tasks.join()
+
+
+def make_client(loop, handler_count):
+    client = irc.client.IrcClient('irc.example.com', 'TulipBot', loop=loop)
+    for _ in range(handler_count):
+        client.add_handler('PRIVMSG', noop)
+    return client
+
+
+def main(count=20000):
+    raw = b':nick!user@host PRIVMSG #channel :hello there\r\n'
+    loop = asyncio.new_event_loop()
+    try:
+        for handler_count in (0, 1, 10):
+            results = []
+            for run in (legacy_run, dispatch_run):
+                client = make_client(loop, handler_count)
+                messages = [irc.protocol.split_message(raw) for _ in range(count)]
+                start = time.perf_counter()
+                loop.run_until_complete(run(client, messages))
+                results.append(count / (time.perf_counter() - start))
+            print('{0:>2} handlers: {1:>10.0f} msg/s before {2:>10.0f} msg/s after'.format(
+                handler_count, *results))
+    finally:
+        loop.close()
+
+
+class Dispatcher:
+    """Dispatches like the read loop, leaving the handler tasks to finish()."""
+
+    def __init__(self, client):
+        self.client = client
+        self.pending = []
+
+    def dispatch(self, message):
+        handler_task = self.client.dispatch_message(message)
+        if handler_task is not None:
+            self.pending.append(handler_task)
+
+    def finish(self):
+        if self.pending:
+            self.client.loop.run_until_complete(asyncio.wait(self.pending, loop=self.client.loop))
+            self.pending = []
+
+
+def run(runner, count=20000):
+    loop = asyncio.new_event_loop()
+    try:
+        for command, raw in (('PING', b'PING :irc.example.com\r\n'),
+                             ('PRIVMSG', b':nick!user@host PRIVMSG #channel :hello there\r\n')):
+            messages = [irc.protocol.split_message(raw) for _ in range(count)]
+            for handler_count in (0, 1, 10):
+                if command == 'PING' and handler_count:
+                    continue
+                dispatcher = Dispatcher(make_client(loop, handler_count))
+                runner.measure('dispatch {} handlers={}'.format(command, handler_count),
+                               dispatcher.dispatch, messages, finish=dispatcher.finish)
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Measure command to reply latency over a socket to the fake server.
+
+A client sends a bot a command through irc.server.FakeServer on
+localhost and waits for the reply before sending the next, so each
+timing covers both clients' send and read paths and the server's
+fan-out.  Part of the suite run by ``python -m benchmarks``; run alone
+with ``python -m benchmarks.latency_bench``.
+"""
+import asyncio
+import time
+import irc.bot
+import irc.client
+import irc.command
+import irc.server
+from benchmarks.runner import Runner
+
+
+@asyncio.coroutine
+def echo(bot, command):
+    yield from command.reply(bot, command.params.text)
+
+
+@asyncio.coroutine
+def registered(client):
+    while not client.registered:
+        yield from asyncio.sleep(0.001, loop=client.loop)
+
+
+@asyncio.coroutine
+def measure(loop, port, count):
+    bot = irc.bot.IrcBot('127.0.0.1', 'bot', port=port, loop=loop, config={'STARTING_CHANNELS': []})
+    bot.add_command_handler('echo', echo, ['text'], last_collects=irc.command.LastParamType.string)
+    user = irc.client.IrcClient('127.0.0.1', 'user', port=port, loop=loop)
+    replies = asyncio.Queue(loop=loop)
+
+    @user.handles('PRIVMSG')
+    @asyncio.coroutine
+    def reply(client, message):
+        replies.put_nowait(time.perf_counter())
+
+    for client in (bot, user):
+        yield from client.start()
+        yield from registered(client)
+
+    timings = []
+    for n in range(count):
+        start = time.perf_counter()
+        user.send_privmsg('bot', ';echo {}'.format(n))
+        timings.append((yield from replies.get()) - start)
+    for client in (bot, user):
+        yield from client.quit()
+    return timings
+
+
+def run(runner, count=2000):
+    if runner.quick:
+        count = 200
+    loop = asyncio.new_event_loop()
+    server = irc.server.FakeServer(loop=loop)
+    try:
+        loop.run_until_complete(server.start())
+        timings = loop.run_until_complete(measure(loop, server.port, count))
+        runner.record('e2e command reply', timings)
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+
+if __name__ == '__main__':
+    run(Runner())
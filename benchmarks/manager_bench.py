@@ -0,0 +1,72 @@
+"""Measure memory and connect time for many connections under one ClientManager.
+
+A minimal server on localhost answers USER with RPL_WELCOME.  One
+operation is one connection registered; its time is the gap since the
+previous registration.  Memory is traced with tracemalloc, so only Python
+allocations are counted: peak is the most held at once while connecting,
+kept is what is still held once every connection is registered, both per
+connection.  Part of the suite run by ``python -m benchmarks``; run alone
+with ``python -m benchmarks.manager_bench [connections]``.
+"""
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+import irc.client
+import irc.codes
+import irc.manager
+from benchmarks.runner import Runner
+
+
+class WelcomeServer(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if b'USER ' in data:
+            self.transport.write(b':irc.example.com 001 bot :Welcome\r\n')
+
+
+def run(runner, count=1000):
+    if runner.quick:
+        count = 100
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(loop.create_server(WelcomeServer, '127.0.0.1', 0, backlog=1024))
+    port = server.sockets[0].getsockname()[1]
+    manager = irc.manager.ClientManager(loop=loop, client_class=irc.client.IrcClient, stagger=0, port=port)
+    welcomed = []
+
+    @asyncio.coroutine
+    def welcome(client, message):
+        welcomed.append(time.perf_counter())
+
+    manager.add_handler(irc.codes.RPL_WELCOME, welcome)
+    try:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(count):
+            manager.add('net{}'.format(i), '127.0.0.1', 'bot{}'.format(i))
+
+        start = time.perf_counter()
+        failed = loop.run_until_complete(manager.start())
+        assert not failed, failed
+        while len(welcomed) < count:
+            loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times = [start] + sorted(welcomed)
+        runner.record('manager connect', [b - a for a, b in zip(times, times[1:])],
+                      (peak - before) / count, (current - before) / count)
+        loop.run_until_complete(manager.quit())
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+if __name__ == '__main__':
+    run(Runner(), *[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,61 @@
+"""Measure the read path of IrcClient with metrics off and on.
+
+Lines are fed to a StreamProtocol in 4KB chunks, one per loop iteration,
+and read by IrcClient._read_loop with one PRIVMSG handler, so parsing,
+dispatch, handler tasks and the metrics hooks are all included.  One
+operation is one line.  Part of the suite run by ``python -m benchmarks``;
+run alone with ``python -m benchmarks.metrics_bench``.
+"""
+import asyncio
+import irc.client
+import irc.metrics
+import irc.parser
+from benchmarks.runner import Runner
+
+
+@asyncio.coroutine
+def noop(client, message):
+    pass
+
+
+def feed(loop, stream, data, chunk_size=4096):
+    # one chunk per loop iteration, as a socket would deliver them
+    def feed_chunk(offset):
+        if offset < len(data):
+            stream.feed_data(data[offset:offset + chunk_size])
+            loop.call_soon(feed_chunk, offset + chunk_size)
+        else:
+            stream.feed_eof()
+    loop.call_soon(feed_chunk, 0)
+
+
+class Reader:
+    def __init__(self, loop, metrics):
+        self.loop = loop
+        self.metrics = metrics
+
+    def read(self, data):
+        loop = self.loop
+        client = irc.client.IrcClient('irc.example.com', 'TulipBot', metrics=self.metrics(), loop=loop)
+        client.add_handler('PRIVMSG', noop)
+        stream = irc.parser.StreamProtocol(loop=loop)
+        client._protocol = stream
+        feed(loop, stream, data)
+        loop.run_until_complete(client._read_loop(stream))
+        loop.run_until_complete(client.tasks.join())
+
+
+def run(runner, count=50000, bursts=10):
+    lines = [b':nick!user@host PRIVMSG #channel :hello there\r\n',
+             b':irc.example.com 372 TulipBot :- message of the day\r\n']
+    burst = b''.join(lines[i % 2] for i in range(count // bursts))
+    loop = asyncio.new_event_loop()
+    try:
+        for name, metrics in (('off', lambda: None), ('on', irc.metrics.ClientMetrics)):
+            runner.measure('read metrics={}'.format(name), Reader(loop, metrics).read, [burst] * bursts, units=count)
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    run(Runner())
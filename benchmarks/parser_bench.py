@@ -0,0 +1,107 @@
+"""Compare the slicing line parser with the offset based one.
+
+Both copy each line; the offset based parser skips the intermediate
+slices, at the price of a memoryview per line.  Lines are fed in 4 KB
+chunks, as a socket delivers them; one operation is one line.  Part of
+the suite run by ``python -m benchmarks``; run alone with
+``python -m benchmarks.parser_bench``.
+"""
+import irc.parser
+import irc.protocol
+from irc.protocol import DELIM, EOL
+from benchmarks.runner import Runner
+
+LINES = [
+    b':nick!user@host.example.com PRIVMSG #channel :hello there, how is everyone doing today?\r\n',
+    b':irc.example.com 353 TulipBot = #channel :nick1 nick2 @nick3 +nick4 nick5 nick6 nick7\r\n',
+    b'PING :irc.example.com\r\n',
+    b':nick!user@host.example.com JOIN #channel\r\n',
+    b':irc.example.com 005 TulipBot CHANTYPES=# PREFIX=(ov)@+ NETWORK=Example :are supported by this server\r\n',
+    b':nick!user@host.example.com NOTICE TulipBot :some notice text\r\n',
+]
+
+
+def legacy_split(raw):
+    buf = raw
+    prefix = None
+    trailing = None
+
+    if buf.endswith(EOL):
+        buf = buf[:-2]
+    else:
+        raise irc.protocol.ProtocolViolationError(raw)
+
+    if buf.startswith(b':'):
+        try:
+            prefix, buf = buf[1:].split(DELIM, 1)
+        except ValueError:
+            pass
+
+    try:
+        command, buf = buf.split(DELIM, 1)
+    except ValueError:
+        raise irc.protocol.ProtocolViolationError(raw)
+
+    if buf.startswith(b':'):
+        params = [buf[1:]]
+    else:
+        try:
+            buf, trailing = buf.split(DELIM + b':', 1)
+        except ValueError:
+            pass
+        params = buf.split(DELIM)
+        if trailing is not None:
+            params.append(trailing)
+
+    return prefix, command, params
+
+
+def legacy_split_message(raw):
+    prefix, command, params = legacy_split(raw)
+    prefix = str(prefix, 'utf-8') if prefix else None
+    command = str(command, 'utf-8')
+    params = [str(p, 'utf-8') for p in params]
+    return irc.protocol.RawMessage(command, params, prefix=prefix)
+
+
+class LegacyMessageParser:
+    def __call__(self, out, buf):
+        while True:
+            raw_data = yield from buf.readuntil(EOL)
+            out.feed_data(legacy_split_message(raw_data))
+
+
+class Feeder:
+    def __init__(self, parser):
+        self.parser = parser
+        self.stream = None
+        self.out = None
+
+    def setup(self):
+        self.stream = irc.parser.StreamParser()
+        self.out = self.stream.set_parser(self.parser)
+
+    def feed(self, chunk):
+        self.stream.feed_data(chunk)
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def run(runner, count=100000, chunk_size=4096):
+    data = b''.join(LINES[i % len(LINES)] for i in range(count))
+    pieces = chunks(data, chunk_size)
+    for name, parser in (('slicing', LegacyMessageParser()),
+                         ('offsets', irc.protocol.MessageParser())):
+        feeder = Feeder(parser)
+        # every line has to come out, or only the drop path was timed
+        feeder.setup()
+        for piece in pieces:
+            feeder.feed(piece)
+        assert len(feeder.out._buffer) == count, len(feeder.out._buffer)
+        runner.measure('parse {}'.format(name), feeder.feed, pieces, units=count, setup=feeder.setup)
+
+
+if __name__ == '__main__':
+    run(Runner())
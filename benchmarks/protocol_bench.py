@@ -0,0 +1,35 @@
+"""Measure split, unsplit and split_message on a realistic mix of lines.
+
+Part of the suite run by ``python -m benchmarks``; run alone with
+``python -m benchmarks.protocol_bench``.
+"""
+import irc.protocol
+from benchmarks.parser_bench import LINES
+from benchmarks.runner import Runner
+
+# channel chatter dominates what a bot reads
+MIX = [LINES[0]] * 6 + LINES[1:]
+
+
+def lines(count):
+    return [MIX[i % len(MIX)] for i in range(count)]
+
+
+def decoded(raw):
+    message = irc.protocol.split_message(raw)
+    message.prefix
+    message.params
+    return message
+
+
+def run(runner, count=20000):
+    raw = lines(count)
+    split = [irc.protocol.split(line) for line in raw]
+    runner.measure('protocol split', irc.protocol.split, raw)
+    runner.measure('protocol unsplit', lambda parts: irc.protocol.unsplit(*parts), split)
+    runner.measure('protocol split_message', irc.protocol.split_message, raw)
+    runner.measure('protocol split_message decoded', decoded, raw)
+
+
+if __name__ == '__main__':
+    run(Runner())
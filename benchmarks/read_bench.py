@@ -0,0 +1,102 @@
+"""Replay line bursts through StreamProtocol and a read loop.
+
+Compares one read() per message with read_batch().  Each burst is fed in
+4 KB chunks, one per loop iteration; one operation is one line.  Part of
+the suite run by ``python -m benchmarks``; run alone with
+``python -m benchmarks.read_bench``.
+"""
+import asyncio
+import irc.parser
+import irc.protocol
+from irc.protocol import EOL
+from benchmarks.parser_bench import LINES, chunks
+from benchmarks.runner import Runner
+
+
+def readspan(buf, stop):
+    """The offsets of the next line in buf, as ParserBuffer.readspan() did."""
+    while True:
+        pos = buf.find(stop, buf.offset)
+        if pos >= 0:
+            start, buf.offset = buf.offset, pos + len(stop)
+            buf.size -= buf.offset - start
+            return start, buf.offset
+        buf.feed_data((yield))
+
+
+class LineMessageParser:
+    """The previous parser: one readspan() and one feed_data() per line."""
+
+    def __call__(self, out, buf):
+        while True:
+            start, end = yield from readspan(buf, EOL)
+            out.feed_data(irc.protocol.split_message_at(buf, start, end))
+
+
+@asyncio.coroutine
+def read_each(stream):
+    count = 0
+    while True:
+        try:
+            message = yield from stream.read()
+        except irc.parser.EofStream:
+            return count
+        message.command
+        count += 1
+
+
+@asyncio.coroutine
+def read_batches(stream, max_n=64):
+    count = 0
+    while True:
+        try:
+            messages = yield from stream.read_batch(max_n)
+        except irc.parser.EofStream:
+            return count
+        for message in messages:
+            message.command
+            count += 1
+
+
+class Replayer:
+    def __init__(self, loop, parser, reader, lines, chunk_size):
+        self.loop = loop
+        self.parser = parser
+        self.reader = reader
+        self.lines = lines
+        self.chunk_size = chunk_size
+
+    def replay(self, data):
+        loop = self.loop
+        protocol = irc.parser.StreamProtocol(loop=loop)
+        stream = protocol.set_parser(self.parser)
+        pending = chunks(data, self.chunk_size)
+        pending.reverse()
+
+        def feed():
+            if pending:
+                protocol.data_received(pending.pop())
+                loop.call_soon(feed)
+            else:
+                protocol.eof_received()
+
+        loop.call_soon(feed)
+        count = loop.run_until_complete(self.reader(stream))
+        assert count == self.lines, count
+
+
+def run(runner, count=100000, bursts=10, chunk_size=4096):
+    lines = count // bursts
+    burst = b''.join(LINES[i % len(LINES)] for i in range(lines))
+    loop = asyncio.new_event_loop()
+    try:
+        for name, parser, reader in (('per-line', LineMessageParser(), read_each),
+                                     ('batched', irc.protocol.MessageParser(), read_batches)):
+            replayer = Replayer(loop, parser, reader, lines, chunk_size)
+            runner.measure('read {}'.format(name), replayer.replay, [burst] * bursts, units=count)
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    run(Runner())
@@ -0,0 +1,158 @@
+"""Shared measurement and reporting for the benchmark suite.
+
+Every result has the same fields: operations per second, the median and
+99th percentile time of one operation, and the bytes one operation
+allocates (peak, traced with tracemalloc) and keeps alive.  Results are
+written as JSON so two runs can be compared.
+"""
+import collections
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+Result = collections.namedtuple('Result', ['name', 'ops_per_sec', 'p50', 'p99', 'peak_bytes', 'retained_bytes'])
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Runner:
+    """Runs benchmarks and collects their Results.
+
+    measure() is for operations applied to a list of items; record() takes
+    timings taken by the benchmark itself, for operations that span the
+    event loop.  With quick, one round over a tenth of the items is run,
+    for smoke tests.
+    """
+
+    def __init__(self, rounds=5, quick=False, sample=2000, out=sys.stdout):
+        self.rounds = 1 if quick else rounds
+        self.quick = quick
+        self.sample = sample
+        self.out = out
+        self.results = []
+
+    def measure(self, name, op, items, units=None, setup=None, finish=None):
+        """Time op(item) over items.
+
+        units is the number of operations a pass over items performs, by
+        default one per item.  setup() is called before every pass and not
+        timed; finish() is called at the end of every timed pass, for work
+        op leaves behind such as tasks to run.
+        """
+        units = units or len(items)
+        if self.quick:
+            units = max(1, units // 10)
+            items = items[:max(1, len(items) // 10)]
+        best = None
+        for _ in range(self.rounds + 1):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            for item in items:
+                op(item)
+            if finish is not None:
+                finish()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        # separate passes, so timing each call does not slow the one above
+        if setup is not None:
+            setup()
+        clock = time.perf_counter
+        timings = []
+        for item in items:
+            start = clock()
+            op(item)
+            timings.append(clock() - start)
+        if finish is not None:
+            finish()
+        # an item may be more than one operation, a chunk of lines say
+        per_unit = len(items) / units
+        timings.sort()
+        peak, retained = self._allocations(op, items[:self.sample], setup, finish)
+        return self._add(Result(name, units / best, percentile(timings, 0.5) * per_unit,
+                                percentile(timings, 0.99) * per_unit, peak * per_unit, retained * per_unit))
+
+    def _allocations(self, op, items, setup, finish):
+        """Average peak and retained bytes per item."""
+        if setup is not None:
+            setup()
+        peaks = []
+        tracemalloc.start()
+        retained = 0
+        try:
+            for item in items:
+                # clearing resets the peak, and current counts only what op kept
+                tracemalloc.clear_traces()
+                op(item)
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak)
+                retained += current
+        finally:
+            tracemalloc.stop()
+        if finish is not None:
+            finish()
+        return sum(peaks) / len(items), retained / len(items)
+
+    def record(self, name, timings, peak_bytes=None, retained_bytes=None):
+        """Add a Result for operations timed one by one, in seconds."""
+        timings = sorted(timings)
+        mean = sum(timings) / len(timings)
+        return self._add(Result(name, 1 / mean, percentile(timings, 0.5), percentile(timings, 0.99),
+                                peak_bytes, retained_bytes))
+
+    def _add(self, result):
+        self.results.append(result)
+        if self.out is not None:
+            self.out.write(format_result(result) + '\n')
+            self.out.flush()
+        return result
+
+    def report(self):
+        return {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.time(),
+            'results': {r.name: r._asdict() for r in self.results},
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+def _bytes(value):
+    return '{:>9.0f}'.format(value) if value is not None else '{:>9}'.format('-')
+
+
+def format_result(result):
+    return '{:<40} {:>12.0f} ops/s  p50 {:>9.2f}us  p99 {:>9.2f}us  peak {} B  kept {} B'.format(
+        result.name, result.ops_per_sec, result.p50 * 1e6, result.p99 * 1e6,
+        _bytes(result.peak_bytes), _bytes(result.retained_bytes))
+
+
+def compare(baseline, report, threshold=0.1):
+    """Lines comparing report with baseline, and whether any benchmark
+    lost more than threshold of its throughput."""
+    lines = []
+    regressed = False
+    old_results = baseline['results']
+    for name, new in sorted(report['results'].items()):
+        old = old_results.get(name)
+        if old is None:
+            lines.append('{:<40} new'.format(name))
+            continue
+        change = new['ops_per_sec'] / old['ops_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        lines.append('{:<40} {:>+7.1%} ops/s  p99 {:>9.2f}us -> {:>9.2f}us{}'.format(
+            name, change, old['p99'] * 1e6, new['p99'] * 1e6, flag))
+    return lines, regressed
@@ -0,0 +1,98 @@
+"""Measure how message throughput scales with ShardSupervisor workers.
+
+A server on localhost floods every connection with PRIVMSG lines once it
+registers, ending with a "done" line the bot answers.  Every worker runs
+one handler per message.  The same connections are run with 1, 2, 4, ...
+workers up to the number of cores, and the messages per second are printed
+with the speedup over one worker.  Run with
+``python -m benchmarks.shard_bench [connections] [lines]``.
+"""
+import asyncio
+import os
+import sys
+import time
+import irc.client
+import irc.shard
+
+LINE = b':user!u@example.com PRIVMSG #chan :the quick brown fox jumps over the lazy dog\r\n'
+DONE = b':user!u@example.com PRIVMSG #chan :done\r\n'
+
+
+class FloodServer(asyncio.Protocol):
+    def __init__(self, bench):
+        self.bench = bench
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if b'USER ' in data:
+            self.bench.registered()
+            self.transport.write(b':irc.example.com 001 bot :Welcome\r\n' + self.bench.flood)
+        if b'DONE' in data:
+            self.bench.finished()
+
+
+class Bench:
+    def __init__(self, loop, connections, lines):
+        self.loop = loop
+        self.connections = connections
+        self.flood = LINE * lines + DONE
+        self.start = None
+        self.done = 0
+        self.all_done = asyncio.Future(loop=loop)
+
+    def registered(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+
+    def finished(self):
+        self.done += 1
+        if self.done == self.connections:
+            self.all_done.set_result(time.perf_counter() - self.start)
+
+
+@asyncio.coroutine
+def on_privmsg(client, message):
+    if message.params[-1] == 'done':
+        client.send_raw(b'DONE\r\n')
+
+
+def setup(manager):
+    manager.add_handler('PRIVMSG', on_privmsg)
+
+
+def measure(workers, connections, lines):
+    loop = asyncio.new_event_loop()
+    bench = Bench(loop, connections, lines)
+    server = loop.run_until_complete(loop.create_server(lambda: FloodServer(bench), '127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    supervisor = irc.shard.ShardSupervisor(workers, setup=setup, loop=loop, client_class=irc.client.IrcClient,
+                                           stagger=0, port=port)
+    try:
+        for i in range(connections):
+            supervisor.add('net{}'.format(i), '127.0.0.1', 'bot{}'.format(i))
+        supervisor.start()
+        elapsed = loop.run_until_complete(asyncio.wait_for(bench.all_done, 300, loop=loop))
+        return connections * (lines + 1) / elapsed
+    finally:
+        loop.run_until_complete(supervisor.stop())
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+def main(connections=32, lines=5000):
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    base = None
+    for workers in counts:
+        rate = measure(workers, connections, lines)
+        base = base or rate
+        print('{:>3} workers: {:>10.0f} msg/s  {:.2f}x'.format(workers, rate, rate / base))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
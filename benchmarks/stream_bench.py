@@ -0,0 +1,41 @@
+"""Measure StreamParser feed throughput as a function of chunk size.
+
+Lines are fed with feed_data() in chunks of each size and parsed by
+MessageParser; one operation is one line.  Part of the suite run by
+``python -m benchmarks``; run alone with ``python -m benchmarks.stream_bench``.
+"""
+import irc.parser
+import irc.protocol
+from benchmarks.protocol_bench import lines
+from benchmarks.runner import Runner
+
+CHUNK_SIZES = (16, 128, 1024, 4096, 65536)
+
+
+class Feeder:
+    def __init__(self):
+        self.stream = None
+        self.out = None
+
+    def setup(self):
+        self.stream = irc.parser.StreamParser()
+        self.out = self.stream.set_parser(irc.protocol.MessageParser())
+
+    def feed(self, chunk):
+        self.stream.feed_data(chunk)
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def run(runner, count=20000):
+    data = b''.join(lines(count))
+    for size in CHUNK_SIZES:
+        feeder = Feeder()
+        runner.measure('stream feed chunk={}'.format(size), feeder.feed, chunks(data, size),
+                       units=count, setup=feeder.setup)
+
+
+if __name__ == '__main__':
+    run(Runner())
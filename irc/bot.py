@@ -1,6 +1,7 @@
 import asyncio
 import irc.client
 import irc.command
+import irc.executor
 import irc.messages
 import irc.codes
 
@@ -34,7 +35,12 @@ class IrcBot(irc.client.IrcClient):
         else:
             return command.target
 
-    def add_command_handler(self, command, f, param_names=None, last_collects=irc.command.LastParamType.normal, default_values=None):
+    def add_command_handler(self, command, f, param_names=None, last_collects=irc.command.LastParamType.normal, default_values=None,
+                            mode=irc.executor.Mode.inline):
+        if mode != irc.executor.Mode.inline:
+            f = self.executor.wrap(mode, f, _reply_results)
+        if self.profiler is not None:
+            f = self.profiler.wrap(f, '{}{}'.format(self.command_prefix, command))
         if param_names:
             parse_fn = irc.command.make_params_parser(command, param_names, last_collects=last_collects, default_values=default_values)
         else:
@@ -43,20 +49,30 @@ class IrcBot(irc.client.IrcClient):
 
         self.command_handlers[command] = irc.command.CommandHandler(parse_fn, f, param_names)
 
-    def handles_command(self, command_name, param_names=None, last_collects=False, default_values=None):
+    def handles_command(self, command_name, param_names=None, last_collects=False, default_values=None,
+                        mode=irc.executor.Mode.inline):
 
         def decorator(f):
-            assert asyncio.tasks.iscoroutinefunction(f)
-            self.add_command_handler(command_name, f, param_names, last_collects=last_collects, default_values=default_values)
+            assert mode != irc.executor.Mode.inline or asyncio.tasks.iscoroutinefunction(f)
+            self.add_command_handler(command_name, f, param_names, last_collects=last_collects, default_values=default_values,
+                                     mode=mode)
             return f
 
         return decorator
 
 
+@asyncio.coroutine
+def _reply_results(bot, command, result):
+    for line in irc.executor.as_list(result):
+        yield from command.reply(bot, line)
+
+
 @asyncio.coroutine
 def handle_welcome(bot, _):
     for c in bot.config['STARTING_CHANNELS']:
-        bot.send_message(irc.messages.Join(c))
+        # after a reconnect the client rejoins these itself
+        if c not in bot.rejoin_channels:
+            bot.send_message(irc.messages.Join(c))
 
 
 @asyncio.coroutine
@@ -75,7 +91,14 @@ def handle_privmsg(bot, message):
             params = handler.params_parser(params_string)
             command = irc.command.Command(sender, cmd, target, params)
 
-            yield from handler.command_function(bot, command)
+            if bot.metrics is None:
+                yield from handler.command_function(bot, command)
+                return
+            started = bot.loop.time()
+            try:
+                yield from handler.command_function(bot, command)
+            finally:
+                bot.metrics.bot_command(cmd, bot.loop.time() - started)
 
 
 @asyncio.coroutine
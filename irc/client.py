@@ -1,10 +1,14 @@
 import logging
 import functools
 import asyncio
-import asyncio.queues
-import inspect
 import irc.protocol
+import irc.executor
+import irc.heartbeat
+import irc.msglog
 import irc.parser
+import irc.pool
+import irc.sendqueue
+import irc.throttle
 import irc.messages
 import irc.codes
 
@@ -13,29 +17,69 @@ MESSAGE_LOG = logging.getLogger('irc.message')
 MESSAGE_LOG_FORMAT = '{dir} Message: {message}'
 
 
-# TODO add connection timeout RE: Gamesurge
 @asyncio.coroutine
-def _connect(host, port, ssl, loop):
+def _connect(host, port, ssl, loop, protocol_class=irc.parser.StreamProtocol, protocol_kwargs=None):
     IRC_LOG.debug('Connecting...')
     transport, proto = yield from loop.create_connection(
-        functools.partial(irc.parser.StreamProtocol, loop=loop),
+        functools.partial(protocol_class, loop=loop, **(protocol_kwargs or {})),
         host, port, ssl=ssl)
     return transport, proto
 
 
+def _delivered(delivery):
+    # put_many() leaves all but the last line of a batch without a future
+    if delivery is not None and not delivery.done():
+        delivery.set_result(None)
+
+
+def _target_limit(value):
+    """A TARGMAX or MAXTARGETS limit; empty means no limit (None).
+
+    Raises ValueError for anything but a positive number.
+    """
+    if not value:
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(value)
+    return limit
+
+
+@asyncio.coroutine
+def _send_results(client, message, result):
+    for reply in irc.executor.as_list(result):
+        client.send_message(reply)
+
+
 class IrcClient:
     _transport = None
+    _protocol = None
     _message_parser = irc.protocol.MessageParser()
     registered = False
     nick = None
+    hostmask = None
 
     _read_handler = None
     _send_handler = None
+    _supervisor = None
+    _lost_at = None
+    _quitting = False
+    _dispatch = None
+    _builtins = None
 
     def __init__(self, host, nick, *args, ssl=False, port=6667, username=None,
                  realname=None, hostname=None, password=None, throttle=None,
-                 loop=None, message_log=MESSAGE_LOG,
-                 message_log_format=MESSAGE_LOG_FORMAT, **kwargs):
+                 throttle_burst=1, rate_limiter=None, loop=None, message_log=MESSAGE_LOG,
+                 message_log_format=MESSAGE_LOG_FORMAT, read_batch_size=64,
+                 protocol_class=irc.parser.StreamProtocol,
+                 max_line_length=None, max_buffer_size=None, max_flush_bytes=16384,
+                 send_high_water=None,
+                 send_overflow=irc.sendqueue.Overflow.raise_, max_handlers=None,
+                 max_handlers_per_command=None, reject_handlers=False,
+                 thread_workers=None, process_workers=None, message_log_sample=None,
+                 connect_timeout=None, reconnect=False, backoff=None, executor=None,
+                 heartbeat_interval=None, heartbeat_timeout=None, metrics=None, profiler=None,
+                 recorder=None, **kwargs):
         self.host = host
         self.port = port
         self.ssl = ssl
@@ -47,29 +91,105 @@ class IrcClient:
         self.hostname = hostname or host
 
         self._loop = loop or asyncio.get_event_loop()
-        self._send_queue = asyncio.queues.Queue(loop=self.loop)
-        self.tasks = asyncio.queues.JoinableQueue(loop=self.loop)
+        self._send_queue = irc.sendqueue.SendQueue(loop=self.loop, high_water=send_high_water,
+                                                   overflow=send_overflow)
+        self.tasks = irc.pool.HandlerTasks(loop=self.loop)
         self.throttle = throttle
+        if rate_limiter is None and throttle:
+            rate_limiter = irc.throttle.TokenBucket.from_interval(
+                throttle, throttle_burst, clock=self.loop.time)
+        self.rate_limiter = rate_limiter
+        self.handler_pool = None
+        if max_handlers is not None or max_handlers_per_command is not None:
+            self.handler_pool = irc.pool.HandlerPool(
+                loop=self.loop, max_in_flight=max_handlers,
+                max_per_command=max_handlers_per_command, reject=reject_handlers)
+        # a shared executor belongs to whoever passed it in
+        self._owns_executor = executor is None
+        self.executor = executor or irc.executor.HandlerExecutor(
+            loop=self.loop, thread_workers=thread_workers, process_workers=process_workers)
+        self.max_flush_bytes = max_flush_bytes
+        self.read_batch_size = read_batch_size
+        self.recorder = recorder
+        if recorder is not None:
+            protocol_class = recorder.wrap_protocol(protocol_class)
+        self.protocol_class = protocol_class
+        # the cap on buffered input; BufferedStreamProtocol's buffer is its cap
+        self.protocol_kwargs = {}
+        if max_buffer_size is not None:
+            if issubclass(protocol_class, irc.parser.BufferedStreamProtocol):
+                self.protocol_kwargs['buffer_size'] = max_buffer_size
+            else:
+                self.protocol_kwargs['max_buffer_size'] = max_buffer_size
+        if max_line_length is not None:
+            self._message_parser = irc.protocol.MessageParser(max_line_length)
 
         self.message_log = message_log
         self.message_log_format = message_log_format
+        self.message_log_sampler = irc.msglog.Sampler(message_log_sample) if message_log_sample else None
         self.msg_handlers = {}
 
+        self.connect_timeout = connect_timeout
+        self.reconnect = reconnect
+        self.backoff = backoff or irc.throttle.Backoff()
+        self.heartbeat = None
+        if heartbeat_interval is not None:
+            self.heartbeat = irc.heartbeat.Heartbeat(
+                self, heartbeat_interval, heartbeat_timeout or 2 * heartbeat_interval)
+        self.metrics = metrics
+        self.profiler = profiler
+        self.channels = set()
+        self.rejoin_channels = set()
+        self.isupport = {}
+        self.disconnects = 0
+        self.connect_failures = 0
+        self.last_recover_time = None
+        self.max_recover_time = 0.0
+        if metrics is not None:
+            metrics.bind(self)
+
     @property
     def loop(self):
         return self._loop
 
     @asyncio.coroutine
     def start(self):
+        yield from self._open()
+        if self.reconnect:
+            self._supervisor = asyncio.async(self._supervise(), loop=self.loop)
+
+    @asyncio.coroutine
+    def _open(self, restore=False):
         conn_task = self._connect()
-        self._transport, protocol = yield from conn_task
+        transport, protocol = yield from conn_task
         IRC_LOG.debug('Connected')
-        self._register()
+        self.attach(transport, protocol, restore)
+
+    def attach(self, transport, protocol, restore=False):
+        """Run the session over an already connected transport and protocol.
+
+        start() calls this once connected; irc.record uses it to replay
+        traffic through a fake transport.
+        """
+        self._transport = transport
+        self._protocol = protocol
+        # a new connection may be to a server with other limits
+        self.isupport = {}
+        self.hostmask = None
+        if restore:
+            self._replay_registration()
+        else:
+            self._register()
         self._read_handler = asyncio.async(self._read_loop(protocol), loop=self.loop)
+        if self.heartbeat is not None:
+            # nothing would read the PONGs, and a dead connection has nothing to time out
+            self._read_handler.add_done_callback(lambda _: self.heartbeat.stop())
         self._send_handler = asyncio.async(self._send_loop(), loop=self.loop)
 
     def _connect(self):
-        conn = _connect(self.host, self.port, self.ssl, self.loop)
+        conn = _connect(self.host, self.port, self.ssl, self.loop, self.protocol_class, self.protocol_kwargs)
+        if self.connect_timeout is not None:
+            conn = asyncio.wait_for(conn, self.connect_timeout, loop=self.loop)
         conn_task = asyncio.async(conn, loop=self.loop)
         return conn_task
 
@@ -80,24 +200,144 @@ class IrcClient:
         self.send_nick(self.attempted_nick)
         self.send_message(irc.messages.User(self.attempted_nick, self.attempted_nick, 'tulip-irc', self.attempted_nick))
 
+    def _replay_registration(self):
+        IRC_LOG.debug('Registering again')
+        nick = self.attempted_nick = self.attempted_nick or self.nick
+        messages = [irc.messages.Nick(nick), irc.messages.User(nick, nick, 'tulip-irc', nick)]
+        if self.password:
+            messages.insert(0, irc.messages.Pass(self.password))
+        # control lines skip the throttle's wait, and go out in one write without one
+        self._send_batch(messages, irc.sendqueue.Priority.control)
+
+    def _send_batch(self, messages, priority):
+        """Queue messages as separate lines, together and in order."""
+        lines = []
+        for message in messages:
+            self.log_message(message, sending=True)
+            raw = message.encode()
+            if self.metrics is not None:
+                self.metrics.sent(message.command, len(raw))
+            lines.append(raw)
+        return self._send_lines(lines, None, priority)
+
+    @asyncio.coroutine
+    def _supervise(self):
+        """Reconnect whenever the read loop stops, until quit() is called."""
+        while True:
+            yield from self.wait_closed()
+            if self._quitting:
+                return
+            if not self._read_handler.cancelled() and self._read_handler.exception():
+                IRC_LOG.error('Read loop failed', exc_info=self._read_handler.exception())
+            self.disconnects += 1
+            if self.metrics is not None:
+                self.metrics.disconnected()
+            self._lost_at = self.loop.time()
+            self._close()
+            IRC_LOG.warn('Connection to {} lost, reconnecting'.format(self.host))
+            yield from self._reconnect()
+
+    @asyncio.coroutine
+    def wait_closed(self):
+        """Wait until the read loop of the current connection has stopped."""
+        yield from asyncio.wait([self._read_handler], loop=self.loop)
+
+    def _close(self):
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        if self.recorder is not None:
+            self.recorder.flush()
+        self._send_handler.cancel()
+        self._send_queue.clear(ConnectionResetError('Connection to {} lost'.format(self.host)))
+        # lines sent while reconnecting wait for RPL_WELCOME
+        self._send_queue.hold()
+        self._transport.close()
+        self.registered = False
+        self.rejoin_channels = set(self.channels)
+        self.channels.clear()
+
+    @asyncio.coroutine
+    def _reconnect(self):
+        while True:
+            # the backoff is reset by RPL_WELCOME, so a server that accepts
+            # and drops us straight away still gets waited on
+            if self.backoff.attempts:
+                yield from asyncio.sleep(self.backoff.next(), loop=self.loop)
+            else:
+                self.backoff.next()
+            try:
+                yield from self._open(restore=True)
+                return
+            except (OSError, asyncio.TimeoutError) as e:
+                self.connect_failures += 1
+                IRC_LOG.warn('Reconnecting to {} failed: {!r}'.format(self.host, e))
+
+    def reconnect_stats(self):
+        return {
+            'disconnects': self.disconnects,
+            'connect_failures': self.connect_failures,
+            'last_recover_time': self.last_recover_time,
+            'max_recover_time': self.max_recover_time,
+        }
+
     @asyncio.coroutine
     def _read_loop(self, protocol):
         messagestream = protocol.set_parser(self._message_parser)
+        metrics = self.metrics
+        timed = metrics is not None and metrics.handler_latency is not None
         # read commands
         while True:
             try:
-                message = yield from messagestream.read()
-                self.log_message(message)
-                handler = self.handle_message(message)
-                if (inspect.isgenerator(handler) or
-                        isinstance(handler, asyncio.Future)):
-                    handler_task = yield from handler
-                    self.tasks.put_nowait(handler_task)
-                    handler_task.add_done_callback(self.cleanup_handler_task)
+                messages = yield from messagestream.read_batch(self.read_batch_size)
             except irc.parser.EofStream:
                 break
-            except irc.protocol.ProtocolViolationError as e:
-                IRC_LOG.warn('Recieved malformed message "{raw}"'.format(raw=e.raw))
+            if metrics is not None:
+                metrics.received(messages)
+            for message in messages:
+                if isinstance(message, irc.protocol.ProtocolViolationError):
+                    IRC_LOG.warn('Recieved malformed message "{raw}"'.format(raw=message.raw))
+                    if metrics is not None:
+                        metrics.parse_error()
+                    continue
+                self.log_message(message)
+                pool = self.handler_pool
+                command = message.command
+                if pool is not None and command in self.msg_handlers:
+                    if not pool.try_acquire(command):
+                        if pool.reject:
+                            pool.count_rejected(command)
+                            self._handle_builtin(message)
+                            continue
+                        # stop reading until a handler finishes
+                        self._transport.pause_reading()
+                        try:
+                            yield from pool.acquire(command)
+                        finally:
+                            self._transport.resume_reading()
+                    try:
+                        handler_task = self.dispatch_message(message)
+                    except Exception:
+                        pool.release(command)
+                        raise
+                    if handler_task is None:
+                        pool.release(command)
+                    else:
+                        pool.track(command, handler_task)
+                else:
+                    handler_task = self.dispatch_message(message)
+                if handler_task is not None:
+                    self.tasks.add(handler_task)
+                    if timed:
+                        # one callback does both; each callback costs a loop iteration
+                        handler_task.add_done_callback(
+                            metrics.track_handler(command, self.loop, self.cleanup_handler_task))
+                    else:
+                        handler_task.add_done_callback(self.cleanup_handler_task)
+
+    def handler_stats(self):
+        if self.handler_pool is None:
+            return {}
+        return self.handler_pool.stats()
 
     def cleanup_handler_task(self, handler_task):
         if handler_task.exception():
@@ -105,80 +345,467 @@ class IrcClient:
                 raise handler_task.exception()
             except Exception as e:
                 IRC_LOG.exception(e)
-        self.tasks.task_done()
+        self.tasks.discard(handler_task)
+
+    @property
+    def send_queue_depth(self):
+        return len(self._send_queue)
+
+    @property
+    def estimated_send_delay(self):
+        """Seconds until everything queued now will have been sent."""
+        if self.rate_limiter is None or not self._send_queue:
+            return 0.0
+        return self.rate_limiter.delay(len(self._send_queue))
+
+    def send_stats(self):
+        queue = self._send_queue
+        protocol = self._protocol
+        return {
+            'queued_lines': len(queue),
+            'queued_bytes': queue.queued_bytes,
+            'dropped_lines': queue.dropped_lines,
+            'pause_count': protocol.pause_count if protocol else 0,
+            'paused_time': protocol.paused_time if protocol else 0.0,
+        }
+
+    @asyncio.coroutine
+    def drain(self):
+        """Wait until the send queue is under its high water mark and the
+        transport is accepting writes."""
+        yield from self._send_queue.wait_writable()
+        if self._protocol is not None:
+            yield from self._protocol.drain()
 
     @asyncio.coroutine
     def _send_loop(self):
-        next_send = self.loop.time() if self.throttle else None
+        queue = self._send_queue
+        # when the line at the head started waiting for the rate limiter
+        throttled_at = None
         while True:
-            raw = yield from self._send_queue.get()
-            if next_send and next_send > self.loop.time():
-                yield from asyncio.sleep(next_send - self.loop.time(), loop=self.loop)
-            self._transport.write(raw)
-            if self.throttle:
-                next_send = self.loop.time() + self.throttle
+            yield from queue.wait()
+            if self._protocol.is_writing_paused():
+                yield from self._protocol.drain()
+            limiter = self.rate_limiter
+            if limiter is None:
+                self._flush(queue.get_nowait())
+                if queue:
+                    # let the loop run between flushes of a long backlog
+                    yield from asyncio.sleep(0, loop=self.loop)
+                continue
+
+            if queue.next_priority() is not irc.sendqueue.Priority.control:
+                delay = limiter.delay()
+                if delay > 0:
+                    if throttled_at is None:
+                        throttled_at = self.loop.time()
+                    yield from queue.wait_control(delay)
+                    continue
+                if throttled_at is not None:
+                    # once per line, however often a control line woke us
+                    if self.metrics is not None:
+                        self.metrics.throttled(self.loop.time() - throttled_at)
+                    throttled_at = None
+            # control lines skip the wait but still count against the limit
+            limiter.consume()
+            raw, delivery = queue.get_nowait()
+            self._write(raw)
+            _delivered(delivery)
+
+    def _write(self, data):
+        self._transport.write(data)
+        if self.recorder is not None:
+            self.recorder.sent(data)
+
+    def _flush(self, entry):
+        """Write entry and whatever else is queued, up to max_flush_bytes, at once."""
+        raw, delivery = entry
+        queue = self._send_queue
+        if queue.empty():
+            self._write(raw)
+            _delivered(delivery)
+            return
+
+        batch = [raw]
+        deliveries = [delivery]
+        size = len(raw)
+        while not queue.empty() and size + queue.next_size() <= self.max_flush_bytes:
+            raw, delivery = queue.get_nowait()
+            batch.append(raw)
+            deliveries.append(delivery)
+            size += len(raw)
+        self._write(b''.join(batch))
+        for delivery in deliveries:
+            _delivered(delivery)
 
     def log_message(self, message, sending=False):
+        if not self.message_log.isEnabledFor(logging.INFO):
+            return
+        if self.message_log_sampler is not None and not self.message_log_sampler(message.command):
+            return
         direction = 'SEND' if sending else 'RECV'
-        self.message_log.info(self.message_log_format.format(
-            dir=direction, message=message))
+        self.message_log.info(irc.msglog.LazyMessage(self.message_log_format, direction, message))
 
-    def handles(self, irc_command):
+    def handles(self, irc_command, mode=irc.executor.Mode.inline):
         def decorator(f):
-            assert asyncio.tasks.iscoroutinefunction(f)
-            self.add_handler(irc_command, f)
+            self.add_handler(irc_command, f, mode=mode)
             return f
 
         return decorator
 
-    def add_handler(self, irc_command, f):
-        assert asyncio.tasks.iscoroutinefunction(f)
+    def add_handler(self, irc_command, f, mode=irc.executor.Mode.inline):
+        """Register f for irc_command.
+
+        Inline handlers are coroutines called with (client, message).  Thread
+        and process handlers are plain functions called with the message in
+        a pool; any messages they return are sent.
+        """
+        if mode == irc.executor.Mode.inline:
+            assert asyncio.tasks.iscoroutinefunction(f)
+        else:
+            f = self.executor.wrap(mode, f, _send_results)
+        if self.profiler is not None:
+            f = self.profiler.wrap(f)
         if irc_command not in self.msg_handlers:
             self.msg_handlers[irc_command] = []
         self.msg_handlers[irc_command].append(f)
+        self._dispatch = None
+
+    def _builtin_handlers(self):
+        return {
+            'PING': self._handle_ping,
+            'PONG': self._handle_pong,
+            'NICK': self._handle_nick,
+            'JOIN': self._handle_join,
+            'PART': self._handle_part,
+            'KICK': self._handle_kick,
+            irc.codes.RPL_WELCOME: self._handle_welcome,
+            irc.codes.RPL_ISUPPORT: self._handle_isupport,
+            irc.codes.ERR_NICKNAMEINUSE: self._handle_nick_error,
+            irc.codes.ERR_ERRONEUSNICKNAME: self._handle_nick_error,
+            irc.codes.ERR_PASSWDMISMATCH: self._handle_passwdmismatch,
+        }
+
+    def _compile_dispatch(self):
+        """Map every command to one callable doing all the work for it.
+
+        The callable returns a future for the registered handlers, or None
+        when only protocol handling was needed.
+        """
+        builtins = self._builtins = self._builtin_handlers()
+        self._dispatch = {
+            command: self._make_dispatcher(builtins.get(command), self.msg_handlers.get(command, ()))
+            for command in set(builtins) | set(self.msg_handlers)}
+        return self._dispatch
+
+    def _make_dispatcher(self, builtin, handlers):
+        loop = self.loop
+        handlers = tuple(handlers)
+
+        if not handlers:
+            return builtin
+        elif len(handlers) == 1:
+            handler = handlers[0]
+
+            def run_handlers(message):
+                return asyncio.async(handler(self, message), loop=loop)
+        else:
+            # schedule in registration order; gather() would go through a set
+            def run_handlers(message):
+                return asyncio.gather(*[asyncio.async(h(self, message), loop=loop) for h in handlers], loop=loop)
+
+        if builtin is None:
+            return run_handlers
+
+        def dispatch(message):
+            builtin(message)
+            return run_handlers(message)
+
+        return dispatch
+
+    def dispatch_message(self, message):
+        """Handle message, returning a future for its handlers or None."""
+        dispatch = (self._dispatch or self._compile_dispatch()).get(message.command)
+        if dispatch is not None:
+            return dispatch(message)
 
     @asyncio.coroutine
     def handle_message(self, message):
-        # handle irc protocol commands
-        if message.command == 'PING':
-            yield from self.send_message(irc.messages.Pong(message.params))
-        # TODO: check for race condition
-        elif message.command == irc.codes.RPL_WELCOME:
-            self.registered = True
-            self.nick = self.attempted_nick
-            self.attempted_nick = None
-        elif message.command in [irc.codes.ERR_NICKNAMEINUSE, irc.codes.ERR_ERRONEUSNICKNAME]:
-            yield from self.send_nick(self.attempted_nick + '_')
-        elif message.command == 'NICK' and message.nick == self.nick:
+        """Handle message; returns a future for its handlers.
+
+        Kept as a coroutine for existing callers, the read loop uses
+        dispatch_message() instead.
+        """
+        handler_task = self.dispatch_message(message)
+        if handler_task is None:
+            handler_task = asyncio.gather(loop=self.loop)
+        return handler_task
+        # a generator, so @coroutine hands back the future instead of waiting on it
+        yield
+
+    def _handle_builtin(self, message):
+        """Run only the protocol handling for message, skipping handlers."""
+        if self._dispatch is None:
+            self._compile_dispatch()
+        builtin = self._builtins.get(message.command)
+        if builtin is not None:
+            builtin(message)
+
+    def _handle_ping(self, message):
+        self.send_message(irc.messages.Pong(message.params))
+
+    def _handle_pong(self, message):
+        if self.heartbeat is not None:
+            self.heartbeat.pong(message)
+
+    @property
+    def lag(self):
+        """Seconds of round trip to the server, or None without a heartbeat."""
+        return self.heartbeat.lag if self.heartbeat is not None else None
+
+    # TODO: check for race condition
+    def _handle_welcome(self, message):
+        self.registered = True
+        self.nick = self.attempted_nick
+        self.attempted_nick = None
+        # most servers end the welcome with the prefix they relay us with
+        mask = message.params[-1].rsplit(' ', 1)[-1] if message.params else ''
+        if mask.startswith(self.nick + '!') and '@' in mask:
+            self.hostmask = mask
+        self.backoff.reset()
+        self._send_queue.release()
+        # some servers refuse PING before registration
+        if self.heartbeat is not None:
+            self.heartbeat.start()
+        if self._lost_at is not None:
+            self._rejoin()
+            self.last_recover_time = self.loop.time() - self._lost_at
+            self.max_recover_time = max(self.max_recover_time, self.last_recover_time)
+            self._lost_at = None
+
+    def _handle_isupport(self, message):
+        # the first param is our nick and the last says "are supported"
+        for token in message.params[1:-1]:
+            if token.startswith('-'):
+                self.isupport.pop(token[1:], None)
+            else:
+                key, _, value = token.partition('=')
+                self.isupport[key] = value
+
+    def max_targets(self, command):
+        """How many comma separated targets the server takes for command.
+
+        From TARGMAX, or MAXTARGETS, in RPL_ISUPPORT; None when there is no
+        limit and 1 when the server advertises neither.  Malformed limits
+        are ignored.
+        """
+        targmax = self.isupport.get('TARGMAX')
+        if targmax:
+            for entry in targmax.split(','):
+                name, _, limit = entry.partition(':')
+                if name.upper() == command:
+                    try:
+                        return _target_limit(limit)
+                    except ValueError:
+                        break
+        if 'MAXTARGETS' in self.isupport:
+            try:
+                return _target_limit(self.isupport['MAXTARGETS'])
+            except ValueError:
+                pass
+        return 1
+
+    def _rejoin(self):
+        channels = sorted(self.rejoin_channels)
+        if not channels:
+            return
+        messages = []
+        # as many channels per JOIN as fit in a line
+        size = irc.protocol.MAX_LINE_LENGTH - len('JOIN \r\n')
+        batch = []
+        for channel in channels:
+            if batch and len(','.join(batch + [channel]).encode('utf-8')) > size:
+                messages.append(irc.messages.Join(','.join(batch)))
+                batch = []
+            batch.append(channel)
+        messages.append(irc.messages.Join(','.join(batch)))
+        # ahead of lines queued while we were away, some are for these channels
+        self._send_batch(messages, irc.sendqueue.Priority.control)
+
+    def _handle_join(self, message):
+        if message.nick == self.nick:
+            self.channels.add(message.params[0])
+            prefix = message.prefix
+            # servers may send just a nick; prefix_length() needs the whole mask
+            if prefix and '!' in prefix and '@' in prefix:
+                self.hostmask = prefix
+
+    def _handle_part(self, message):
+        if message.nick == self.nick:
+            self.channels.discard(message.params[0])
+
+    def _handle_kick(self, message):
+        if message.params[1] == self.nick:
+            self.channels.discard(message.params[0])
+
+    def _handle_nick_error(self, message):
+        self.send_nick(self.attempted_nick + '_')
+
+    def _handle_nick(self, message):
+        if message.nick == self.nick:
             self.nick = message.params[0]
             self.attempted_nick = None
-        elif message.command == irc.codes.ERR_PASSWDMISMATCH:
-            raise irc.codes.PasswordMismatchError
+            if self.hostmask is not None:
+                self.hostmask = self.nick + self.hostmask[self.hostmask.index('!'):]
 
-        handlers = self.msg_handlers.get(message.command, [])
-        return asyncio.gather(*[h(self, message) for h in handlers], loop=self.loop)
+    def _handle_passwdmismatch(self, message):
+        raise irc.codes.PasswordMismatchError
 
     def quit(self):
+        """Send QUIT and stop, reconnecting included.
+
+        Returns a future resolved once the QUIT has been written, or
+        already resolved when there is no connection to send it on.
+        """
+        self._quitting = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        if self._read_handler is None or self._read_handler.done():
+            # lost or waiting to reconnect, nothing would ever write the QUIT
+            self._shutdown(ConnectionResetError('Quit while not connected'))
+            fut = asyncio.Future(loop=self.loop)
+            fut.set_result(None)
+            return fut
+
         fut = self.send_message(irc.messages.Quit())
+        fut.add_done_callback(lambda _: self._shutdown(ConnectionResetError('Quit before the line was sent')))
+        return fut
 
-        def cancel(fut):
+    def _shutdown(self, exc):
+        if self._read_handler is not None:
             self._read_handler.cancel()
+        if self._send_handler is not None:
             self._send_handler.cancel()
-
-        fut.add_done_callback(cancel)
-        return fut
+        self._send_queue.clear(exc)
+        if self._transport is not None:
+            # nothing reads from it any more; close() still writes out the QUIT
+            self._transport.close()
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        if self._owns_executor:
+            self.executor.shutdown()
+        if self.recorder is not None:
+            self.recorder.flush()
 
     def send_nick(self, nick):
         self.attempted_nick = nick
         return self.send_message(irc.messages.Nick(nick))
 
     def send_privmsg(self, target, message):
-        return self.send_message(irc.messages.PrivMsg(target, message))
+        """Send message to target, split over as many lines as it needs.
 
-    def send_message(self, message):
+        Returns a future resolved once every line has been written.
+        """
+        data = message.encode('utf-8')
+        room = self.text_room('PRIVMSG', target)
+        if len(data) <= room and b'\r' not in data and b'\n' not in data:
+            return self.send_message(irc.messages.PrivMsg(target, message))
+        return self._send_pieces('PRIVMSG', target, irc.protocol.split_text(data, room), message)
+
+    def prefix_length(self):
+        """Bytes of the prefix the server puts on lines it relays from us.
+
+        Exact once we have seen our hostmask, otherwise the longest it can be.
+        """
+        if self.hostmask is not None:
+            return len(self.hostmask.encode('utf-8'))
+        nick = self.nick or self.attempted_nick
+        # nick!~username@host, where ~ marks a username without ident
+        return (len(nick.encode('utf-8')) + len(self.username.encode('utf-8')) + 3 +
+                irc.protocol.MAX_HOST_LENGTH)
+
+    def text_room(self, command, target):
+        """Bytes of text that fit in a command to target, as others receive it."""
+        # :prefix COMMAND target :text\r\n
+        return (irc.protocol.MAX_LINE_LENGTH - self.prefix_length() - len(command) -
+                len(target.encode('utf-8')) - len(':  :\r\n') - 1)
+
+    def _send_pieces(self, command, target, pieces, message):
+        """Queue pieces of message, already encoded, as one batch of lines."""
+        if not pieces:
+            # nothing but line breaks
+            delivery = asyncio.Future(loop=self.loop)
+            delivery.set_result(None)
+            return delivery
+        self.log_message(irc.protocol.RawMessage(command, [target, message]), sending=True)
+        head = command.encode('utf-8') + b' ' + target.encode('utf-8') + b' :'
+        raws = [head + piece + irc.protocol.EOL for piece in pieces]
+        if self.metrics is not None:
+            for raw in raws:
+                self.metrics.sent(command, len(raw))
+        return self._send_lines(raws, target, irc.sendqueue.default_priority(command))
+
+    def send_privmsg_many(self, targets, message):
+        """Send message to every target in as few lines as the server allows.
+
+        Returns a future resolved once every line has been written.
+        """
+        return self._send_many(irc.messages.PrivMsg, 'PRIVMSG', targets, message)
+
+    def send_notice_many(self, targets, message):
+        return self._send_many(irc.messages.Notice, 'NOTICE', targets, message)
+
+    def _send_many(self, message_class, command, targets, message):
+        targets = list(targets)
+        if not targets:
+            return asyncio.gather(loop=self.loop)
+        data = message.encode('utf-8')
+        # each target gets its own copy, so the longest decides the split
+        text_room = min(self.text_room(command, target) for target in targets)
+        split = len(data) > text_room or b'\r' in data or b'\n' in data
+        pieces = irc.protocol.split_text(data, text_room) if split else [data]
+        limit = self.max_targets(command)
+        deliveries = []
+        for data in pieces:
+            piece = irc.protocol.decode(data) if split else message
+            # what is left of our line once the command and text are in it
+            room = irc.protocol.MAX_LINE_LENGTH - len(command) - len(' :\r\n') - 1 - len(data)
+            batch = []
+            size = -1
+            for target in targets:
+                length = len(target.encode('utf-8')) + 1
+                if batch and (len(batch) == limit or size + length > room):
+                    deliveries.append(self.send_message(message_class(','.join(batch), piece)))
+                    batch = []
+                    size = -1
+                batch.append(target)
+                size += length
+            deliveries.append(self.send_message(message_class(','.join(batch), piece)))
+        return asyncio.gather(*deliveries, loop=self.loop)
+
+    def send_message(self, message, priority=None):
         self.log_message(message, sending=True)
-        return self.send_raw(message.encode())
+        target = None
+        if message.command in ('PRIVMSG', 'NOTICE') and message.params:
+            target = message.params[0]
+        if priority is None:
+            priority = irc.sendqueue.default_priority(message.command)
+        raw = message.encode()
+        if self.metrics is not None:
+            self.metrics.sent(message.command, len(raw))
+        return self.send_raw(raw, target=target, priority=priority)
 
-    def send_raw(self, raw):
+    def send_raw(self, raw, target=None, priority=irc.sendqueue.Priority.normal):
+        """Queue raw for sending.
+
+        Returns a future resolved once raw has been written to the
+        transport.  Lines to the same target at the same priority keep
+        their order.  Over send_high_water, raises SendQueueFull unless
+        send_overflow says otherwise; await drain() first to wait for room.
+        """
         assert type(raw) == bytes
-        return asyncio.Task(self._send_queue.put(raw), loop=self.loop)
+        return self._send_queue.put_nowait(raw, target, priority)
+
+    def _send_lines(self, raws, target, priority):
+        """Like send_raw() for several lines that go out together, in order."""
+        return self._send_queue.put_many(raws, target, priority)
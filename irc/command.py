@@ -1,4 +1,5 @@
 import collections
+import functools
 import enum
 
 
@@ -20,8 +21,20 @@ def empty_parser(params_string):
 CommandHandler = collections.namedtuple('CommandHandler', ['params_parser', 'command_function', 'param_names'])
 
 
-def make_params_parser(name, param_names, last_collects=LastParamType.normal, default_values=None):
+@functools.lru_cache(maxsize=None)
+def _params_class(name, param_names):
     params_class = collections.namedtuple(name, param_names)
+    # the class is built at runtime, so pickle it by name and fields
+    params_class.__reduce__ = lambda self: (_make_params, (name, param_names, tuple(self)))
+    return params_class
+
+
+def _make_params(name, param_names, values):
+    return _params_class(name, param_names)(*values)
+
+
+def make_params_parser(name, param_names, last_collects=LastParamType.normal, default_values=None):
+    params_class = _params_class(name, tuple(param_names))
 
     def params_parser(params_string):
         if last_collects == LastParamType.list_ or last_collects == LastParamType.string:
@@ -61,5 +74,7 @@ class Command:
         self.params = params
 
     def reply(self, bot, message):
+        """Send message back where the command came from, split over as
+        many lines as it needs."""
         dest = bot.destination(self)
         return bot.send_privmsg(dest, message)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import asyncio
+import collections
+import concurrent.futures
+import enum
+import functools
+import time
+
+
+class Mode(enum.Enum):
+    inline = 1
+    thread = 2
+    process = 3
+
+
+ModeStats = collections.namedtuple('ModeStats', ['submitted', 'in_flight', 'failed', 'queue_time', 'latency', 'max_latency'])
+
+
+def _timed_call(f, arg):
+    # runs in the worker; wall clock so the start can be compared across processes
+    return time.time(), f(arg)
+
+
+def as_list(result):
+    if result is None:
+        return []
+    if isinstance(result, (list, tuple)):
+        return result
+    return [result]
+
+
+class _Metrics:
+    __slots__ = ('submitted', 'in_flight', 'failed', 'queue_time', 'latency', 'max_latency')
+
+    def __init__(self):
+        self.submitted = 0
+        self.in_flight = 0
+        self.failed = 0
+        self.queue_time = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def snapshot(self):
+        return ModeStats(*(getattr(self, name) for name in self.__slots__))
+
+
+class HandlerExecutor:
+    """Runs blocking handlers in a thread or process pool off the event loop.
+
+    Pools are created on first use.  Process handlers and their argument
+    must be picklable; see RawMessage.__reduce__ and Command.
+    """
+
+    def __init__(self, *, loop=None, thread_workers=None, process_workers=None):
+        self._loop = loop
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._pools = {}
+        self._metrics = {Mode.thread: _Metrics(), Mode.process: _Metrics()}
+
+    def _pool(self, mode):
+        pool = self._pools.get(mode)
+        if pool is None:
+            if mode == Mode.thread:
+                pool = concurrent.futures.ThreadPoolExecutor(self.thread_workers or 4)
+            elif mode == Mode.process:
+                pool = concurrent.futures.ProcessPoolExecutor(self.process_workers)
+            else:
+                raise ValueError('{} handlers run on the loop'.format(mode))
+            self._pools[mode] = pool
+        return pool
+
+    @asyncio.coroutine
+    def run(self, mode, f, arg):
+        """run() calls f(arg) in mode's pool and returns its result."""
+        pool = self._pool(mode)
+        metrics = self._metrics[mode]
+        metrics.submitted += 1
+        metrics.in_flight += 1
+        submitted = time.time()
+        try:
+            started, result = yield from self._loop.run_in_executor(pool, _timed_call, f, arg)
+        except Exception:
+            metrics.failed += 1
+            raise
+        finally:
+            metrics.in_flight -= 1
+            latency = time.time() - submitted
+            metrics.latency += latency
+            metrics.max_latency = max(metrics.max_latency, latency)
+        metrics.queue_time += max(started - submitted, 0.0)
+        return result
+
+    def wrap(self, mode, f, deliver):
+        """Turn f into a coroutine handler for mode.
+
+        The coroutine passes the message or command to f in a pool, then
+        yields from deliver(client, arg, result) to send what f returned.
+        """
+        @functools.wraps(f)
+        @asyncio.coroutine
+        def offloaded(client, arg):
+            result = yield from self.run(mode, f, arg)
+            yield from deliver(client, arg, result)
+        offloaded.mode = mode
+        return offloaded
+
+    def stats(self):
+        return {mode.name: metrics.snapshot() for mode, metrics in self._metrics.items()}
+
+    def shutdown(self, wait=False):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=wait)
@@ -0,0 +1,143 @@
+import asyncio
+import bisect
+import collections
+import logging
+import irc.messages
+import irc.sendqueue
+
+IRC_LOG = logging.getLogger('irc')
+
+DEFAULT_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LagHistogram:
+    """The last `window` lag samples, bucketed by upper bound in seconds."""
+
+    def __init__(self, window=100, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self._samples = collections.deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, lag):
+        self._samples.append(lag)
+
+    @property
+    def last(self):
+        return self._samples[-1] if self._samples else None
+
+    @property
+    def mean(self):
+        if not self._samples:
+            return None
+        return sum(self._samples) / len(self._samples)
+
+    def percentile(self, q):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+    def counts(self):
+        """Samples per bucket; the last bucket holds everything over the top bound."""
+        counts = [0] * (len(self.bounds) + 1)
+        for lag in self._samples:
+            counts[bisect.bisect_left(self.bounds, lag)] += 1
+        return counts
+
+
+class Heartbeat:
+    """Heartbeat pings the server every interval seconds and times the PONGs.
+
+    Each PING carries its own token, so late PONGs are still matched to
+    the right PING.  If the oldest unanswered PING is timeout seconds old
+    the transport is aborted, which ends the client's read loop and lets
+    its reconnect supervisor take over.
+    """
+
+    def __init__(self, client, interval=60.0, timeout=120.0, window=100):
+        self._client = client
+        self._loop = client.loop
+        self.interval = interval
+        self.timeout = timeout
+        self.histogram = LagHistogram(window)
+        self._outstanding = collections.OrderedDict()
+        self._token = 0
+        self._task = None
+        self.timeouts = 0
+
+    @property
+    def lag(self):
+        """Last measured round trip, or longer if a PING has waited longer."""
+        lag = self.histogram.last
+        if self._outstanding:
+            waiting = self._loop.time() - next(iter(self._outstanding.values()))
+            if lag is None or waiting > lag:
+                return waiting
+        return lag
+
+    def start(self):
+        self.stop()
+        self._outstanding.clear()
+        self._task = asyncio.async(self._run(), loop=self._loop)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def ping(self):
+        self._token += 1
+        token = 'hb{}'.format(self._token)
+        self._outstanding[token] = self._loop.time()
+        self._client.send_message(irc.messages.Ping([token]), priority=irc.sendqueue.Priority.control)
+
+    def pong(self, message):
+        """Record the lag for a PONG, returning whether it answered our PING."""
+        token = message.params[-1] if message.params else None
+        sent = self._outstanding.pop(token, None)
+        if sent is None:
+            return False
+        self.histogram.add(self._loop.time() - sent)
+        # PONGs come back in order, so anything older was lost
+        while self._outstanding:
+            oldest, oldest_sent = next(iter(self._outstanding.items()))
+            if oldest_sent > sent:
+                break
+            del self._outstanding[oldest]
+        return True
+
+    def expired(self):
+        if not self._outstanding:
+            return False
+        return self._loop.time() - next(iter(self._outstanding.values())) >= self.timeout
+
+    @asyncio.coroutine
+    def _run(self):
+        next_ping = self._loop.time()
+        while True:
+            now = self._loop.time()
+            if now >= next_ping:
+                self.ping()
+                next_ping = now + self.interval
+            if self.expired():
+                self.timeouts += 1
+                IRC_LOG.warn('No PONG for {}s, dropping the connection'.format(self.timeout))
+                self._task = None
+                self._client._transport.abort()
+                return
+            wake = next_ping
+            if self._outstanding:
+                wake = min(wake, next(iter(self._outstanding.values())) + self.timeout)
+            yield from asyncio.sleep(max(wake - now, 0), loop=self._loop)
+
+    def stats(self):
+        return {
+            'lag': self.lag,
+            'lag_mean': self.histogram.mean,
+            'lag_p99': self.histogram.percentile(99),
+            'lag_histogram': self.histogram.counts(),
+            'heartbeat_timeouts': self.timeouts,
+            'unanswered_pings': len(self._outstanding),
+        }
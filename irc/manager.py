@@ -0,0 +1,131 @@
+import asyncio
+import collections
+import logging
+import irc.bot
+import irc.client
+import irc.executor
+import irc.metrics
+
+IRC_LOG = logging.getLogger('irc')
+
+
+class ClientManager:
+    """Runs many IrcClient or IrcBot connections on one event loop.
+
+    Keyword arguments given to the manager are defaults for every client it
+    creates; handlers added to the manager are added to every client, now and
+    later.  All clients share one HandlerExecutor, so offloaded handlers use
+    one set of pools however many networks are connected.  Given a metrics
+    registry, each client records into it labelled with its name.
+    """
+
+    def __init__(self, *, loop=None, client_class=irc.bot.IrcBot, stagger=0.05, registry=None, **defaults):
+        self.loop = loop or asyncio.get_event_loop()
+        self.registry = registry
+        self.client_class = client_class
+        self.stagger = stagger
+        self.defaults = defaults
+        self.executor = irc.executor.HandlerExecutor(
+            loop=self.loop, thread_workers=defaults.pop('thread_workers', None),
+            process_workers=defaults.pop('process_workers', None))
+        self.clients = collections.OrderedDict()
+        self._handlers = []
+        self._command_handlers = []
+        self.start_failures = 0
+
+    def add(self, name, host, nick, **kwargs):
+        """Create a client called name, connecting to host as nick."""
+        if name in self.clients:
+            raise ValueError('{} is already managed'.format(name))
+        options = dict(self.defaults, **kwargs)
+        if self.registry is not None and 'metrics' not in options:
+            options['metrics'] = irc.metrics.ClientMetrics(self.registry, name)
+        client = self.client_class(host, nick, loop=self.loop, executor=self.executor, **options)
+        for irc_command, f in self._handlers:
+            client.add_handler(irc_command, f)
+        for args, kwargs in self._command_handlers:
+            client.add_command_handler(*args, **kwargs)
+        self.clients[name] = client
+        return client
+
+    def __getitem__(self, name):
+        return self.clients[name]
+
+    def __len__(self):
+        return len(self.clients)
+
+    def add_handler(self, irc_command, f, mode=irc.executor.Mode.inline):
+        if mode != irc.executor.Mode.inline:
+            # wrap once so every client shares the one offloaded handler
+            f = self.executor.wrap(mode, f, irc.client._send_results)
+        self._handlers.append((irc_command, f))
+        for client in self.clients.values():
+            client.add_handler(irc_command, f)
+
+    def handles(self, irc_command, mode=irc.executor.Mode.inline):
+        def decorator(f):
+            self.add_handler(irc_command, f, mode=mode)
+            return f
+
+        return decorator
+
+    def add_command_handler(self, command, f, *args, **kwargs):
+        self._command_handlers.append(((command, f) + args, kwargs))
+        for client in self.clients.values():
+            client.add_command_handler(command, f, *args, **kwargs)
+
+    @asyncio.coroutine
+    def start(self):
+        """Connect every client not yet started, stagger seconds apart.
+
+        Returns the names of the clients that failed to connect.
+        """
+        pending = [(name, client) for name, client in self.clients.items() if client._read_handler is None]
+        results = yield from asyncio.gather(
+            *[self._start_later(client, i * self.stagger) for i, (_, client) in enumerate(pending)],
+            loop=self.loop, return_exceptions=True)
+        failed = []
+        for (name, _), result in zip(pending, results):
+            if isinstance(result, Exception):
+                IRC_LOG.warn('{} failed to connect: {!r}'.format(name, result))
+                failed.append(name)
+        self.start_failures += len(failed)
+        return failed
+
+    @asyncio.coroutine
+    def _start_later(self, client, delay):
+        if delay:
+            yield from asyncio.sleep(delay, loop=self.loop)
+        yield from client.start()
+
+    @asyncio.coroutine
+    def quit(self):
+        quits = [client.quit() for client in self.clients.values() if client._read_handler is not None]
+        if quits:
+            yield from asyncio.wait(quits, loop=self.loop)
+        self.executor.shutdown()
+
+    def run(self):
+        self.loop.run_until_complete(self.start())
+        self.loop.run_forever()
+
+    def lags(self):
+        """Heartbeat lag per client name; None where there is no heartbeat."""
+        return {name: client.lag for name, client in self.clients.items()}
+
+    def stats(self):
+        """Totals of every client's stats, plus connection counts."""
+        totals = collections.Counter()
+        for client in self.clients.values():
+            for stats in (client.send_stats(), client.handler_stats(), client.reconnect_stats()):
+                for key, value in stats.items():
+                    if key.startswith('last_') or value is None:
+                        continue
+                    if key.startswith('max_'):
+                        totals[key] = max(totals[key], value)
+                    else:
+                        totals[key] += value
+        totals['clients'] = len(self.clients)
+        totals['registered'] = sum(client.registered for client in self.clients.values())
+        totals['channels'] = sum(len(client.channels) for client in self.clients.values())
+        return dict(totals)
@@ -2,6 +2,8 @@ import irc.protocol
 
 
 class Message(irc.protocol.RawMessage):
+    __slots__ = ()
+
     def __init__(self, params, command=None, prefix=None):
         if command is None:
             command = self.__class__.__name__.upper()
@@ -9,18 +11,24 @@ class Message(irc.protocol.RawMessage):
 
 
 class Nick(Message):
+    __slots__ = ()
+
     def __init__(self, nick, prefix=None):
         params = [nick]
         super().__init__(params, prefix=prefix)
 
 
 class User(Message):
+    __slots__ = ()
+
     def __init__(self, username, hostname, servername, realname, prefix=None):
         params = [username, hostname, servername, realname]
         super().__init__(params, prefix=prefix)
 
 
 class Part(Message):
+    __slots__ = ()
+
     def __init__(self, channel, password=None):
         params = [channel]
         if password:
@@ -29,6 +37,8 @@ class Part(Message):
 
 
 class Join(Message):
+    __slots__ = ()
+
     def __init__(self, channel, password=None):
         params = [channel]
         if password:
@@ -37,27 +47,45 @@ class Join(Message):
 
 
 class Ping(Message):
+    __slots__ = ()
+
     def __init__(self, params, prefix=None):
         super().__init__(params, prefix=prefix)
 
 
 class Pong(Message):
+    __slots__ = ()
+
     def __init__(self, params, prefix=None):
         super().__init__(params, prefix=prefix)
 
 
 class Quit(Message):
+    __slots__ = ()
+
     def __init__(self, prefix=None):
         super().__init__([], prefix=prefix)
 
 
 class Pass(Message):
+    __slots__ = ()
+
     def __init__(self, password):
         params = [password]
         super().__init__(params)
 
 
 class PrivMsg(Message):
+    __slots__ = ()
+
+    def __init__(self, target, message, prefix=None):
+        params = [target, message]
+        super().__init__(params, prefix=prefix)
+
+
+class Notice(Message):
+    __slots__ = ()
+
     def __init__(self, target, message, prefix=None):
         params = [target, message]
-        super().__init__(params, prefix=prefix)
\ No newline at end of file
+        super().__init__(params, prefix=prefix)
@@ -0,0 +1,303 @@
+import asyncio
+import bisect
+import functools
+import logging
+import irc.protocol
+
+IRC_LOG = logging.getLogger('irc')
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of values keyed by a tuple of label values."""
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, labels, (), value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        for name, labels, extra, value in self.samples():
+            lines.append('{}{} {}'.format(name, _format_labels(self.labelnames, labels, extra), _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, labels, value):
+        self._values[labels] = value
+
+    def inc(self, labels=(), amount=1):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class CallbackGauge(Metric):
+    """A gauge read from callbacks when collected, so it costs nothing to update."""
+    type = 'gauge'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._callbacks = {}
+
+    def add_callback(self, labels, callback):
+        self._callbacks[labels] = callback
+
+    def remove_callback(self, labels):
+        self._callbacks.pop(labels, None)
+
+    def value(self, labels=()):
+        callback = self._callbacks.get(labels)
+        return callback() if callback is not None else 0
+
+    def samples(self):
+        for labels, callback in list(self._callbacks.items()):
+            yield self.name, labels, (), callback()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        state = self._values.get(labels)
+        if state is None:
+            # per bucket counts, then the sum and the count
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def value(self, labels=()):
+        state = self._values.get(labels)
+        return (state[-1], state[-2]) if state else (0, 0.0)
+
+    def samples(self):
+        for labels, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                yield self.name + '_bucket', labels, (('le', _format_value(float(bound))),), cumulative
+            yield self.name + '_sum', labels, (), state[-2]
+            yield self.name + '_count', labels, (), state[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError('{} is already registered'.format(metric.name))
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def _get_or_register(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self.register(cls(name, *args, **kwargs))
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_register(Gauge, name, help, labelnames)
+
+    def callback_gauge(self, name, help, labelnames=()):
+        return self._get_or_register(CallbackGauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def collect(self):
+        """Every sample as {name: {labels: value}}, labels as a tuple of pairs."""
+        result = {}
+        for metric in self._metrics.values():
+            for name, labels, extra, value in metric.samples():
+                key = tuple(zip(metric.labelnames, labels)) + tuple(extra)
+                result.setdefault(name, {})[key] = value
+        return result
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ClientMetrics:
+    """The metrics an IrcClient records, labelled with the client's name.
+
+    Several clients can share one registry; each passes its own name.
+    The per-command handler latency histogram costs a timer and a callback
+    per handler, so it is only kept with handler_latency set.
+    """
+
+    def __init__(self, registry=None, name='default', handler_latency=False):
+        self.registry = registry = registry if registry is not None else Registry()
+        self.name = name
+        labels = ('client', 'command')
+        self.received_messages = registry.counter('irc_received_messages_total', 'Messages received', labels)
+        self.received_bytes = registry.counter('irc_received_bytes_total', 'Bytes received', labels)
+        self.sent_messages = registry.counter('irc_sent_messages_total', 'Messages queued for sending', labels)
+        self.sent_bytes = registry.counter('irc_sent_bytes_total', 'Bytes queued for sending', labels)
+        self.parse_errors = registry.counter('irc_parse_errors_total', 'Malformed lines received', ('client',))
+        self.disconnects = registry.counter('irc_disconnects_total', 'Connections lost', ('client',))
+        self.handler_latency = None
+        if handler_latency:
+            self.handler_latency = registry.histogram(
+                'irc_handler_seconds', 'Time from dispatch until handlers finish', labels)
+        self.bot_command_latency = registry.histogram(
+            'irc_bot_command_seconds', 'Time spent in bot command handlers', ('client', 'name'))
+        self.throttle_delay = registry.histogram(
+            'irc_throttle_delay_seconds', 'Waits imposed by the rate limiter', ('client',))
+        self.handlers_in_flight = registry.callback_gauge('irc_handlers_in_flight', 'Handler tasks running', ('client',))
+        self.send_queue_depth = registry.callback_gauge('irc_send_queue_lines', 'Lines waiting to be sent', ('client',))
+        self.lag = registry.callback_gauge('irc_lag_seconds', 'Heartbeat round trip', ('client',))
+        self._keys = {}
+
+    def _key(self, command):
+        # label tuples are built once per command, not per message
+        key = self._keys.get(command)
+        if key is None:
+            key = self._keys[command] = (self.name, command)
+        return key
+
+    def bind(self, client):
+        key = (self.name,)
+        self.handlers_in_flight.add_callback(key, lambda: len(client.tasks))
+        self.send_queue_depth.add_callback(key, lambda: client.send_queue_depth)
+        self.lag.add_callback(key, lambda: client.lag or 0.0)
+
+    def received(self, messages):
+        """Count a batch of messages read; malformed lines are left to parse_error()."""
+        keys = self._keys
+        name = self.name
+        # Counter.inc inlined, and one call per batch; this runs for every line read
+        counts = self.received_messages._values
+        sizes = self.received_bytes._values
+        for message in messages:
+            if isinstance(message, irc.protocol.ProtocolViolationError):
+                continue
+            command = message.command
+            key = keys.get(command)
+            if key is None:
+                key = keys[command] = (name, command)
+            counts[key] = counts.get(key, 0) + 1
+            raw = message.raw
+            if raw is not None:
+                sizes[key] = sizes.get(key, 0) + len(raw) + 2
+
+    def sent(self, command, size):
+        key = self._key(command)
+        self.sent_messages.inc(key)
+        self.sent_bytes.inc(key, size)
+
+    def parse_error(self):
+        self.parse_errors.inc((self.name,))
+
+    def disconnected(self):
+        self.disconnects.inc((self.name,))
+
+    def throttled(self, delay):
+        self.throttle_delay.observe((self.name,), delay)
+
+    def track_handler(self, command, loop, callback):
+        """Returns callback wrapped to record the handler's latency, for the
+        handler future's done callback.  Only with handler_latency set."""
+        # a partial allocates less than a closure, which keeps gc quieter
+        return functools.partial(self._handler_done, self._key(command), loop, loop.time(), callback)
+
+    def _handler_done(self, key, loop, started, callback, future):
+        callback(future)
+        self.handler_latency.observe(key, loop.time() - started)
+
+    def bot_command(self, name, elapsed):
+        self.bot_command_latency.observe((self.name, name), elapsed)
+
+
+class _MetricsHttpProtocol(asyncio.Protocol):
+    def __init__(self, registry):
+        self.registry = registry
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        if b'\r\n\r\n' not in self.buffer:
+            if len(self.buffer) > 8192:
+                self.transport.close()
+            return
+        request_line = self.buffer.split(b'\r\n', 1)[0].split()
+        if len(request_line) < 2 or request_line[0] != b'GET':
+            self._respond('405 Method Not Allowed', b'')
+        elif request_line[1].split(b'?')[0] not in (b'/', b'/metrics'):
+            self._respond('404 Not Found', b'')
+        else:
+            self._respond('200 OK', self.registry.render().encode('utf-8'))
+
+    def _respond(self, status, body):
+        head = 'HTTP/1.0 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+            status, CONTENT_TYPE, len(body))
+        self.transport.write(head.encode('ascii') + body)
+        self.transport.close()
+
+
+@asyncio.coroutine
+def serve(registry, host='127.0.0.1', port=9108, loop=None):
+    """Serve registry at /metrics over HTTP; returns the asyncio Server."""
+    loop = loop or asyncio.get_event_loop()
+    server = yield from loop.create_server(lambda: _MetricsHttpProtocol(registry), host, port)
+    IRC_LOG.debug('Serving metrics on {}:{}'.format(host, port))
+    return server
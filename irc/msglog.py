@@ -0,0 +1,99 @@
+import collections
+import logging
+import logging.handlers
+import queue
+
+
+class LazyMessage:
+    """Formats a logged message only when a handler emits the record."""
+    __slots__ = ('format', 'direction', 'message')
+
+    def __init__(self, format, direction, message):
+        self.format = format
+        self.direction = direction
+        self.message = message
+
+    def __str__(self):
+        return self.format.format(dir=self.direction, message=self.message)
+
+
+class Sampler:
+    """Sampler logs one in every n messages of a command.
+
+    rates maps a command to n; commands without a rate are always logged.
+    """
+
+    def __init__(self, rates):
+        self.rates = dict(rates)
+        self._seen = collections.Counter()
+
+    def __call__(self, command):
+        rate = self.rates.get(command)
+        if rate is None:
+            return True
+        seen = self._seen[command]
+        self._seen[command] = seen + 1
+        return seen % rate == 0
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # the stock handler formats in prepare(), which would run on the loop
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def enqueue_sentinel(self):
+        # wait for room so stop() works on a full queue
+        self.queue.put(self._sentinel)
+
+
+class BackgroundLog:
+    """Moves logger's handlers onto a writer thread fed through a queue.
+
+    Records are formatted and written by the thread.  When maxsize records
+    are waiting, new ones are dropped and counted rather than blocking.
+    """
+
+    def __init__(self, logger, maxsize=10000):
+        self.logger = logger
+        self._handlers = list(logger.handlers)
+        self._queue_handler = _DeferredQueueHandler(queue.Queue(maxsize))
+        self._listener = _Listener(self._queue_handler.queue, *self._handlers)
+
+    @property
+    def dropped(self):
+        return self._queue_handler.dropped
+
+    def start(self):
+        for handler in self._handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self._queue_handler)
+        self._listener.start()
+        return self
+
+    def stop(self):
+        """Flush waiting records and give the handlers back to the logger."""
+        self.logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        for handler in self._handlers:
+            self.logger.addHandler(handler)
+
+
+def log_in_background(logger, maxsize=10000):
+    return BackgroundLog(logger, maxsize=maxsize).start()
@@ -2,11 +2,62 @@ import asyncio
 import collections
 import inspect
 
+# enough for the largest chunk a transport reads at once plus a long line
+DEFAULT_MAX_BUFFER_SIZE = 1024 * 1024
+
 
 class EofStream(Exception):
     """eof stream indication."""
 
 
+class WriteFlowControl:
+    """Tracks the transport's pause_writing()/resume_writing() calls.
+
+    drain() blocks while the transport's write buffer is over its high
+    water mark.  pause_count and paused_time say how often and for how
+    long writing was paused.
+    """
+
+    _paused = False
+    _paused_at = None
+    _drain_waiter = None
+    pause_count = 0
+    _paused_time = 0.0
+
+    def _flow_loop(self):
+        return self._loop or asyncio.get_event_loop()
+
+    @property
+    def paused_time(self):
+        if self._paused:
+            return self._paused_time + self._flow_loop().time() - self._paused_at
+        return self._paused_time
+
+    def is_writing_paused(self):
+        return self._paused
+
+    def pause_writing(self):
+        self._paused = True
+        self._paused_at = self._flow_loop().time()
+        self.pause_count += 1
+
+    def resume_writing(self):
+        if self._paused:
+            self._paused_time += self._flow_loop().time() - self._paused_at
+        self._paused = False
+
+        waiter, self._drain_waiter = self._drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    @asyncio.coroutine
+    def drain(self):
+        while self._paused:
+            if self._drain_waiter is None:
+                self._drain_waiter = asyncio.Future(loop=self._flow_loop())
+            yield from asyncio.shield(self._drain_waiter, loop=self._flow_loop())
+
+
 class StreamParser:
     """StreamParser manages incoming bytes stream and protocol parsers.
 
@@ -18,13 +69,19 @@ class StreamParser:
     unset_parser() sends EofStream into parser and then removes it.
     """
 
-    def __init__(self, *, loop=None, inbuf=None):
+    def __init__(self, *, loop=None, inbuf=None,
+                 max_buffer_size=DEFAULT_MAX_BUFFER_SIZE):
         self._loop = loop
         self._eof = False
         self._exception = None
         self._parser = None
         self._output = None
-        self._input = inbuf if inbuf is not None else ParserBuffer()
+        self._input = (inbuf if inbuf is not None
+                       else ParserBuffer(max_size=max_buffer_size))
+
+    @property
+    def dropped_lines(self):
+        return self._input.dropped_lines
 
     def is_connected(self):
         return not self._eof
@@ -125,7 +182,7 @@ class StreamParser:
             self._parser = None
 
 
-class StreamProtocol(StreamParser, asyncio.Protocol):
+class StreamProtocol(StreamParser, WriteFlowControl, asyncio.Protocol):
     """asyncio's stream protocol based on StreamParser"""
 
     transport = None
@@ -139,6 +196,8 @@ class StreamProtocol(StreamParser, asyncio.Protocol):
 
     def connection_lost(self, exc):
         self.transport = None
+        if self.is_writing_paused():
+            self.resume_writing()
 
         if exc is not None:
             self.set_exception(exc)
@@ -146,6 +205,141 @@ class StreamProtocol(StreamParser, asyncio.Protocol):
             self.feed_eof()
 
 
+# asyncio.BufferedProtocol arrived in Python 3.7, where asyncio.async() no
+# longer parses; no runtime this package imports on has it yet
+HAVE_BUFFERED_PROTOCOL = hasattr(asyncio, 'BufferedProtocol')
+
+
+class BufferedStreamProtocol(WriteFlowControl,
+                             asyncio.BufferedProtocol if HAVE_BUFFERED_PROTOCOL else asyncio.Protocol):
+    """asyncio protocol that parses lines in a buffer allocated once.
+
+    Without HAVE_BUFFERED_PROTOCOL, which is every runtime this package
+    supports today, data_received() copies each chunk into the buffer, so
+    receiving is not zero-copy; what this saves over StreamProtocol is
+    growing and reallocating the buffer.  Where asyncio has
+    BufferedProtocol the transport receives straight into it through
+    get_buffer() and buffer_updated().  Complete lines are parsed where
+    they landed and only the trailing partial line is moved back to the
+    front.
+
+    The buffer size is also the cap on buffered bytes: a line that does not
+    fit, or is longer than the parser's max_line_length, is dropped and
+    counted in dropped_lines.
+
+    set_parser() takes an object with a parse_spans(buf, spans) method
+    returning the parsed items, and a max_line_length attribute, like
+    irc.protocol.MessageParser.
+    """
+
+    transport = None
+    stop = b'\r\n'
+
+    def __init__(self, *, loop=None, buffer_size=65536):
+        self._loop = loop
+        self._eof = False
+        self._exception = None
+        self._parser = None
+        self._output = None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._scanner = LineScanner(self.stop)
+
+    @property
+    def dropped_lines(self):
+        return self._scanner.dropped_lines
+
+    is_connected = StreamParser.is_connected
+
+    exception = StreamParser.exception
+
+    set_exception = StreamParser.set_exception
+
+    def set_parser(self, parser):
+        """set parser to stream. return parser's DataQueue."""
+        output = DataQueue(loop=self._loop)
+        if self._exception:
+            output.set_exception(self._exception)
+            return output
+
+        self._parser = parser
+        self._output = output
+        self._scanner.limit = parser.max_line_length
+        self._parse()
+        if self._eof:
+            output.feed_eof()
+            self._parser = None
+            self._output = None
+        return output
+
+    def unset_parser(self):
+        if self._output is not None:
+            self._output.feed_eof()
+        self._output = None
+        self._parser = None
+
+    def _parse(self):
+        if self._parser is None or self._start == self._end:
+            return
+
+        spans, self._start = self._scanner.scan(self._buffer, self._start, self._end)
+        if spans:
+            self._output.feed_batch(self._parser.parse_spans(self._buffer, spans))
+        if self._start == self._end:
+            self._scanner.shift(self._start)
+            self._start = self._end = 0
+
+    def get_buffer(self, sizehint=-1):
+        size = len(self._buffer)
+        start, end = self._start, self._end
+        if start and size - end < size // 4:
+            # move the partial line to the front
+            self._buffer[:end - start] = bytes(self._view[start:end])
+            self._scanner.shift(start)
+            self._start, self._end = 0, end - start
+        elif end == size:
+            # a single line fills the whole buffer, throw it away
+            self._scanner.discard()
+            self._scanner.shift(end)
+            self._start = self._end = 0
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+        self._parse()
+
+    def data_received(self, data):
+        data = memoryview(data)
+        while data:
+            buf = self.get_buffer(len(data))
+            size = min(len(buf), len(data))
+            buf[:size] = data[:size]
+            data = data[size:]
+            self.buffer_updated(size)
+
+    def eof_received(self):
+        if self._output is not None:
+            self._output.feed_eof()
+            self._output = None
+            self._parser = None
+        self._eof = True
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self.is_writing_paused():
+            self.resume_writing()
+
+        if exc is not None:
+            self.set_exception(exc)
+        else:
+            self.eof_received()
+
+
 class DataQueue:
     """DataQueue is a destination for parsed data."""
 
@@ -177,6 +371,19 @@ class DataQueue:
             if not waiter.cancelled():
                 waiter.set_result(True)
 
+    def feed_batch(self, items):
+        """feed_batch() queues several items and wakes the reader once."""
+        if not items:
+            return
+
+        self._buffer.extend(items)
+
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.cancelled():
+                waiter.set_result(True)
+
     def feed_eof(self):
         self._eof = True
 
@@ -197,10 +404,103 @@ class DataQueue:
             yield from self._waiter
 
         if self._buffer:
-            return self._buffer.popleft()
+            data = self._buffer.popleft()
+            if isinstance(data, Exception):
+                raise data
+            return data
         else:
             raise EofStream
 
+    @asyncio.coroutine
+    def read_batch(self, max_n=None):
+        """read_batch() returns up to max_n items in a single wakeup.
+
+        Unlike read(), errors queued by the parser are returned in place
+        of the item they replaced instead of being raised.
+        """
+        if self._exception is not None:
+            raise self._exception
+
+        if not self._buffer and not self._eof:
+            assert not self._waiter
+            self._waiter = asyncio.Future(loop=self._loop)
+            yield from self._waiter
+
+        buffer = self._buffer
+        if not buffer:
+            raise EofStream
+
+        if max_n is None or len(buffer) <= max_n:
+            batch = list(buffer)
+            buffer.clear()
+        else:
+            popleft = buffer.popleft
+            batch = [popleft() for _ in range(max_n)]
+        return batch
+
+
+class LineScanner:
+    """LineScanner finds complete lines in a buffer that keeps growing.
+
+    It remembers where the last search stopped so every byte is scanned
+    once, and drops lines longer than limit (stop included) instead of
+    letting them pile up: the part already buffered is skipped right away
+    and the rest is skipped as it arrives.
+    """
+
+    def __init__(self, stop, limit=None, previous=None):
+        self.stop = stop
+        self.limit = limit
+        self.dropped_lines = previous.dropped_lines if previous else 0
+        self._scan_pos = previous._scan_pos if previous else 0
+        self._discarding = previous._discarding if previous else False
+
+    def scan(self, buf, start, end):
+        """scan() returns the spans of the complete lines in buf[start:end]
+        and the offset of the first byte that was not consumed."""
+        stop = self.stop
+        stop_len = len(stop)
+        limit = self.limit
+
+        spans = []
+        pos = buf.find(stop, max(start, self._scan_pos), end)
+        while pos >= 0:
+            line_end = pos + stop_len
+            if self._discarding:
+                self._discarding = False
+            elif limit is not None and line_end - start > limit:
+                self.dropped_lines += 1
+            else:
+                spans.append((start, line_end))
+            start = line_end
+            pos = buf.find(stop, start, end)
+
+        if limit is not None and end - start > limit:
+            self.discard()
+            # keep what could be the beginning of stop
+            start = end - stop_len + 1
+
+        self._scan_pos = max(start, end - stop_len + 1)
+        return spans, start
+
+    @property
+    def discarding(self):
+        return self._discarding
+
+    def discard(self):
+        """discard() drops the line currently being received."""
+        if not self._discarding:
+            self._discarding = True
+            self.dropped_lines += 1
+
+    def shift(self, size):
+        """shift() tells the scanner size bytes were removed from the front."""
+        self._scan_pos = max(self._scan_pos - size, 0)
+
+    def truncate(self, size):
+        """truncate() tells the scanner the buffer was cut back to size bytes."""
+        self._scan_pos = min(self._scan_pos, size)
+
 
 class ParserBuffer(bytearray):
     """ParserBuffer is a bytearray extension.
@@ -208,16 +508,29 @@ class ParserBuffer(bytearray):
     ParserBuffer provides helper methods for parsers.
     """
 
-    def __init__(self, *args):
+    def __init__(self, *args, max_size=None, stop=b'\r\n'):
         super().__init__(*args)
 
         self.offset = 0
         self.size = 0
+        self.max_size = max_size
+        self.stop = stop
+        self.dropped_bytes = 0
+        self._dropped_lines = 0
+        self._scanner = None
+        self._skipping = False
+        self._skip_carry = b''
         self._writer = self._feed_data()
         next(self._writer)
 
+    @property
+    def dropped_lines(self):
+        return self._dropped_lines + (self._scanner.dropped_lines if self._scanner else 0)
+
     def _shrink(self):
         if self.offset:
+            if self._scanner:
+                self._scanner.shift(self.offset)
             del self[:self.offset]
             self.offset = 0
             self.size = len(self)
@@ -225,15 +538,71 @@ class ParserBuffer(bytearray):
     def _feed_data(self):
         while True:
             chunk = yield
+            if chunk and self._skipping:
+                chunk = self._skip_partial(chunk)
             if chunk:
                 chunk_len = len(chunk)
                 self.size += chunk_len
                 self.extend(chunk)
 
+                if self.max_size is not None and self.size > self.max_size:
+                    self._cap()
+
                 # shrink buffer
                 if self.offset and len(self) > 8196:
                     self._shrink()
 
+    def _cap(self):
+        """Drop the line being received if it alone is over max_size.
+
+        Complete lines are left for the parser, however many a chunk
+        brings; the rest of the dropped line is skipped as it arrives.
+        """
+        stop = self.stop
+        keep = len(stop) - 1
+        pos = self.rfind(stop, self.offset)
+        tail = self.offset if pos < 0 else pos + len(stop)
+        if len(self) - tail <= self.max_size:
+            return
+
+        scanner = self._scanner
+        if pos < 0 and scanner is not None and scanner.discarding:
+            # the scanner is skipping this line already, and counted it
+            end = len(self) - keep
+        else:
+            end = len(self)
+            # what could be the beginning of stop
+            self._skip_carry = bytes(self[end - keep:end])
+            self._skipping = True
+            self._dropped_lines += 1
+        self.dropped_bytes += end - tail
+        del self[tail:end]
+        self.size = len(self) - self.offset
+        if scanner is not None:
+            scanner.truncate(tail)
+
+    def _skip_partial(self, chunk):
+        """Drop the rest of a dropped line from chunk, return what follows."""
+        stop = self.stop
+        keep = len(stop) - 1
+        carry = self._skip_carry
+        # stop may straddle the chunks
+        pos = (carry + bytes(chunk[:keep])).find(stop)
+        if pos >= 0:
+            end = pos + len(stop) - len(carry)
+        else:
+            pos = chunk.find(stop)
+            if pos < 0:
+                self.dropped_bytes += len(chunk)
+                if keep:
+                    self._skip_carry = (carry + bytes(chunk[-keep:]))[-keep:]
+                return b''
+            end = pos + len(stop)
+        self._skipping = False
+        self._skip_carry = b''
+        self.dropped_bytes += end
+        return chunk[end:]
+
     def feed_data(self, data):
         self._writer.send(data)
 
@@ -289,6 +658,30 @@ class ParserBuffer(bytearray):
 
             self._writer.send((yield))
 
+    def readspans(self, stop, limit=None):
+        """readspans() returns the offsets of every complete line buffered.
+
+        It waits for at least one line, so a single call drains everything
+        a chunk of data completed.  Lines longer than limit are dropped and
+        counted in dropped_lines.
+        """
+        assert isinstance(stop, bytes) and stop, \
+            'bytes is required: {!r}'.format(stop)
+
+        scanner = self._scanner
+        if scanner is None or scanner.stop != stop or scanner.limit != limit:
+            scanner = self._scanner = LineScanner(stop, limit, scanner)
+
+        while True:
+            spans, offset = scanner.scan(self, self.offset, len(self))
+            self.size -= offset - self.offset
+            self.offset = offset
+
+            if spans:
+                return spans
+
+            self._writer.send((yield))
+
     def skip(self, size):
         """skip() skips specified amount of bytes."""
 
@@ -0,0 +1,124 @@
+import asyncio
+import collections
+
+
+class HandlerPool:
+    """HandlerPool caps how many handler futures run at once.
+
+    max_in_flight limits the total, max_per_command the number for any one
+    command (an int, or a dict of command to int).  When a message would go
+    over a cap, IrcClient either waits for room while the transport stops
+    reading, or with reject set skips its handlers and counts a rejection.
+    """
+
+    def __init__(self, *, loop=None, max_in_flight=None, max_per_command=None, reject=False):
+        self._loop = loop
+        self.max_in_flight = max_in_flight
+        self.max_per_command = max_per_command
+        self.reject = reject
+        self.in_flight = 0
+        self._per_command = collections.Counter()
+        self._waiter = None
+
+        self.rejected = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _command_limit(self, command):
+        if isinstance(self.max_per_command, dict):
+            return self.max_per_command.get(command)
+        return self.max_per_command
+
+    def has_room(self, command):
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return False
+        limit = self._command_limit(command)
+        return limit is None or self._per_command[command] < limit
+
+    def try_acquire(self, command):
+        if not self.has_room(command):
+            return False
+        self.in_flight += 1
+        self._per_command[command] += 1
+        return True
+
+    @asyncio.coroutine
+    def acquire(self, command):
+        """acquire() waits until command has room, then takes a slot."""
+        if self.try_acquire(command):
+            return
+        self.waits += 1
+        start = self._loop.time()
+        try:
+            while not self.has_room(command):
+                self._waiter = asyncio.Future(loop=self._loop)
+                yield from self._waiter
+        finally:
+            self._waiter = None
+            self.wait_time += self._loop.time() - start
+        self.try_acquire(command)
+
+    def release(self, command):
+        self.in_flight -= 1
+        self._per_command[command] -= 1
+        if not self._per_command[command]:
+            del self._per_command[command]
+
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def count_rejected(self, command):
+        """count_rejected() counts a message whose handlers were skipped for lack of room."""
+        self.rejected += 1
+
+    def track(self, command, future):
+        """track() releases command's slot once future is done."""
+        future.add_done_callback(lambda _: self.release(command))
+
+    def in_flight_for(self, command):
+        return self._per_command[command]
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'waits': self.waits,
+            'wait_time': self.wait_time,
+            'rejected': self.rejected,
+        }
+
+
+class HandlerTasks:
+    """HandlerTasks holds the handler futures still running.
+
+    join() waits until every one of them is done.  IrcClient adds each
+    handler future and discards it from its done callback.
+    """
+
+    def __init__(self, *, loop=None):
+        self._loop = loop
+        self._tasks = set()
+        self._waiter = None
+
+    def add(self, task):
+        self._tasks.add(task)
+
+    def discard(self, task):
+        self._tasks.discard(task)
+        if not self._tasks:
+            waiter, self._waiter = self._waiter, None
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, task):
+        return task in self._tasks
+
+    @asyncio.coroutine
+    def join(self):
+        while self._tasks:
+            if self._waiter is None:
+                self._waiter = asyncio.Future(loop=self._loop)
+            yield from asyncio.shield(self._waiter, loop=self._loop)
@@ -0,0 +1,150 @@
+import asyncio
+import collections
+import cProfile
+import functools
+import logging
+import pstats
+import time
+
+IRC_LOG = logging.getLogger('irc')
+
+SlowHandler = collections.namedtuple('SlowHandler', ['name', 'wall', 'blocking', 'yields', 'message'])
+
+
+class HandlerStats:
+    __slots__ = ('calls', 'wall', 'max_wall', 'blocking', 'max_blocking', 'yields', 'slow')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.max_wall = 0.0
+        self.blocking = 0.0
+        self.max_blocking = 0.0
+        self.yields = 0
+        self.slow = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class HandlerProfiler:
+    """HandlerProfiler times every step of the handlers it wraps.
+
+    wall is the time from the handler starting to it finishing, blocking the
+    time its code ran without yielding to the loop, and yields how often it
+    gave the loop back.  A handler over slow_threshold seconds of wall time,
+    or blocking_threshold seconds of blocking, produces a SlowHandler event:
+    it is logged with the event as extra={'slow_handler': event} and passed
+    to every on_slow callback.
+    """
+
+    def __init__(self, slow_threshold=1.0, blocking_threshold=0.05, clock=time.perf_counter):
+        self.slow_threshold = slow_threshold
+        self.blocking_threshold = blocking_threshold
+        self._clock = clock
+        self.handlers = collections.defaultdict(HandlerStats)
+        self.on_slow = []
+
+    def wrap(self, f, name=None):
+        name = name or getattr(f, '__qualname__', repr(f))
+
+        @functools.wraps(f)
+        @asyncio.coroutine
+        def profiled(client, arg):
+            return (yield from self._run(name, f(client, arg), arg))
+        return profiled
+
+    @asyncio.coroutine
+    def _run(self, name, coro, arg):
+        clock = self._clock
+        started = clock()
+        blocking = 0.0
+        yields = 0
+        if not hasattr(coro, 'send'):
+            # a plain function that returned a future or a value
+            result = (yield from coro) if isinstance(coro, asyncio.Future) else coro
+            self._record(name, clock() - started, clock() - started, 0, arg)
+            return result
+
+        value, error = None, None
+        try:
+            while True:
+                step = clock()
+                try:
+                    if error is None:
+                        yielded = coro.send(value)
+                    else:
+                        yielded = coro.throw(error)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    blocking += clock() - step
+                yields += 1
+                try:
+                    value, error = (yield yielded), None
+                except GeneratorExit:
+                    coro.close()
+                    raise
+                except BaseException as e:
+                    value, error = None, e
+        finally:
+            self._record(name, clock() - started, blocking, yields, arg)
+
+    def _record(self, name, wall, blocking, yields, arg):
+        stats = self.handlers[name]
+        stats.calls += 1
+        stats.wall += wall
+        stats.max_wall = max(stats.max_wall, wall)
+        stats.blocking += blocking
+        stats.max_blocking = max(stats.max_blocking, blocking)
+        stats.yields += yields
+        if wall >= self.slow_threshold or blocking >= self.blocking_threshold:
+            stats.slow += 1
+            event = SlowHandler(name, wall, blocking, yields, arg)
+            IRC_LOG.warning('Slow handler {} took {:.3f}s, blocking the loop for {:.3f}s, on {!r}'.format(
+                name, wall, blocking, arg), extra={'slow_handler': event})
+            for callback in self.on_slow:
+                callback(event)
+
+    def stats(self):
+        return {name: stats.as_dict() for name, stats in self.handlers.items()}
+
+
+_profiling = False
+
+
+def is_profiling():
+    """is_profiling() is true while profile_for() runs."""
+    return _profiling
+
+
+@asyncio.coroutine
+def profile_for(seconds, loop=None, limit=10, sort='cumulative'):
+    """Run cProfile over everything on this thread for seconds.
+
+    cProfile is deterministic rather than sampling: it traces every call,
+    which slows the loop down while it runs.  Returns one line for each of
+    the top limit functions.  Only one profile can run at a time.
+    """
+    global _profiling
+    if _profiling:
+        raise RuntimeError('a profile is already running')
+    _profiling = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        yield from asyncio.sleep(seconds, loop=loop)
+    finally:
+        profiler.disable()
+        _profiling = False
+    return top_entries(pstats.Stats(profiler), limit, sort)
+
+
+def top_entries(stats, limit=10, sort='cumulative'):
+    index = {'cumulative': 3, 'tottime': 2, 'calls': 1}[sort]
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][index], reverse=True)[:limit]
+    lines = []
+    for (filename, line, function), (_, calls, own, total, _) in entries:
+        lines.append('{:.3f}s {:.3f}s own {} calls {}:{}({})'.format(
+            total, own, calls, filename.rsplit('/', 1)[-1], line, function))
+    return lines
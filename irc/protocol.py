@@ -4,44 +4,70 @@ NL = b'\n'
 CR = b'\r'
 EOL = CR + NL
 
+MAX_LINE_LENGTH = 512
+# the longest host a server puts in our prefix when relaying our lines
+MAX_HOST_LENGTH = 63
+# IRCv3 message tags may add up to this many bytes in front of the line
+MAX_TAGS_LENGTH = 8191
+
 
 class ProtocolViolationError(Exception):
     def __init__(self, raw):
         self.raw = raw
 
 
-def split(raw):
-    buf = raw
+def scan(buf, start=0, end=None):
+    """Find the field boundaries of the line in buf[start:end].
+
+    Returns (prefix, command, params) as (start, end) offset pairs into buf,
+    prefix being None when absent.  Nothing is copied, so buf may be any
+    bytes-like object, including a ParserBuffer that still holds more data.
+    """
+    if end is None:
+        end = len(buf)
+
+    if not buf.endswith(EOL, start, end):
+        raise ProtocolViolationError(bytes(buf[start:end]))
+    stop = end - 2
+
     prefix = None
-    trailing = None
+    pos = start
+    if buf.startswith(b':', pos, stop):
+        space = buf.find(DELIM, pos + 1, stop)
+        if space >= 0:
+            prefix = (pos + 1, space)
+            pos = space + 1
 
-    if buf.endswith(EOL):
-        buf = buf[:-2]
-    else:
-        raise ProtocolViolationError(raw)
+    space = buf.find(DELIM, pos, stop)
+    if space < 0:
+        raise ProtocolViolationError('No command recieved: {msg}'.format(
+            msg=bytes(buf[start:end])))
+    command = (pos, space)
+    pos = space + 1
 
-    if buf.startswith(b':'):
-        try:
-            prefix, buf = buf[1:].split(DELIM, 1)
-        except ValueError:
-            pass
+    if buf.startswith(b':', pos, stop):
+        return prefix, command, [(pos + 1, stop)]
 
-    try:
-        command, buf = buf.split(DELIM, 1)
-    except ValueError:
-        raise ProtocolViolationError('No command recieved: {msg}'.format(msg=raw))
+    trailing = buf.find(DELIM + b':', pos, stop)
+    last = trailing if trailing >= 0 else stop
+    params = []
+    space = buf.find(DELIM, pos, last)
+    while space >= 0:
+        params.append((pos, space))
+        pos = space + 1
+        space = buf.find(DELIM, pos, last)
+    params.append((pos, last))
+    if trailing >= 0:
+        params.append((trailing + 2, stop))
+
+    return prefix, command, params
 
-    if buf.startswith(b':'):
-        params = [buf[1:]]
-    else:
-        try:
-            buf, trailing = buf.split(DELIM + b':', 1)
-        except ValueError:
-            pass
-        params = buf.split(DELIM)
-        if trailing is not None:
-            params.append(trailing)
 
+def split(raw):
+    prefix, command, params = scan(raw)
+    prefix = raw[prefix[0]:prefix[1]] if prefix else None
+    command = raw[command[0]:command[1]]
+    params = [raw[s:e] for s, e in params]
     return prefix, command, params
 
 
@@ -86,23 +112,182 @@ def unsplit(prefix_raw, command, params):
     return buf.strip() + EOL
 
 
+def split_text(data, limit):
+    """Split encoded text into pieces of at most limit bytes.
+
+    Line breaks always split, since a line cannot contain them.  Otherwise
+    a piece ends at its last space, which is dropped, if that is in its
+    second half, or else on a UTF-8 character boundary.  Empty pieces are
+    left out.
+    """
+    if limit < 1:
+        raise ValueError('limit must be at least 1, not {}'.format(limit))
+    pieces = []
+    for line in data.splitlines():
+        start = 0
+        end = len(line)
+        while end - start > limit:
+            cut = start + limit
+            space = line.rfind(DELIM, start + limit // 2, cut + 1)
+            if space >= 0:
+                pieces.append(line[start:space])
+                start = space + 1
+                continue
+            # continuation bytes look like 10xxxxxx
+            while cut > start and line[cut] & 0xC0 == 0x80:
+                cut -= 1
+            if cut == start:
+                cut = start + limit
+            pieces.append(line[start:cut])
+            start = cut
+        if start < end:
+            pieces.append(line[start:])
+    return pieces
+
+
+def decode(raw):
+    """Decode raw as UTF-8, falling back to latin-1 which never fails."""
+    try:
+        return str(raw, 'utf-8')
+    except UnicodeDecodeError:
+        return str(raw, 'latin-1')
+
+
+def split_params(rest, delim=DELIM, colon=b':'):
+    if rest.startswith(colon):
+        return [rest[1:]]
+    trailing = rest.find(delim + colon)
+    if trailing < 0:
+        return rest.split(delim)
+    params = rest[:trailing].split(delim)
+    params.append(rest[trailing + 2:])
+    return params
+
+
 def split_message(raw):
-    prefix, command, params = split(raw)
-    prefix = str(prefix, 'utf-8') if prefix else None
-    command = str(command, 'utf-8')
-    params = [str(p, 'utf-8') for p in params]
-    return RawMessage(command, params, prefix=prefix)
+    return split_message_at(raw, 0, len(raw))
+
+
+def split_message_at(buf, start, end):
+    """Parse the line in buf[start:end] into a lazily decoded RawMessage.
+
+    The line is copied out of buf once, through a memoryview, and only the
+    command is decoded up front.  This saves the intermediate slice, not
+    every copy; it is not a zero-copy parse.
+    """
+    if not buf.endswith(EOL, start, end):
+        raise ProtocolViolationError(bytes(buf[start:end]))
+
+    with memoryview(buf) as view:
+        raw = bytes(view[start:end - 2])
+
+    pos = 0
+    if raw.startswith(b':'):
+        stop = raw.find(DELIM)
+        if stop >= 0:
+            pos = stop + 1
+
+    stop = raw.find(DELIM, pos)
+    if stop <= pos:
+        raise ProtocolViolationError('No command recieved: {msg}'.format(
+            msg=raw + EOL))
+
+    return RawMessage.from_raw(raw, decode(raw[pos:stop]), stop + 1)
 
 
 class RawMessage:
+    # parsed messages leave _prefix, _params and _nick unset until accessed
+    __slots__ = ('command', '_raw', '_params_start', '_prefix', '_params',
+                 '_nick', '_username', '_host')
+
     def __init__(self, command, params, prefix=None):
         if not command:
             raise ValueError
-        self.prefix = prefix
-        self.nick, self.username, self.host = (split_prefix(prefix) if prefix
-                                               else (None, None, None))
         self.command = command
-        self.params = params
+        self._raw = None
+        self._prefix = prefix
+        self._params = params
+
+    @classmethod
+    def from_raw(cls, raw, command, params_start):
+        """Build a message that decodes its prefix and params on access.
+
+        raw is the line without EOL and params_start the offset of the
+        first byte after the command.
+        """
+        message = cls.__new__(cls)
+        message.command = command
+        message._raw = raw
+        message._params_start = params_start
+        return message
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def __reduce__(self):
+        # a decoded snapshot, so handlers in other processes need no buffer
+        return (RawMessage, (self.command, self.params, self.prefix))
+
+    @property
+    def prefix(self):
+        try:
+            return self._prefix
+        except AttributeError:
+            raw = self._raw
+            stop = raw.find(DELIM) if raw.startswith(b':') else -1
+            self._prefix = decode(raw[1:stop]) if stop > 1 else None
+            return self._prefix
+
+    @prefix.setter
+    def prefix(self, prefix):
+        self._prefix = prefix
+        self._split_prefix()
+
+    @property
+    def params(self):
+        try:
+            return self._params
+        except AttributeError:
+            rest = self._raw[self._params_start:]
+            try:
+                self._params = split_params(str(rest, 'utf-8'), ' ', ':')
+            except UnicodeDecodeError:
+                self._params = [decode(p) for p in split_params(rest)]
+            return self._params
+
+    @params.setter
+    def params(self, params):
+        self._params = params
+
+    def _split_prefix(self):
+        prefix = self.prefix
+        self._nick, self._username, self._host = (split_prefix(prefix) if prefix
+                                                  else (None, None, None))
+
+    @property
+    def nick(self):
+        try:
+            return self._nick
+        except AttributeError:
+            self._split_prefix()
+            return self._nick
+
+    @property
+    def username(self):
+        try:
+            return self._username
+        except AttributeError:
+            self._split_prefix()
+            return self._username
+
+    @property
+    def host(self):
+        try:
+            return self._host
+        except AttributeError:
+            self._split_prefix()
+            return self._host
 
     def __repr__(self):
         return 'Message({prefix}, {command}, {params})'.format(prefix=self.prefix,
@@ -116,7 +301,27 @@ class RawMessage:
 
 
 class MessageParser:
+    """Parses every complete line of a chunk and queues them as one batch.
+
+    A line that violates the protocol is queued as its
+    ProtocolViolationError so the rest of the batch still gets through.
+    Lines longer than max_line_length bytes are dropped by the buffer.
+    """
+
+    def __init__(self, max_line_length=MAX_LINE_LENGTH + MAX_TAGS_LENGTH):
+        self.max_line_length = max_line_length
+
     def __call__(self, out, buf):
         while True:
-            raw_data = yield from buf.readuntil(EOL)
-            out.feed_data(split_message(raw_data))
+            spans = yield from buf.readspans(EOL, self.max_line_length)
+            out.feed_batch(self.parse_spans(buf, spans))
+
+    def parse_spans(self, buf, spans):
+        """Parse the lines at the given (start, end) offsets of buf."""
+        messages = []
+        for start, end in spans:
+            try:
+                messages.append(split_message_at(buf, start, end))
+            except ProtocolViolationError as e:
+                messages.append(e)
+        return messages
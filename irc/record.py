@@ -0,0 +1,202 @@
+"""Capture raw IRC traffic to a file and replay it through a client.
+
+A capture starts with MAGIC and is followed by frames: a FRAME header
+(timestamp as a double, direction, payload length) and the payload.
+Frames are only ever appended.
+"""
+import asyncio
+import mmap
+import struct
+import time
+
+MAGIC = b'IRCREC1\n'
+FRAME = struct.Struct('<dBI')
+RECEIVED = 0
+SENT = 1
+
+
+class CaptureError(Exception):
+    pass
+
+
+class Recorder:
+    """Recorder appends every chunk received and written to a capture file.
+
+    Give it to IrcClient as recorder; the client records its writes and
+    the protocol its reads.  Writes to the file are buffered, and flushed
+    when the client's connection closes or it quits.
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise CaptureError('{} is not a capture'.format(path))
+        self._protocol_classes = {}
+        self.frames = 0
+        self.bytes = 0
+
+    def record(self, direction, data):
+        self._file.write(FRAME.pack(self._clock(), direction, len(data)))
+        self._file.write(data)
+        self.frames += 1
+        self.bytes += len(data)
+
+    def received(self, data):
+        self.record(RECEIVED, data)
+
+    def sent(self, data):
+        self.record(SENT, data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def wrap_protocol(self, protocol_class):
+        """A subclass of protocol_class that records what it receives."""
+        wrapped = self._protocol_classes.get(protocol_class)
+        if wrapped is None:
+            wrapped = self._protocol_classes[protocol_class] = _recording(protocol_class, self)
+        return wrapped
+
+
+def _recording(protocol_class, recorder):
+    if hasattr(protocol_class, 'buffer_updated'):
+        # a buffered protocol's data_received goes through buffer_updated too
+        class RecordingProtocol(protocol_class):
+            def buffer_updated(self, nbytes):
+                # the bytes land after the current end of the buffered data
+                recorder.received(bytes(self._view[self._end:self._end + nbytes]))
+                super().buffer_updated(nbytes)
+    else:
+        class RecordingProtocol(protocol_class):
+            def data_received(self, data):
+                recorder.received(data)
+                super().data_received(data)
+
+    RecordingProtocol.__name__ = 'Recording' + protocol_class.__name__
+    return RecordingProtocol
+
+
+class Capture:
+    """Reads a capture through mmap, so files larger than memory stream."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise CaptureError('{} is empty'.format(path))
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise CaptureError('{} is not a capture'.format(path))
+
+    def frames(self, direction=None):
+        """Yield (timestamp, direction, data), optionally for one direction.
+
+        A frame cut short by a crash while recording ends the capture.
+        """
+        data = self._map
+        offset = len(MAGIC)
+        end = len(data)
+        while offset + FRAME.size <= end:
+            timestamp, frame_direction, size = FRAME.unpack_from(data, offset)
+            offset += FRAME.size
+            if offset + size > end:
+                return
+            if direction is None or frame_direction == direction:
+                yield timestamp, frame_direction, data[offset:offset + size]
+            offset += size
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayTransport(asyncio.Transport):
+    """Stands in for the socket: counts writes and honours pause_reading."""
+
+    def __init__(self, loop):
+        super().__init__()
+        self._loop = loop
+        self._reading = asyncio.Event(loop=loop)
+        self._reading.set()
+        self.written_bytes = 0
+        self.writes = 0
+        self.closed = False
+
+    def write(self, data):
+        self.written_bytes += len(data)
+        self.writes += 1
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    abort = close
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    @asyncio.coroutine
+    def wait_readable(self):
+        yield from self._reading.wait()
+
+
+@asyncio.coroutine
+def replay(client, path, realtime=False, speed=1.0, yield_every=64):
+    """Feed the traffic received in a capture to client.
+
+    As fast as possible by default, giving the loop a turn every
+    yield_every frames; with realtime, at the recorded pace divided by
+    speed.  Returns the transport, which counts what the client wrote.
+    """
+    loop = client.loop
+    transport = ReplayTransport(loop)
+    protocol = client.protocol_class(loop=loop, **client.protocol_kwargs)
+    protocol.connection_made(transport)
+    client.attach(transport, protocol)
+
+    with Capture(path) as capture:
+        start = loop.time()
+        first = None
+        for count, (timestamp, _, data) in enumerate(capture.frames(RECEIVED), 1):
+            if transport.closed:
+                break
+            if realtime:
+                if first is None:
+                    first = timestamp
+                delay = start + (timestamp - first) / speed - loop.time()
+                if delay > 0:
+                    yield from asyncio.sleep(delay, loop=loop)
+            elif count % yield_every == 0:
+                yield from asyncio.sleep(0, loop=loop)
+            yield from transport.wait_readable()
+            protocol.data_received(data)
+    protocol.connection_lost(None)
+    yield from client.wait_closed()
+    return transport
@@ -0,0 +1,270 @@
+import asyncio
+import collections
+import enum
+
+
+class Priority(enum.IntEnum):
+    control = 1
+    normal = 2
+    bulk = 3
+
+
+class Overflow(enum.Enum):
+    """What SendQueue does with a line that would go over its high water mark."""
+    block = 1
+    drop = 2
+    raise_ = 3
+
+
+class SendQueueFull(Exception):
+    pass
+
+
+# sent ahead of everything else and never held back by the throttle;
+# registration has to keep its PASS, NICK, USER order so all three are here
+CONTROL_COMMANDS = frozenset(['PONG', 'QUIT', 'NICK', 'CAP', 'PASS', 'USER', 'AUTHENTICATE'])
+
+
+def default_priority(command):
+    return Priority.control if command in CONTROL_COMMANDS else Priority.normal
+
+
+def _wakeup(waiter):
+    if waiter is not None and not waiter.done():
+        waiter.set_result(True)
+
+
+class _Lane:
+    """FIFO per target, round robin across targets."""
+    __slots__ = ('_targets', '_size')
+
+    def __init__(self):
+        self._targets = collections.OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, entry, target):
+        lines = self._targets.get(target)
+        if lines is None:
+            lines = self._targets[target] = collections.deque()
+        lines.append(entry)
+        self._size += 1
+
+    def peek(self):
+        return next(iter(self._targets.values()))[0]
+
+    def popleft(self):
+        targets = self._targets
+        target, lines = next(iter(targets.items()))
+        entry = lines.popleft()
+        if lines:
+            targets.move_to_end(target)
+        else:
+            del targets[target]
+        self._size -= 1
+        return entry
+
+
+class SendQueue:
+    """SendQueue holds encoded lines waiting for the send loop.
+
+    Lines go into one of three lanes by Priority.  The control lane is
+    always served first and the bulk lane only when nothing else is
+    waiting.  Within a lane, lines are kept in FIFO order per target and
+    handed out round robin across targets, so one busy channel cannot
+    starve replies to everyone else.  Lines without a target share a
+    single slot in the rotation.
+
+    put_nowait() returns a future that the send loop resolves once the line
+    has been written to the transport.  put_many() queues several lines for
+    one target together, in order, with one future for all of them.
+
+    With a high_water mark set, queued bytes beyond it are handled by the
+    overflow policy: Overflow.raise_, the default, raises SendQueueFull,
+    Overflow.drop discards bulk lines (their delivery future is cancelled)
+    and Overflow.block keeps queueing but makes wait_writable() block
+    producers until the queue is back under the mark.  Only raise_ bounds
+    memory by itself; with block, every producer has to wait_writable()
+    before queueing.  Control lines are always queued.
+
+    hold() keeps the normal and bulk lanes from being served until
+    release(), for lines that must wait until the server has registered us.
+    """
+
+    def __init__(self, *, loop=None, high_water=None, overflow=Overflow.raise_):
+        self._loop = loop
+        self._lanes = [(priority, _Lane()) for priority in Priority]
+        self._size = 0
+        self._waiter = None
+        self._control_waiter = None
+        self._writable_waiters = collections.deque()
+        self.high_water = high_water
+        self.overflow = overflow
+        self.queued_bytes = 0
+        self.dropped_lines = 0
+        self.held = False
+
+    def __len__(self):
+        return self._size
+
+    def _ready_lanes(self):
+        return self._lanes[:1] if self.held else self._lanes
+
+    def empty(self):
+        """empty() is true when get_nowait() has nothing to return."""
+        if self.held:
+            return not self.depth(Priority.control)
+        return not self._size
+
+    def depth(self, priority):
+        return len(self._lanes[priority - 1][1])
+
+    def is_full(self):
+        return self.high_water is not None and self.queued_bytes >= self.high_water
+
+    def put_nowait(self, raw, target=None, priority=Priority.normal):
+        if (self.high_water is not None and priority is not Priority.control and
+                self.queued_bytes + len(raw) > self.high_water):
+            if self.overflow is Overflow.raise_:
+                raise SendQueueFull(raw)
+            if self.overflow is Overflow.drop and priority is Priority.bulk:
+                self.dropped_lines += 1
+                delivery = asyncio.Future(loop=self._loop)
+                delivery.cancel()
+                return delivery
+
+        delivery = asyncio.Future(loop=self._loop)
+        self._lanes[priority - 1][1].append((raw, delivery), target)
+        self._size += 1
+        self.queued_bytes += len(raw)
+
+        waiter, self._waiter = self._waiter, None
+        _wakeup(waiter)
+        if priority is Priority.control:
+            waiter, self._control_waiter = self._control_waiter, None
+            _wakeup(waiter)
+        return delivery
+
+    def put_many(self, raws, target=None, priority=Priority.normal):
+        """Queue raws as separate lines, keeping their order.
+
+        The overflow policy applies to the lines together.  Returns a
+        future resolved once the last line has been written.
+        """
+        size = sum(len(raw) for raw in raws)
+        if (self.high_water is not None and priority is not Priority.control and
+                self.queued_bytes + size > self.high_water):
+            if self.overflow is Overflow.raise_:
+                raise SendQueueFull(raws)
+            if self.overflow is Overflow.drop and priority is Priority.bulk:
+                self.dropped_lines += len(raws)
+                delivery = asyncio.Future(loop=self._loop)
+                delivery.cancel()
+                return delivery
+
+        lane = self._lanes[priority - 1][1]
+        # lines to one target come out in order, so only the last needs a future
+        done = None
+        for raw in raws[:-1]:
+            lane.append((raw, done), target)
+        delivery = asyncio.Future(loop=self._loop)
+        lane.append((raws[-1], delivery), target)
+        self._size += len(raws)
+        self.queued_bytes += size
+
+        waiter, self._waiter = self._waiter, None
+        _wakeup(waiter)
+        if priority is Priority.control:
+            waiter, self._control_waiter = self._control_waiter, None
+            _wakeup(waiter)
+        return delivery
+
+    def hold(self):
+        """hold() serves only the control lane until release()."""
+        self.held = True
+
+    def release(self):
+        self.held = False
+        waiter, self._waiter = self._waiter, None
+        _wakeup(waiter)
+
+    def clear(self, exc):
+        """clear() drops every queued line, failing its delivery future with exc."""
+        for _, lane in self._lanes:
+            while lane:
+                _, delivery = lane.popleft()
+                if delivery is not None and not delivery.done():
+                    delivery.set_exception(exc)
+                    # most sends are never awaited; don't log each one as unhandled
+                    delivery.exception()
+        self._size = 0
+        self.queued_bytes = 0
+        while self._writable_waiters:
+            _wakeup(self._writable_waiters.popleft())
+
+    def next_priority(self):
+        """next_priority() returns the lane get_nowait() would take from."""
+        for priority, lane in self._ready_lanes():
+            if lane:
+                return priority
+        return None
+
+    def next_size(self):
+        """next_size() returns the length of the line get_nowait() would return."""
+        for _, lane in self._ready_lanes():
+            if lane:
+                return len(lane.peek()[0])
+        raise asyncio.QueueEmpty
+
+    def get_nowait(self):
+        """get_nowait() returns the next line and its delivery future."""
+        for _, lane in self._ready_lanes():
+            if lane:
+                self._size -= 1
+                entry = lane.popleft()
+                self.queued_bytes -= len(entry[0])
+                if self._writable_waiters and not self.is_full():
+                    while self._writable_waiters:
+                        _wakeup(self._writable_waiters.popleft())
+                return entry
+        raise asyncio.QueueEmpty
+
+    @asyncio.coroutine
+    def wait_writable(self):
+        """wait_writable() returns once the queue is under its high water mark."""
+        while self.is_full():
+            waiter = asyncio.Future(loop=self._loop)
+            self._writable_waiters.append(waiter)
+            yield from waiter
+
+    @asyncio.coroutine
+    def wait(self):
+        """wait() returns once there is something to send."""
+        while self.empty():
+            assert not self._waiter
+            self._waiter = asyncio.Future(loop=self._loop)
+            try:
+                yield from self._waiter
+            finally:
+                self._waiter = None
+
+    @asyncio.coroutine
+    def wait_control(self, timeout):
+        """wait_control() sleeps for timeout seconds, returning early if a
+        control line is queued."""
+        if self.depth(Priority.control):
+            return
+        waiter = self._control_waiter = asyncio.Future(loop=self._loop)
+        handle = self._loop.call_later(timeout, _wakeup, waiter)
+        try:
+            yield from waiter
+        finally:
+            handle.cancel()
+            self._control_waiter = None
+
+    @asyncio.coroutine
+    def get(self):
+        yield from self.wait()
+        return self.get_nowait()
@@ -0,0 +1,525 @@
+"""A small IRC server to run clients against over real sockets.
+
+It speaks enough of the protocol for IrcClient and IrcBot: registration,
+JOIN, PART, NAMES, PING and PRIVMSG/NOTICE to nicks and channels, with
+the usual numerics.  Fake users, which have no connection, fill channels
+and generate load: floods, netsplits, and a slow reading mode that pushes
+back on clients.  It is for tests and benchmarks, not for hosting; run
+``python -m irc.server --help`` to start one for a soak test.
+"""
+import asyncio
+import logging
+import socket
+import ssl as _ssl
+import irc.codes
+import irc.protocol
+
+IRC_LOG = logging.getLogger('irc.server')
+
+NETSPLIT_REASON = '*.net *.split'
+# a client that sends this much without a line ending is dropped
+MAX_BUFFER = 16384
+
+
+def tls_contexts(certfile):
+    """Server and client SSLContexts for certfile, a self-signed key and
+    certificate for localhost."""
+    server = _ssl.SSLContext(_ssl.PROTOCOL_SSLv23)
+    server.load_cert_chain(certfile)
+    client = _ssl.SSLContext(_ssl.PROTOCOL_SSLv23)
+    client.verify_mode = _ssl.CERT_REQUIRED
+    if hasattr(client, 'check_hostname'):
+        # 3.4 and later; before that asyncio matches the hostname itself
+        client.check_hostname = True
+    client.load_verify_locations(certfile)
+    return server, client
+
+
+class User:
+    """Someone on the server; fake users have no connection."""
+
+    def __init__(self, nick, username=None, host='localhost', connection=None):
+        self.nick = nick
+        self.username = username or nick
+        self.host = host
+        self.connection = connection
+        self.channels = set()
+
+    @property
+    def prefix(self):
+        return '{}!{}@{}'.format(self.nick, self.username, self.host)
+
+    @property
+    def fake(self):
+        return self.connection is None
+
+
+class _Connection(asyncio.Protocol):
+    transport = None
+    user = None
+    closed = False
+    _nick = None
+    _username = None
+
+    def __init__(self, server):
+        self.server = server
+        self.buffer = bytearray()
+        self.received_messages = 0
+        self.sent_bytes = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.add(self)
+        if self.server.read_delay:
+            # a small receive window makes the kernel push back quickly too
+            sock = transport.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.server.read_buffer)
+
+    def connection_lost(self, exc):
+        # an SSL transport counts as open until closed, even once the peer is gone
+        self.close()
+        self.server.connections.discard(self)
+        if self.user is not None:
+            self.server.quit(self.user, 'Connection closed')
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer.extend(data)
+        start = 0
+        end = buffer.find(irc.protocol.EOL)
+        while end >= 0:
+            end += 2
+            try:
+                message = irc.protocol.split_message_at(buffer, start, end)
+            except irc.protocol.ProtocolViolationError:
+                IRC_LOG.debug('Ignoring malformed line {!r}'.format(bytes(buffer[start:end])))
+            else:
+                self.received_messages += 1
+                self.server.handle(self, message)
+            start = end
+            end = buffer.find(irc.protocol.EOL, start)
+        del buffer[:start]
+        if len(buffer) > MAX_BUFFER:
+            self.close()
+            return
+        delay = self.server.read_delay
+        if delay and not self.closed:
+            # read one chunk per delay so the client's writes back up
+            self.transport.pause_reading()
+            self.server.loop.call_later(delay, self._resume_reading)
+
+    def _resume_reading(self):
+        if not self.closed:
+            self.transport.resume_reading()
+
+    def write(self, data):
+        if not self.closed:
+            self.transport.write(data)
+            self.sent_bytes += len(data)
+
+    def close(self):
+        self.closed = True
+        self.transport.close()
+
+
+class FakeServer:
+    """An IRC server for load and soak tests.
+
+    start() listens on an ephemeral localhost port unless given one, and
+    with ssl serves TLS.  Set read_delay to read from clients only once
+    per that many seconds, through a socket receive buffer of read_buffer
+    bytes, so their transports fill and pause writing.  max_targets is the
+    TARGMAX advertised, and enforced, for PRIVMSG and NOTICE; None
+    advertises nothing and takes one target at a time.
+    """
+
+    def __init__(self, *, loop=None, name='irc.test', network='TestNet',
+                 read_delay=None, read_buffer=4096, max_targets=4, motd=('Welcome to the test server',)):
+        self.loop = loop or asyncio.get_event_loop()
+        self.name = name
+        self.network = network
+        self.read_delay = read_delay
+        self.read_buffer = read_buffer
+        self.motd = motd
+        self.max_targets = max_targets
+        self.users = {}
+        self.channels = {}
+        self.connections = set()
+        self.listeners = []
+        self.port = None
+        self._server = None
+        self._fake_count = 0
+        self.handlers = {
+            'NICK': self.handle_nick,
+            'USER': self.handle_user,
+            'PASS': self.handle_pass,
+            'PING': self.handle_ping,
+            'PONG': self.handle_pong,
+            'JOIN': self.handle_join,
+            'PART': self.handle_part,
+            'NAMES': self.handle_names,
+            'PRIVMSG': self.handle_privmsg,
+            'NOTICE': self.handle_privmsg,
+            'QUIT': self.handle_quit,
+        }
+
+    @asyncio.coroutine
+    def start(self, host='127.0.0.1', port=0, ssl=None):
+        self._server = yield from self.loop.create_server(lambda: _Connection(self), host, port, ssl=ssl)
+        self.port = self._server.sockets[0].getsockname()[1]
+        IRC_LOG.debug('Serving IRC on {}:{}'.format(host, self.port))
+        return self
+
+    @asyncio.coroutine
+    def close(self):
+        self._server.close()
+        for connection in list(self.connections):
+            connection.close()
+        yield from self._server.wait_closed()
+
+    def add_listener(self, f):
+        """Call f(user, message) for every message a client sends; user is
+        None before registration."""
+        self.listeners.append(f)
+
+    def stats(self):
+        connections = self.connections
+        return {
+            'connections': len(connections),
+            'users': len(self.users),
+            'channels': len(self.channels),
+            'received_messages': sum(c.received_messages for c in connections),
+            'sent_bytes': sum(c.sent_bytes for c in connections),
+        }
+
+    # sending
+
+    def send(self, user, command, params, prefix=None):
+        if user.connection is not None:
+            user.connection.write(self._encode(command, params, prefix))
+
+    def numeric(self, connection, code, *params):
+        nick = connection.user.nick if connection.user else (connection._nick or '*')
+        connection.write(self._encode(code, [nick] + list(params), self.name))
+
+    def _encode(self, command, params, prefix):
+        return irc.protocol.RawMessage(command, params, prefix).encode()
+
+    def broadcast(self, channel, command, params, prefix, exclude=None):
+        """Send one message to every connected member of channel, encoding it once."""
+        data = self._encode(command, params, prefix)
+        for member in self.channels.get(channel, ()):
+            if member is not exclude and member.connection is not None:
+                member.connection.write(data)
+
+    def _neighbours(self, user):
+        """Connected users sharing a channel with user, each once."""
+        seen = set()
+        for channel in user.channels:
+            for member in self.channels[channel]:
+                if member is not user and member.connection is not None:
+                    seen.add(member)
+        return seen
+
+    # dispatch
+
+    def handle(self, connection, message):
+        for listener in self.listeners:
+            listener(connection.user, message)
+        handler = self.handlers.get(message.command.upper())
+        if handler is None:
+            if connection.user is not None:
+                self.numeric(connection, irc.codes.ERR_UNKNOWNCOMMAND, message.command, 'Unknown command')
+        elif connection.user is None and message.command.upper() not in ('NICK', 'USER', 'PASS', 'PING', 'QUIT'):
+            self.numeric(connection, irc.codes.ERR_NOTREGISTERED, 'You have not registered')
+        else:
+            handler(connection, message)
+
+    def handle_pass(self, connection, message):
+        pass
+
+    def handle_nick(self, connection, message):
+        if not message.params:
+            self.numeric(connection, irc.codes.ERR_NONICKNAMEGIVEN, 'No nickname given')
+            return
+        nick = message.params[0]
+        if not nick or nick[0] in '#&:0123456789' or ' ' in nick:
+            self.numeric(connection, irc.codes.ERR_ERRONEUSNICKNAME, nick, 'Erroneous nickname')
+            return
+        if nick in self.users:
+            self.numeric(connection, irc.codes.ERR_NICKNAMEINUSE, nick, 'Nickname is already in use')
+            return
+        user = connection.user
+        if user is None:
+            connection._nick = nick
+            self._try_register(connection)
+            return
+        prefix = user.prefix
+        for member in self._neighbours(user):
+            self.send(member, 'NICK', [nick], prefix)
+        self.send(user, 'NICK', [nick], prefix)
+        # channels hold users, so only the nick index changes
+        del self.users[user.nick]
+        user.nick = nick
+        self.users[nick] = user
+
+    def handle_user(self, connection, message):
+        if connection.user is not None:
+            self.numeric(connection, irc.codes.ERR_ALREADYREGISTRED, 'You may not reregister')
+            return
+        if len(message.params) < 4:
+            self.numeric(connection, irc.codes.ERR_NEEDMOREPARAMS, 'USER', 'Not enough parameters')
+            return
+        connection._username = message.params[0]
+        self._try_register(connection)
+
+    def _try_register(self, connection):
+        nick = connection._nick
+        if nick is None or connection._username is None:
+            return
+        if nick in self.users:
+            connection._nick = None
+            self.numeric(connection, irc.codes.ERR_NICKNAMEINUSE, nick, 'Nickname is already in use')
+            return
+        user = connection.user = User(nick, connection._username, connection=connection)
+        self.users[nick] = user
+        self.numeric(connection, irc.codes.RPL_WELCOME,
+                     'Welcome to the {} IRC Network {}'.format(self.network, user.prefix))
+        self.numeric(connection, irc.codes.RPL_YOURHOST, 'Your host is {}'.format(self.name))
+        self.numeric(connection, irc.codes.RPL_CREATED, 'This server was created for testing')
+        self.numeric(connection, irc.codes.RPL_MYINFO, self.name, 'fake', 'i', 'nt')
+        self.numeric(connection, irc.codes.RPL_ISUPPORT, *(self.isupport() + ['are supported by this server']))
+        self.numeric(connection, irc.codes.RPL_MOTDSTART, '- {} Message of the day -'.format(self.name))
+        for line in self.motd:
+            self.numeric(connection, irc.codes.RPL_MOTD, '- ' + line)
+        self.numeric(connection, irc.codes.RPL_ENDOFMOTD, 'End of MOTD command')
+
+    def isupport(self):
+        tokens = ['NETWORK={}'.format(self.network), 'CHANTYPES=#&']
+        if self.max_targets is not None:
+            tokens.append('TARGMAX=PRIVMSG:{0},NOTICE:{0}'.format(self.max_targets))
+        return tokens
+
+    def handle_ping(self, connection, message):
+        if not message.params:
+            self.numeric(connection, irc.codes.ERR_NOORIGIN, 'No origin specified')
+            return
+        connection.write(self._encode('PONG', [self.name, message.params[0]], self.name))
+
+    def handle_pong(self, connection, message):
+        pass
+
+    def handle_join(self, connection, message):
+        if not message.params:
+            self.numeric(connection, irc.codes.ERR_NEEDMOREPARAMS, 'JOIN', 'Not enough parameters')
+            return
+        for channel in message.params[0].split(','):
+            if not channel.startswith(('#', '&')):
+                self.numeric(connection, irc.codes.ERR_NOSUCHCHANNEL, channel, 'No such channel')
+                continue
+            self.join(connection.user, channel)
+
+    def join(self, user, channel):
+        members = self.channels.setdefault(channel, set())
+        if user in members:
+            return
+        members.add(user)
+        user.channels.add(channel)
+        self.broadcast(channel, 'JOIN', [channel], user.prefix)
+        if user.connection is not None:
+            self._names(user.connection, channel)
+
+    def handle_part(self, connection, message):
+        if not message.params:
+            self.numeric(connection, irc.codes.ERR_NEEDMOREPARAMS, 'PART', 'Not enough parameters')
+            return
+        reason = message.params[1:]
+        for channel in message.params[0].split(','):
+            if channel not in self.channels:
+                self.numeric(connection, irc.codes.ERR_NOSUCHCHANNEL, channel, 'No such channel')
+            elif channel not in connection.user.channels:
+                self.numeric(connection, irc.codes.ERR_NOTONCHANNEL, channel, "You're not on that channel")
+            else:
+                self.part(connection.user, channel, *reason)
+
+    def part(self, user, channel, *reason):
+        self.broadcast(channel, 'PART', [channel] + list(reason), user.prefix)
+        self._leave(user, channel)
+
+    def _leave(self, user, channel):
+        user.channels.discard(channel)
+        members = self.channels[channel]
+        members.discard(user)
+        if not members:
+            del self.channels[channel]
+
+    def handle_names(self, connection, message):
+        channels = message.params[0].split(',') if message.params else sorted(connection.user.channels)
+        for channel in channels:
+            self._names(connection, channel)
+
+    def _names(self, connection, channel):
+        nicks = sorted(member.nick for member in self.channels.get(channel, ()))
+        # as many nicks per reply as fit in a line
+        prefix = ':{} {} {} = {} :'.format(self.name, irc.codes.RPL_NAMREPLY, connection.user.nick, channel)
+        room = irc.protocol.MAX_LINE_LENGTH - len(prefix.encode('utf-8')) - 2
+        batch = []
+        size = 0
+        for nick in nicks:
+            if batch and size + len(nick) + 1 > room:
+                self.numeric(connection, irc.codes.RPL_NAMREPLY, '=', channel, ' '.join(batch))
+                batch = []
+                size = 0
+            batch.append(nick)
+            size += len(nick) + 1
+        if batch:
+            self.numeric(connection, irc.codes.RPL_NAMREPLY, '=', channel, ' '.join(batch))
+        self.numeric(connection, irc.codes.RPL_ENDOFNAMES, channel, 'End of NAMES list')
+
+    def handle_privmsg(self, connection, message):
+        command = message.command.upper()
+        if not message.params:
+            self.numeric(connection, irc.codes.ERR_NORECIPIENT, 'No recipient given ({})'.format(command))
+            return
+        if len(message.params) < 2:
+            self.numeric(connection, irc.codes.ERR_NOTEXTTOSEND, 'No text to send')
+            return
+        user = connection.user
+        targets = message.params[0].split(',')
+        if len(targets) > (self.max_targets or 1):
+            self.numeric(connection, irc.codes.ERR_TOOMANYTARGETS, message.params[0],
+                         'Too many recipients')
+            return
+        for target in targets:
+            if target.startswith(('#', '&')):
+                if target not in self.channels:
+                    self.numeric(connection, irc.codes.ERR_NOSUCHCHANNEL, target, 'No such channel')
+                elif target not in user.channels:
+                    self.numeric(connection, irc.codes.ERR_CANNOTSENDTOCHAN, target, 'Cannot send to channel')
+                else:
+                    self.broadcast(target, command, [target, message.params[1]], user.prefix, exclude=user)
+            elif target in self.users:
+                self.send(self.users[target], command, [target, message.params[1]], user.prefix)
+            else:
+                self.numeric(connection, irc.codes.ERR_NOSUCHNICK, target, 'No such nick/channel')
+
+    def handle_quit(self, connection, message):
+        connection.write(self._encode('ERROR', ['Closing Link'], None))
+        connection.close()
+
+    def quit(self, user, reason):
+        """Remove user, telling everyone who shares a channel with them."""
+        prefix = user.prefix
+        for member in self._neighbours(user):
+            self.send(member, 'QUIT', [reason], prefix)
+        for channel in list(user.channels):
+            self._leave(user, channel)
+        if self.users.get(user.nick) is user:
+            del self.users[user.nick]
+
+    # load generation
+
+    def add_users(self, count, channels=(), prefix='user'):
+        """Add count fake users, joined to channels; returns them."""
+        users = []
+        for _ in range(count):
+            self._fake_count += 1
+            nick = '{}{}'.format(prefix, self._fake_count)
+            user = self.users[nick] = User(nick, host='fake.test')
+            for channel in channels:
+                self.join(user, channel)
+            users.append(user)
+        return users
+
+    def fake_users(self, channel=None):
+        users = self.channels.get(channel, ()) if channel is not None else self.users.values()
+        return sorted((user for user in users if user.fake), key=lambda user: user.nick)
+
+    @asyncio.coroutine
+    def flood(self, target, rate, count, users=None, text='flood message {}', tick=0.01):
+        """Send count PRIVMSGs to target at rate messages per second.
+
+        The senders take turns from users, by default the fake users in
+        target.  Messages due in the same tick go out together.
+        """
+        users = users or self.fake_users(target if target.startswith(('#', '&')) else None)
+        if not users:
+            raise ValueError('no users to flood {} from'.format(target))
+        recipient = self.users.get(target)
+        start = self.loop.time()
+        sent = 0
+        while sent < count:
+            due = min(count, int((self.loop.time() - start) * rate) + 1)
+            while sent < due:
+                user = users[sent % len(users)]
+                params = [target, text.format(sent)]
+                if recipient is not None:
+                    self.send(recipient, 'PRIVMSG', params, user.prefix)
+                else:
+                    self.broadcast(target, 'PRIVMSG', params, user.prefix)
+                sent += 1
+            if sent < count:
+                yield from asyncio.sleep(tick, loop=self.loop)
+        return sent
+
+    @asyncio.coroutine
+    def netsplit(self, users=None, rejoin_after=1.0):
+        """Split users, by default every fake user, off the network and
+        bring them back into their channels after rejoin_after seconds."""
+        users = users if users is not None else self.fake_users()
+        channels = {user: list(user.channels) for user in users}
+        for user in users:
+            self.quit(user, NETSPLIT_REASON)
+        if rejoin_after is None:
+            return
+        yield from asyncio.sleep(rejoin_after, loop=self.loop)
+        for user in users:
+            self.users[user.nick] = user
+            for channel in channels[user]:
+                self.join(user, channel)
+
+    @asyncio.coroutine
+    def netsplit_storm(self, splits, interval, fraction=0.5, rejoin_after=None):
+        """Split and rejoin a fraction of the fake users splits times,
+        one split every interval seconds."""
+        rejoin_after = interval / 2 if rejoin_after is None else rejoin_after
+        for n in range(splits):
+            users = self.fake_users()
+            size = max(1, int(len(users) * fraction))
+            offset = (n * size) % max(1, len(users))
+            chosen = (users[offset:] + users[:offset])[:size]
+            yield from self.netsplit(chosen, rejoin_after)
+            yield from asyncio.sleep(max(0, interval - rejoin_after), loop=self.loop)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a fake IRC server for load testing.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--certfile', help='serve TLS with this key and certificate')
+    parser.add_argument('--users', type=int, default=0, help='fake users to put in --channel')
+    parser.add_argument('--channel', default='#load')
+    parser.add_argument('--rate', type=float, default=0, help='messages per second from the fake users')
+    parser.add_argument('--read-delay', type=float, help='seconds between reads from each client')
+    args = parser.parse_args(argv)
+
+    loop = asyncio.get_event_loop()
+    server = FakeServer(loop=loop, read_delay=args.read_delay)
+    ssl = tls_contexts(args.certfile)[0] if args.certfile else None
+    loop.run_until_complete(server.start(args.host, args.port, ssl=ssl))
+    if args.users:
+        server.add_users(args.users, [args.channel])
+        if args.rate:
+            asyncio.async(server.flood(args.channel, args.rate, float('inf')), loop=loop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+
+
+if __name__ == '__main__':
+    main()
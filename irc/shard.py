@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import struct
+import zlib
+import irc.manager
+import irc.messages
+
+IRC_LOG = logging.getLogger('irc')
+
+
+class WorkerError(Exception):
+    """A shard worker failed a request or died before answering it."""
+
+
+def shard_by_hash(name, network, workers):
+    return zlib.crc32(name.encode('utf-8')) % workers
+
+
+class ShardByNetwork:
+    """Keeps each network on one worker, handing out workers round robin."""
+
+    def __init__(self):
+        self._networks = {}
+
+    def __call__(self, name, network, workers):
+        if network not in self._networks:
+            self._networks[network] = len(self._networks) % workers
+        return self._networks[network]
+
+
+_HEADER = struct.Struct('!Q')
+
+
+class _Channel(asyncio.Protocol):
+    """Pickled objects over a stream socket, each after its 8 byte length.
+
+    Both ends of the control socket speak it.  send() never blocks: the
+    transport buffers what the other end has not read yet, and before the
+    connection is made, send() keeps the frames itself.
+    """
+
+    transport = None
+
+    def __init__(self, on_message, on_lost):
+        self.on_message = on_message
+        self.on_lost = on_lost
+        self._buffer = bytearray()
+        self._unsent = []
+        self._closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self._closed:
+            transport.close()
+            return
+        if self._unsent:
+            transport.write(b''.join(self._unsent))
+            self._unsent = []
+
+    def data_received(self, data):
+        buffer = self._buffer
+        buffer += data
+        start = 0
+        while len(buffer) - start >= _HEADER.size:
+            size, = _HEADER.unpack_from(buffer, start)
+            end = start + _HEADER.size + size
+            if len(buffer) < end:
+                break
+            obj = pickle.loads(bytes(buffer[start + _HEADER.size:end]))
+            start = end
+            self.on_message(obj)
+        del buffer[:start]
+
+    def connection_lost(self, exc):
+        self.on_lost()
+
+    def send(self, obj):
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        frame = _HEADER.pack(len(data)) + data
+        if self.transport is None:
+            self._unsent.append(frame)
+        elif not self._closed:
+            self.transport.write(frame)
+
+    def close(self):
+        self._closed = True
+        self._unsent = []
+        if self.transport is not None:
+            self.transport.close()
+
+
+def _open_channel(loop, sock, on_message, on_lost):
+    """A _Channel over sock, usable right away."""
+    channel = _Channel(on_message, on_lost)
+    asyncio.async(loop.create_connection(lambda: channel, sock=sock), loop=loop)
+    return channel
+
+
+class _Worker:
+    """The worker process side of the control socket."""
+
+    def __init__(self, manager, sock):
+        self.manager = manager
+        self.stopped = asyncio.Future(loop=manager.loop)
+        self.channel = _open_channel(manager.loop, sock, self.on_command, self.on_lost)
+
+    def on_command(self, request):
+        request_id, op, args = request
+        try:
+            result = getattr(self, 'op_' + op)(*args)
+        except Exception as e:
+            self.channel.send((request_id, False, repr(e)))
+        else:
+            self.channel.send((request_id, True, result))
+
+    def on_lost(self):
+        # the supervisor is gone
+        if not self.stopped.done():
+            self.stopped.set_result(None)
+
+    def op_add(self, spec):
+        self.manager.add(**spec)
+        asyncio.async(self.manager.start(), loop=self.manager.loop)
+
+    def op_join(self, name, channel):
+        self.manager[name].send_message(irc.messages.Join(channel))
+
+    def op_part(self, name, channel):
+        self.manager[name].send_message(irc.messages.Part(channel))
+
+    def op_send(self, name, target, message):
+        self.manager[name].send_privmsg(target, message)
+
+    def op_send_raw(self, name, raw):
+        self.manager[name].send_raw(raw)
+
+    def op_stats(self):
+        stats = self.manager.stats()
+        stats['pid'] = os.getpid()
+        return stats
+
+    def op_stop(self):
+        if not self.stopped.done():
+            self.stopped.set_result(None)
+
+
+def _worker_main(sock, specs, setup, options):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = irc.manager.ClientManager(loop=loop, **options)
+    if setup is not None:
+        setup(manager)
+    for spec in specs:
+        manager.add(**spec)
+    worker = _Worker(manager, sock)
+    asyncio.async(manager.start(), loop=loop)
+    try:
+        loop.run_until_complete(worker.stopped)
+        loop.run_until_complete(manager.quit())
+    finally:
+        loop.close()
+
+
+class _WorkerHandle:
+    __slots__ = ('index', 'process', 'channel', 'pending', 'restarts')
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.channel = None
+        self.pending = {}
+        self.restarts = 0
+
+
+class ShardSupervisor:
+    """Spreads bot connections over worker processes, one loop in each.
+
+    Every worker runs a ClientManager built from the supervisor's keyword
+    arguments.  setup, a picklable function, is called with each worker's
+    manager to register handlers.  shard_by picks the worker for a
+    connection: 'hash' spreads connections evenly by name, 'network' keeps
+    a network's connections together, or pass a function of
+    (name, network, workers).
+
+    Crashed workers are restarted after restart_delay seconds with the
+    connections they were given.  Commands and stats go over a socket to
+    each worker.  Requests are written without blocking, so a worker that
+    is slow to read its socket does not stall the supervisor's loop.
+    """
+
+    def __init__(self, workers=None, *, shard_by='hash', setup=None, loop=None, restart_delay=1.0, **options):
+        self.loop = loop or asyncio.get_event_loop()
+        if shard_by == 'hash':
+            shard_by = shard_by_hash
+        elif shard_by == 'network':
+            shard_by = ShardByNetwork()
+        self.shard_by = shard_by
+        self.setup = setup
+        self.restart_delay = restart_delay
+        self.options = options
+        self._workers = [_WorkerHandle(i) for i in range(workers or os.cpu_count() or 1)]
+        self._specs = [[] for _ in self._workers]
+        self._placement = {}
+        self._request_ids = 0
+        self._stopping = False
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    def worker_for(self, name):
+        return self._placement[name]
+
+    def add(self, name, host, nick, network=None, **kwargs):
+        """Place a connection on a worker, connecting it if already running."""
+        if name in self._placement:
+            raise ValueError('{} is already managed'.format(name))
+        index = self.shard_by(name, network or host, len(self._workers))
+        spec = dict(kwargs, name=name, host=host, nick=nick)
+        self._placement[name] = index
+        self._specs[index].append(spec)
+        if self._workers[index].process is not None:
+            return self._request(index, 'add', spec)
+
+    def start(self):
+        for worker in self._workers:
+            self._spawn(worker)
+
+    def _spawn(self, worker):
+        if self._stopping:
+            return
+        parent_sock, child_sock = socket.socketpair()
+        process = multiprocessing.Process(
+            target=_worker_main, args=(child_sock, self._specs[worker.index], self.setup, self.options),
+            name='irc-shard-{}'.format(worker.index), daemon=True)
+        process.start()
+        child_sock.close()
+        worker.process = process
+        worker.channel = _open_channel(self.loop, parent_sock, lambda reply: self._on_reply(worker, reply),
+                                       lambda: None)
+        self.loop.add_reader(process.sentinel, self._on_exit, worker)
+
+    def _on_reply(self, worker, reply):
+        request_id, ok, result = reply
+        future = worker.pending.pop(request_id, None)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(WorkerError(result))
+
+    def _on_exit(self, worker):
+        process = worker.process
+        self.loop.remove_reader(process.sentinel)
+        process.join()
+        worker.channel.close()
+        worker.process = worker.channel = None
+        pending, worker.pending = worker.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(WorkerError('worker {} exited'.format(worker.index)))
+        if self._stopping:
+            return
+        worker.restarts += 1
+        IRC_LOG.warn('Shard worker {} exited with {}, restarting'.format(worker.index, process.exitcode))
+        self.loop.call_later(self.restart_delay, self._spawn, worker)
+
+    def _request(self, index, op, *args):
+        worker = self._workers[index]
+        future = asyncio.Future(loop=self.loop)
+        if worker.channel is None:
+            future.set_exception(WorkerError('worker {} is not running'.format(index)))
+            return future
+        self._request_ids += 1
+        worker.pending[self._request_ids] = future
+        worker.channel.send((self._request_ids, op, args))
+        return future
+
+    def join(self, name, channel):
+        return self._request(self._placement[name], 'join', name, channel)
+
+    def part(self, name, channel):
+        return self._request(self._placement[name], 'part', name, channel)
+
+    def send(self, name, target, message):
+        return self._request(self._placement[name], 'send', name, target, message)
+
+    def send_raw(self, name, raw):
+        return self._request(self._placement[name], 'send_raw', name, raw)
+
+    @asyncio.coroutine
+    def stats(self):
+        """Each worker's manager stats, with its pid, restarts and connections."""
+        results = yield from asyncio.gather(
+            *[self._request(worker.index, 'stats') for worker in self._workers],
+            loop=self.loop, return_exceptions=True)
+        stats = []
+        for worker, result in zip(self._workers, results):
+            if isinstance(result, Exception):
+                result = {'error': str(result)}
+            result['restarts'] = worker.restarts
+            result['connections'] = len(self._specs[worker.index])
+            stats.append(result)
+        return stats
+
+    @asyncio.coroutine
+    def stop(self, timeout=5):
+        """Ask every worker to quit its connections and exit."""
+        self._stopping = True
+        running = [worker for worker in self._workers if worker.channel is not None]
+        for worker in running:
+            worker.channel.send((None, 'stop', ()))
+        deadline = self.loop.time() + timeout
+        # _on_exit reaps each worker as its sentinel becomes readable
+        while any(worker.process for worker in running) and self.loop.time() < deadline:
+            yield from asyncio.sleep(0.01, loop=self.loop)
+        for worker in running:
+            if worker.process is not None:
+                worker.process.terminate()
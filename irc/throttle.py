@@ -0,0 +1,73 @@
+import random
+import time
+
+
+class TokenBucket:
+    """TokenBucket lets `burst` lines through at once, then `rate` per second.
+
+    This is the flood model most ircds use: every line costs a token, tokens
+    come back at a fixed rate and at most `burst` of them can be saved up.
+
+    Any object with delay() and consume() methods can be given to
+    IrcClient as its rate_limiter instead.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._updated = clock()
+
+    @classmethod
+    def from_interval(cls, interval, burst=1, clock=time.monotonic):
+        """Build a bucket that allows one line every interval seconds."""
+        return cls(1 / interval, burst, clock)
+
+    @property
+    def tokens(self):
+        self._refill()
+        return self._tokens
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, n=1):
+        """delay() returns how long until n lines may be sent."""
+        self._refill()
+        missing = n - self._tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, n=1):
+        """consume() takes n tokens, going into debt if there are not enough."""
+        self._refill()
+        self._tokens -= n
+
+
+class Backoff:
+    """Backoff gives exponentially growing delays with random jitter.
+
+    Each delay is picked from the top `jitter` fraction of
+    initial * factor ** attempt, capped at maximum, so that many clients
+    dropped by the same netsplit do not all come back at once.
+    """
+
+    def __init__(self, initial=1.0, maximum=300.0, factor=2.0, jitter=0.5, random=random.random):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self._random = random
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.initial * self.factor ** self.attempts, self.maximum)
+        self.attempts += 1
+        return delay * (1 - self.jitter * self._random())
+
+    def reset(self):
+        self.attempts = 0
@@ -2,6 +2,7 @@ import functools
 import asyncio
 import irc.messages
 import irc.command
+import irc.profile
 
 
 def admin_command_handler(admin_check, f):
@@ -28,6 +29,7 @@ class Admin:
         self.handles_admin_command('part', ['channel'])(part)
         self.handles_admin_command('quit')(quit)
         self.handles_admin_command('raw', ['raw_string'], irc.command.LastParamType.string)(raw)
+        self.handles_admin_command('profile', ['seconds', 'limit'], default_values=['10', '10'])(profile)
 
     @property
     def owner(self):
@@ -39,10 +41,10 @@ class Admin:
     def is_admin(self, nick):
         return self.owner is not None and nick == self.owner
 
-    def handles_admin_command(self, command, params=None, last_collects=False):
+    def handles_admin_command(self, command, params=None, last_collects=False, default_values=None):
         def decorator(f):
             f = admin_command_handler(self.is_admin, f)
-            self.bot.add_command_handler(command, f, params, last_collects=last_collects)
+            self.bot.add_command_handler(command, f, params, last_collects=last_collects, default_values=default_values)
             return f
         return decorator
 
@@ -70,4 +72,29 @@ def quit(bot, command):
 
 @asyncio.coroutine
 def raw(bot, command):
-    return bot.send_raw(bytes(command.params.raw_string + '\r\n', encoding='utf8'))
\ No newline at end of file
+    return bot.send_raw(bytes(command.params.raw_string + '\r\n', encoding='utf8'))
+
+
+@asyncio.coroutine
+def profile(bot, command):
+    """Run cProfile for SECONDS and reply with the top LIMIT functions
+
+    cProfile is deterministic, it traces every call, so the bot runs slower
+    while it is on.
+    """
+    try:
+        seconds = float(command.params.seconds)
+        limit = int(command.params.limit)
+    except ValueError:
+        seconds = limit = 0
+    if seconds <= 0 or limit <= 0:
+        yield from command.reply(bot, 'Usage: profile [SECONDS] [LIMIT]')
+        return
+    # profile_for() raises RuntimeError when a profile is running; nothing
+    # yields between this check and it starting, so no other one can start
+    if irc.profile.is_profiling():
+        yield from command.reply(bot, 'profile already running')
+        return
+    command.reply(bot, 'Profiling for {0}s'.format(seconds))
+    for line in (yield from irc.profile.profile_for(seconds, loop=bot.loop, limit=limit)):
+        yield from command.reply(bot, line)
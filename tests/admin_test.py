@@ -5,6 +5,7 @@ import irc.bot
 import irc.command
 import irc.parser
 import irc.messages
+import irc.profile
 import irc_admin
 import tests.utils
 
@@ -105,7 +106,8 @@ class TestAdmin(unittest.TestCase):
         self.loop.run_until_complete(start_task)
         quit_task = irc_admin.quit(b, irc.command.Command('Nick', 'quit', '#chan', []))
         self.loop.run_until_complete(quit_task)
-        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(irc.messages.Quit().encode()))
+        self.assertEquals(transport.mock_calls[-2:], [unittest.mock.call.write(irc.messages.Quit().encode()),
+                                                      unittest.mock.call.close()])
 
     def test_raw(self):
         stream = irc.parser.StreamProtocol(loop=self.loop)
@@ -121,3 +123,58 @@ class TestAdmin(unittest.TestCase):
         self.loop.run_until_complete(b._read_handler)
         self.loop.run_until_complete(asyncio.Task(b.tasks.join(), loop=self.loop))
         self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(b'PRIVMSG target the string baby\r\n'))
+
+    def test_profile(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.messages.PrivMsg('#channel', ';profile 0.01 3', prefix='admin!Admin@admin.com').encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        b = irc.IrcBot('irc.example.com', 'TulipBot', loop=self.loop)
+        b.config['OWNER'] = 'admin'
+        irc_admin.Admin(b)
+        start_task = asyncio.Task(b.start(), loop=self.loop)
+        self.loop.run_until_complete(start_task)
+        self.loop.run_until_complete(b._read_handler)
+        self.loop.run_until_complete(asyncio.Task(b.tasks.join(), loop=self.loop))
+        tests.utils.run_briefly(self.loop)
+        lines = tests.utils.written_lines(transport)
+        self.assertEquals(lines[-4], irc.messages.PrivMsg('#channel', 'Profiling for 0.01s').encode())
+        self.assertTrue(all(line.startswith(b'PRIVMSG #channel :') for line in lines[-3:]))
+
+    def test_profile_already_running(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.messages.PrivMsg('#channel', ';profile 0.05 3', prefix='admin!Admin@admin.com').encode())
+        stream.feed_data(irc.messages.PrivMsg('#channel', ';profile 0.05 3', prefix='admin!Admin@admin.com').encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        b = irc.IrcBot('irc.example.com', 'TulipBot', loop=self.loop)
+        b.config['OWNER'] = 'admin'
+        irc_admin.Admin(b)
+        start_task = asyncio.Task(b.start(), loop=self.loop)
+        self.loop.run_until_complete(start_task)
+        self.loop.run_until_complete(b._read_handler)
+        self.loop.run_until_complete(asyncio.Task(b.tasks.join(), loop=self.loop))
+        tests.utils.run_briefly(self.loop)
+        lines = tests.utils.written_lines(transport)
+        self.assertEquals(lines.count(irc.messages.PrivMsg('#channel', 'Profiling for 0.05s').encode()), 1)
+        self.assertTrue(irc.messages.PrivMsg('#channel', 'profile already running').encode() in lines)
+        self.assertFalse(irc.profile.is_profiling())
+
+    def test_profile_bad_arguments(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.messages.PrivMsg('#channel', ';profile soon', prefix='admin!Admin@admin.com').encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        b = irc.IrcBot('irc.example.com', 'TulipBot', loop=self.loop)
+        b.config['OWNER'] = 'admin'
+        irc_admin.Admin(b)
+        start_task = asyncio.Task(b.start(), loop=self.loop)
+        self.loop.run_until_complete(start_task)
+        self.loop.run_until_complete(b._read_handler)
+        self.loop.run_until_complete(asyncio.Task(b.tasks.join(), loop=self.loop))
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(tests.utils.written_lines(transport)[-1],
+                          irc.messages.PrivMsg('#channel', 'Usage: profile [SECONDS] [LIMIT]').encode())
@@ -3,6 +3,7 @@ import unittest.mock
 import asyncio
 import irc.bot
 import irc.command
+import irc.executor
 import irc.messages
 import irc.protocol
 import irc.parser
@@ -10,6 +11,10 @@ import irc.codes
 import tests.utils
 
 
+def shout(command):
+    return [command.params.word.upper(), 'done']
+
+
 class TestBot(unittest.TestCase):
     def setUp(self):
         self.loop = asyncio.new_event_loop()
@@ -67,5 +72,25 @@ class TestBot(unittest.TestCase):
         self.loop.run_until_complete(b._read_handler)
         self.loop.run_until_complete(asyncio.Task(b.tasks.join(), loop=self.loop))
 
-        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(irc.messages.Join('b').encode()))
-        self.assertEquals(transport.mock_calls[-2], unittest.mock.call.write(irc.messages.Join('a').encode()))
\ No newline at end of file
+        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(irc.messages.Join('a').encode() +
+                                                                             irc.messages.Join('b').encode()))
+
+    def test_offloaded_command_replies(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.messages.PrivMsg('#chan', ';shout hello', prefix='Other!o@host').encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        b = irc.bot.IrcBot('irc.example.com', 'TulipBot', loop=self.loop, process_workers=1)
+        b.add_command_handler('shout', shout, ['word'], mode=irc.executor.Mode.process)
+        self.addCleanup(b.executor.shutdown, True)
+
+        self.loop.run_until_complete(b.start())
+        self.loop.run_until_complete(b._read_handler)
+        self.loop.run_until_complete(asyncio.Task(b.tasks.join(), loop=self.loop))
+        tests.utils.run_briefly(self.loop)
+
+        self.assertEquals(tests.utils.written_lines(transport)[-2:],
+                          [irc.messages.PrivMsg('#chan', 'HELLO').encode(),
+                           irc.messages.PrivMsg('#chan', 'done').encode()])
+        self.assertEquals(b.executor.stats()['process'].submitted, 1)
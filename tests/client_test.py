@@ -2,13 +2,21 @@ import unittest
 import asyncio
 import unittest.mock
 import irc.client
+import irc.executor
 import irc.messages
 import irc.protocol
 import irc.parser
 import irc.codes
+import irc.metrics
+import irc.throttle
+import irc.sendqueue
 import tests.utils
 
 
+def pong_back(message):
+    return irc.messages.Pong(message.params)
+
+
 class TestClient(unittest.TestCase):
     def setUp(self):
         self.loop = asyncio.new_event_loop()
@@ -39,8 +47,8 @@ class TestClient(unittest.TestCase):
     def test_register_on_connect(self):
         transport, _ = self.patch_connect()
         c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
-        expected = [unittest.mock.call.write(irc.messages.Nick('TestNick').encode()),
-                    unittest.mock.call.write(irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())]
+        expected = [unittest.mock.call(irc.messages.Nick('TestNick').encode() +
+                                       irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())]
 
         task = asyncio.Task(c.start(), loop=self.loop)
         self.loop.run_until_complete(task)
@@ -49,9 +57,9 @@ class TestClient(unittest.TestCase):
     def test_register_with_password_on_connect(self):
         transport, _ = self.patch_connect()
         c = irc.client.IrcClient('example.com', 'TestNick', password='testpass', loop=self.loop)
-        expected = [unittest.mock.call.write(irc.messages.Pass('testpass').encode()),
-                    unittest.mock.call.write(irc.messages.Nick('TestNick').encode()),
-                    unittest.mock.call.write(irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())]
+        expected = [unittest.mock.call(irc.messages.Pass('testpass').encode() +
+                                       irc.messages.Nick('TestNick').encode() +
+                                       irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())]
 
         task = asyncio.Task(c.start(), loop=self.loop)
         self.loop.run_until_complete(task)
@@ -64,13 +72,44 @@ class TestClient(unittest.TestCase):
 
         transport, _ = self.patch_connect(protocol=stream)
         c = irc.client.IrcClient('example.com', 'TestNick', password='testpass', loop=self.loop)
-        expected = unittest.mock.call.write(irc.messages.Pong(['12345']).encode())
+        expected = irc.messages.Pong(['12345']).encode()
+
+        task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(task)
+        self.loop.run_until_complete(c._read_handler)
+
+        self.assertEquals(tests.utils.written_lines(transport)[-1], expected)
+
+    def test_malformed_message_is_skipped(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(b'BAD\r\n' + irc.messages.Ping(['12345']).encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', password='testpass', loop=self.loop)
+        expected = irc.messages.Pong(['12345']).encode()
+
+        task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(task)
+        self.loop.run_until_complete(c._read_handler)
+
+        self.assertEquals(tests.utils.written_lines(transport)[-1], expected)
+
+    def test_handle_ping_with_buffered_protocol(self):
+        stream = irc.parser.BufferedStreamProtocol(loop=self.loop)
+        stream.data_received(irc.messages.Ping(['12345']).encode())
+        stream.eof_received()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop,
+                                 protocol_class=irc.parser.BufferedStreamProtocol)
+        expected = irc.messages.Pong(['12345']).encode()
 
         task = asyncio.Task(c.start(), loop=self.loop)
         self.loop.run_until_complete(task)
         self.loop.run_until_complete(c._read_handler)
 
-        self.assertEquals(transport.mock_calls[-1], expected)
+        self.assertEquals(tests.utils.written_lines(transport)[-1], expected)
 
     def test_handle_rpl_welcome(self):
         stream = irc.parser.StreamProtocol(loop=self.loop)
@@ -100,7 +139,7 @@ class TestClient(unittest.TestCase):
         self.loop.run_until_complete(task)
         self.loop.run_until_complete(c._read_handler)
 
-        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(irc.messages.Nick('TestNick_').encode()))
+        self.assertEquals(tests.utils.written_lines(transport)[-1], irc.messages.Nick('TestNick_').encode())
         self.assertEquals(c.attempted_nick, 'TestNick_')
 
     def test_handle_passwdmismatch_raises_error(self):
@@ -127,7 +166,7 @@ class TestClient(unittest.TestCase):
         self.loop.run_until_complete(task)
         self.loop.run_until_complete(c._read_handler)
 
-        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(irc.messages.Nick('TestNick_').encode()))
+        self.assertEquals(tests.utils.written_lines(transport)[-1], irc.messages.Nick('TestNick_').encode())
         self.assertEquals(c.attempted_nick, 'TestNick_')
 
     def test_set_nickname_on_matching_nickname(self):
@@ -155,6 +194,91 @@ class TestClient(unittest.TestCase):
         self.assertTrue(c._send_handler.cancelled())
         self.assertTrue(c._read_handler.cancelled())
 
+    def test_quit_fails_pending_deliveries(self):
+        transport, _ = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', throttle=10, loop=self.loop)
+        self.loop.run_until_complete(c.start())
+        tests.utils.run_briefly(self.loop)
+        delivery = c.send_privmsg('test', 'never sent')
+        self.loop.run_until_complete(c.quit())
+        self.assertRaises(ConnectionResetError, self.loop.run_until_complete, delivery)
+        self.assertEquals(c.send_queue_depth, 0)
+        self.assertNotIn(b'PRIVMSG test :never sent\r\n', tests.utils.written_lines(transport))
+
+    def test_finished_handler_leaves_tasks(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        slow = asyncio.Future(loop=self.loop)
+        fast = asyncio.Future(loop=self.loop)
+        for task in (slow, fast):
+            c.tasks.add(task)
+            task.add_done_callback(c.cleanup_handler_task)
+        fast.set_result(None)
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(len(c.tasks), 1)
+        self.assertTrue(slow in c.tasks)
+        join = asyncio.Task(c.tasks.join(), loop=self.loop)
+        tests.utils.run_briefly(self.loop)
+        self.assertFalse(join.done())
+        slow.set_result(None)
+        self.loop.run_until_complete(join)
+        self.assertEquals(len(c.tasks), 0)
+
+    def test_throttled_messages_are_not_coalesced(self):
+        transport, _ = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', throttle=0.001, loop=self.loop)
+        expected = [unittest.mock.call(irc.messages.Nick('TestNick').encode()),
+                    unittest.mock.call(irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())]
+
+        task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(task)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertEquals(transport.write.call_args_list, expected)
+
+    def test_throttle_burst(self):
+        transport, _ = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', throttle=10, throttle_burst=3, loop=self.loop)
+        task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(task)
+        for i in range(3):
+            c.send_privmsg('#chan', str(i))
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+
+        self.assertEquals(transport.write.call_count, 3)
+        self.assertEquals(c.send_queue_depth, 2)
+        self.assertTrue(19 < c.estimated_send_delay <= 20)
+
+    def test_pong_skips_throttle(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        transport, _ = self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', throttle=10, loop=self.loop)
+        task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(task)
+        for i in range(3):
+            c.send_privmsg('#chan', str(i))
+        tests.utils.run_briefly(self.loop)
+        stream.feed_data(irc.messages.Ping(['12345']).encode())
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+
+        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(irc.messages.Pong(['12345']).encode()))
+        self.assertEquals(c.send_queue_depth, 3)
+
+    def test_flush_is_capped(self):
+        transport, _ = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', password='testpass',
+                                 max_flush_bytes=30, loop=self.loop)
+        expected = [unittest.mock.call(irc.messages.Pass('testpass').encode() +
+                                       irc.messages.Nick('TestNick').encode()),
+                    unittest.mock.call(irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())]
+
+        task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(task)
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(transport.write.call_args_list, expected)
+
     def test_privmsg(self):
         transport, _ = self.patch_connect()
         c = irc.client.IrcClient('example.com', 'TestNick', password='testpass', loop=self.loop)
@@ -162,4 +286,443 @@ class TestClient(unittest.TestCase):
         self.loop.run_until_complete(start_task)
         msg = irc.messages.PrivMsg('test', 'a msg')
         self.loop.run_until_complete(c.send_privmsg('test', 'a msg'))
-        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(msg.encode()))
\ No newline at end of file
+        self.assertEquals(transport.mock_calls[-1], unittest.mock.call.write(msg.encode()))
+
+    def test_send_raw_resolves_on_write(self):
+        transport, _ = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        start_task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(start_task)
+        tests.utils.run_briefly(self.loop)
+        delivery = c.send_raw(b'PRIVMSG test :a msg\r\n')
+        self.assertFalse(isinstance(delivery, asyncio.Task))
+        self.assertFalse(delivery.done())
+        self.loop.run_until_complete(delivery)
+        self.assertEquals(tests.utils.written_lines(transport)[-1], b'PRIVMSG test :a msg\r\n')
+
+    def test_send_high_water_bounds_queue(self):
+        self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', throttle=10, send_high_water=1024,
+                                 loop=self.loop)
+        self.loop.run_until_complete(c.start())
+        tests.utils.run_briefly(self.loop)
+        rejected = 0
+        for _ in range(100):
+            try:
+                c.send_privmsg('test', 'x' * 100)
+            except irc.sendqueue.SendQueueFull:
+                rejected += 1
+        self.assertTrue(rejected > 0)
+        self.assertTrue(c.send_stats()['queued_bytes'] <= 1024)
+
+    def test_send_waits_while_writing_paused(self):
+        transport, protocol = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        start_task = asyncio.Task(c.start(), loop=self.loop)
+        self.loop.run_until_complete(start_task)
+        tests.utils.run_briefly(self.loop)
+        protocol.pause_writing()
+        delivery = c.send_privmsg('test', 'a msg')
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+        self.assertFalse(delivery.done())
+        self.assertEquals(c.send_stats()['queued_lines'], 1)
+
+        protocol.resume_writing()
+        self.loop.run_until_complete(delivery)
+        stats = c.send_stats()
+        self.assertEquals(stats['queued_lines'], 0)
+        self.assertEquals(stats['queued_bytes'], 0)
+        self.assertEquals(stats['pause_count'], 1)
+
+    def test_dispatch_message_without_handlers_returns_none(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.assertTrue(c.dispatch_message(irc.messages.PrivMsg('#chan', 'hi')) is None)
+
+    def test_handle_message_returns_future(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        seen = []
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def handler(client, message):
+            seen.append(message.params[1])
+
+        future = self.loop.run_until_complete(c.handle_message(irc.messages.PrivMsg('#chan', 'hi')))
+        self.loop.run_until_complete(future)
+        self.assertEquals(seen, ['hi'])
+        future = self.loop.run_until_complete(c.handle_message(irc.messages.Ping(['token'])))
+        self.assertTrue(future.done())
+
+    def test_dispatch_message_runs_added_handlers(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.assertTrue(c.dispatch_message(irc.messages.PrivMsg('#chan', 'hi')) is None)
+        seen = []
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def first(client, message):
+            seen.append(('first', message.params[1]))
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def second(client, message):
+            seen.append(('second', message.params[1]))
+
+        future = c.dispatch_message(irc.messages.PrivMsg('#chan', 'hi'))
+        self.loop.run_until_complete(future)
+        self.assertEquals(seen, [('first', 'hi'), ('second', 'hi')])
+
+    def test_builtin_and_added_handler_share_command(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        seen = []
+
+        @c.handles(irc.codes.RPL_WELCOME)
+        @asyncio.coroutine
+        def welcome(client, message):
+            seen.append(client.registered)
+
+        future = c.dispatch_message(irc.protocol.RawMessage(irc.codes.RPL_WELCOME, ['hello']))
+        self.loop.run_until_complete(future)
+        self.assertEquals(seen, [True])
+
+    def test_handler_cap_pauses_reading(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        for i in range(3):
+            stream.feed_data(irc.messages.PrivMsg('#chan', str(i)).encode())
+
+        transport, _ = self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', max_handlers=1, loop=self.loop)
+        release = asyncio.Future(loop=self.loop)
+        seen = []
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def slow(client, message):
+            seen.append(message.params[1])
+            yield from release
+
+        self.loop.run_until_complete(c.start())
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(seen, ['0'])
+        self.assertEquals(c.handler_stats()['in_flight'], 1)
+        transport.pause_reading.assert_called_once_with()
+        self.assertFalse(transport.resume_reading.called)
+
+        release.set_result(None)
+        stream.feed_eof()
+        self.loop.run_until_complete(c._read_handler)
+        self.assertEquals(seen, ['0', '1', '2'])
+        self.assertTrue(transport.resume_reading.called)
+        self.assertEquals(c.handler_stats()['waits'], 2)
+
+    def test_handler_cap_rejects_but_keeps_builtins(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.messages.Ping(['1']).encode())
+        stream.feed_data(irc.messages.Ping(['2']).encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', max_handlers_per_command=1,
+                                 reject_handlers=True, loop=self.loop)
+        release = asyncio.Future(loop=self.loop)
+
+        @c.handles('PING')
+        @asyncio.coroutine
+        def slow(client, message):
+            yield from release
+
+        self.loop.run_until_complete(c.start())
+        self.loop.run_until_complete(c._read_handler)
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(c.handler_stats()['rejected'], 1)
+        self.assertEquals(tests.utils.written_lines(transport)[-2:],
+                          [irc.messages.Pong(['1']).encode(), irc.messages.Pong(['2']).encode()])
+        release.set_result(None)
+        tests.utils.run_briefly(self.loop)
+
+    def test_handler_cap_releases_slot_when_dispatch_fails(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.protocol.RawMessage(irc.codes.ERR_PASSWDMISMATCH, ['TestNick', 'no']).encode())
+
+        self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', max_handlers=1, loop=self.loop)
+
+        @c.handles(irc.codes.ERR_PASSWDMISMATCH)
+        @asyncio.coroutine
+        def handler(client, message):
+            pass
+
+        self.loop.run_until_complete(c.start())
+        self.assertRaises(irc.codes.PasswordMismatchError, self.loop.run_until_complete, c._read_handler)
+        self.assertEquals(c.handler_stats()['in_flight'], 0)
+
+    def test_thread_handler_sends_returned_messages(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(irc.protocol.RawMessage('TEST', ['abc']).encode())
+        stream.feed_eof()
+
+        transport, _ = self.patch_connect(protocol=stream)
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        c.handles('TEST', mode=irc.executor.Mode.thread)(pong_back)
+        self.addCleanup(c.executor.shutdown, True)
+
+        self.loop.run_until_complete(c.start())
+        self.loop.run_until_complete(c._read_handler)
+        self.loop.run_until_complete(asyncio.Task(c.tasks.join(), loop=self.loop))
+        tests.utils.run_briefly(self.loop)
+
+        self.assertEquals(tests.utils.written_lines(transport)[-1], irc.messages.Pong(['abc']).encode())
+        self.assertEquals(c.executor.stats()['thread'].submitted, 1)
+
+    def test_log_message_skipped_when_disabled(self):
+        log = unittest.mock.Mock()
+        log.isEnabledFor.return_value = False
+        c = irc.client.IrcClient('example.com', 'TestNick', message_log=log, loop=self.loop)
+        c.log_message(irc.messages.PrivMsg('#chan', 'hi'))
+        self.assertFalse(log.info.called)
+
+    def test_log_message_sampling(self):
+        log = unittest.mock.Mock()
+        log.isEnabledFor.return_value = True
+        c = irc.client.IrcClient('example.com', 'TestNick', message_log=log,
+                                 message_log_sample={'PRIVMSG': 2}, loop=self.loop)
+        for i in range(4):
+            c.log_message(irc.messages.PrivMsg('#chan', str(i)))
+        c.log_message(irc.messages.Ping(['1']))
+        logged = [str(call[0][0]) for call in log.info.call_args_list]
+        self.assertEquals(len(logged), 3)
+        self.assertTrue(logged[-1].startswith('RECV Message: '))
+
+    def patch_connects(self, *results):
+        results = list(results)
+        transports = []
+
+        @asyncio.coroutine
+        def gen(*args):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            transport = unittest.mock.Mock()
+            transports.append(transport)
+            return transport, result
+
+        self.create_patch('irc.client._connect', new=gen)
+        return transports
+
+    def test_connect_timeout(self):
+        @asyncio.coroutine
+        def hang(*args):
+            yield from asyncio.sleep(10, loop=self.loop)
+
+        self.create_patch('irc.client._connect', new=hang)
+        c = irc.client.IrcClient('example.com', 'TestNick', connect_timeout=0.01, loop=self.loop)
+        self.assertRaises(asyncio.TimeoutError, self.loop.run_until_complete, c.start())
+
+    def test_max_buffer_size_reaches_protocol(self):
+        connects = []
+
+        @asyncio.coroutine
+        def connect(host, port, ssl, loop, protocol_class, protocol_kwargs):
+            protocol = protocol_class(loop=loop, **protocol_kwargs)
+            connects.append(protocol)
+            return unittest.mock.Mock(), protocol
+
+        self.create_patch('irc.client._connect', new=connect)
+        c = irc.client.IrcClient('example.com', 'TestNick', max_buffer_size=1024, loop=self.loop)
+        self.loop.run_until_complete(c.start())
+        self.assertEquals(connects[0]._input.max_size, 1024)
+
+        c = irc.client.IrcClient('example.com', 'TestNick', max_buffer_size=2048, loop=self.loop,
+                                 protocol_class=irc.parser.BufferedStreamProtocol)
+        self.loop.run_until_complete(c.start())
+        self.assertEquals(len(connects[1]._buffer), 2048)
+
+    def test_reconnect_rejoins_channels(self):
+        first = irc.parser.StreamProtocol(loop=self.loop)
+        second = irc.parser.StreamProtocol(loop=self.loop)
+        transports = self.patch_connects(first, OSError('refused'), second)
+        metrics = irc.metrics.ClientMetrics(name='net')
+        c = irc.client.IrcClient('example.com', 'TestNick', password='pass', reconnect=True,
+                                 backoff=irc.throttle.Backoff(initial=0.001), metrics=metrics, loop=self.loop)
+
+        self.loop.run_until_complete(c.start())
+        first.feed_data(irc.protocol.RawMessage(irc.codes.RPL_WELCOME, ['hi']).encode())
+        for channel in ('#b', '#a', '#c'):
+            first.feed_data(irc.messages.Join(channel).encode().replace(b'JOIN', b':TestNick!t@host JOIN'))
+        first.feed_data(b':TestNick!t@host PART #c\r\n')
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(c.channels, {'#a', '#b'})
+
+        first.feed_eof()
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        self.assertEquals(len(transports), 2)
+        self.assertEquals(transports[1].write.call_args_list, [unittest.mock.call(
+            irc.messages.Pass('pass').encode() + irc.messages.Nick('TestNick').encode() +
+            irc.messages.User('TestNick', 'TestNick', 'tulip-irc', 'TestNick').encode())])
+        # held until the server has registered us again
+        delivery = c.send_privmsg('#a', 'back')
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(transports[1].write.call_count, 1)
+
+        second.feed_data(irc.protocol.RawMessage(irc.codes.RPL_WELCOME, ['hi']).encode())
+        self.loop.run_until_complete(delivery)
+        self.assertEquals(transports[1].write.call_args_list[-1],
+                          unittest.mock.call(irc.messages.Join('#a,#b').encode() +
+                                             irc.messages.PrivMsg('#a', 'back').encode()))
+
+        stats = c.reconnect_stats()
+        self.assertEquals(stats['disconnects'], 1)
+        self.assertEquals(metrics.disconnects.value(('net',)), 1)
+        self.assertTrue('# TYPE irc_disconnects_total counter' in metrics.registry.render())
+        self.assertEquals(stats['connect_failures'], 1)
+        self.assertTrue(stats['last_recover_time'] > 0)
+        self.assertTrue(c.registered)
+        self.assertEquals(c.nick, 'TestNick')
+
+        c._quitting = True
+        second.feed_eof()
+        self.loop.run_until_complete(c._supervisor)
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+
+    def test_quit_during_backoff(self):
+        first = irc.parser.StreamProtocol(loop=self.loop)
+        transports = self.patch_connects(first, OSError('refused'), OSError('refused'))
+        c = irc.client.IrcClient('example.com', 'TestNick', reconnect=True,
+                                 backoff=irc.throttle.Backoff(initial=10), loop=self.loop)
+        self.loop.run_until_complete(c.start())
+        first.feed_eof()
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertEquals(c.connect_failures, 1)
+        delivery = c.send_privmsg('#a', 'never sent')
+
+        quit = c.quit()
+        self.assertTrue(quit.done())
+        tests.utils.run_briefly(self.loop)
+        self.assertTrue(c._supervisor.cancelled())
+        self.assertRaises(ConnectionResetError, self.loop.run_until_complete, delivery)
+        self.assertEquals(len(transports), 1)
+
+    def test_rejoin_splits_long_channel_lists(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        c.rejoin_channels = {'#' + 'x' * 100 + str(i) for i in range(10)}
+        c._rejoin()
+        self.assertEquals(c.send_queue_depth, 3)
+        while c.send_queue_depth:
+            raw, _ = c._send_queue.get_nowait()
+            self.assertTrue(raw.startswith(b'JOIN '))
+            self.assertTrue(len(raw) <= irc.protocol.MAX_LINE_LENGTH)
+
+    def isupport(self, c, *tokens):
+        c.dispatch_message(irc.protocol.RawMessage(
+            irc.codes.RPL_ISUPPORT, ['TestNick'] + list(tokens) + ['are supported by this server']))
+
+    def test_isupport_target_limits(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.assertEquals(c.max_targets('PRIVMSG'), 1)
+        self.isupport(c, 'MAXTARGETS=3', 'NETWORK=Example')
+        self.assertEquals(c.max_targets('PRIVMSG'), 3)
+        self.isupport(c, 'TARGMAX=PRIVMSG:4,NOTICE:,JOIN:')
+        self.assertEquals(c.max_targets('PRIVMSG'), 4)
+        self.assertEquals(c.max_targets('NOTICE'), None)
+        self.isupport(c, '-TARGMAX')
+        self.assertEquals(c.max_targets('NOTICE'), 3)
+        self.assertEquals(c.isupport['NETWORK'], 'Example')
+
+    def test_isupport_malformed_target_limits(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.isupport(c, 'MAXTARGETS=')
+        self.assertEquals(c.max_targets('PRIVMSG'), None)
+        self.isupport(c, 'MAXTARGETS=lots')
+        self.assertEquals(c.max_targets('PRIVMSG'), 1)
+        self.isupport(c, 'MAXTARGETS=5', 'TARGMAX=PRIVMSG:x,NOTICE:0,JOIN')
+        self.assertEquals(c.max_targets('PRIVMSG'), 5)
+        self.assertEquals(c.max_targets('NOTICE'), 5)
+        self.assertEquals(c.max_targets('JOIN'), None)
+
+    def queued_lines(self, c):
+        lines = []
+        while c.send_queue_depth:
+            raw, _ = c._send_queue.get_nowait()
+            lines.append(raw)
+        return lines
+
+    def test_send_privmsg_many(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        targets = ['#chan{}'.format(i) for i in range(10)]
+        c.send_privmsg_many(targets, 'hello')
+        self.assertEquals(len(self.queued_lines(c)), 10)
+
+        self.isupport(c, 'TARGMAX=PRIVMSG:4')
+        c.send_privmsg_many(targets, 'hello')
+        self.assertEquals(sorted(self.queued_lines(c)), [
+            b'PRIVMSG #chan0,#chan1,#chan2,#chan3 :hello\r\n',
+            b'PRIVMSG #chan4,#chan5,#chan6,#chan7 :hello\r\n',
+            b'PRIVMSG #chan8,#chan9 :hello\r\n'])
+
+    def test_send_privmsg_many_fits_lines(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.isupport(c, 'TARGMAX=NOTICE:')
+        targets = ['#' + 'x' * 50 + str(i) for i in range(20)]
+        c.send_notice_many(targets, 'y' * 200)
+        lines = self.queued_lines(c)
+        self.assertEquals(len(lines), 4)
+        self.assertTrue(all(len(line) <= irc.protocol.MAX_LINE_LENGTH for line in lines))
+        self.assertEquals(sum(line.split()[1].count(b',') + 1 for line in lines), 20)
+
+    def test_long_privmsg_is_split(self):
+        transport, stream = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.loop.run_until_complete(c.start())
+        stream.feed_data(b':irc.example.com 001 TestNick :Welcome to the network TestNick!tn@host.example.com\r\n')
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(c.hostmask, 'TestNick!tn@host.example.com')
+        text = ' '.join('word{}'.format(i) for i in range(200))
+        delivery = c.send_privmsg('#chan', text)
+        self.assertEquals(c.send_queue_depth, 4)
+        self.loop.run_until_complete(delivery)
+
+        lines = [line for line in tests.utils.written_lines(transport) if line.startswith(b'PRIVMSG')]
+        prefix = b':' + c.hostmask.encode('utf-8') + b' '
+        self.assertTrue(all(len(prefix + line) <= irc.protocol.MAX_LINE_LENGTH for line in lines))
+        self.assertTrue(len(prefix + lines[0]) > irc.protocol.MAX_LINE_LENGTH - 10)
+        self.assertEquals(' '.join(irc.protocol.split_message(line).params[1] for line in lines), text)
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+
+    def test_join_without_full_prefix_keeps_hostmask(self):
+        transport, stream = self.patch_connect()
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.loop.run_until_complete(c.start())
+        stream.feed_data(b':irc.example.com 001 TestNick :Welcome\r\n:TestNick!tn JOIN #chan\r\n')
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(c.channels, {'#chan'})
+        self.assertEquals(c.hostmask, None)
+        stream.feed_data(b':TestNick!tn@host.example.com JOIN #other\r\n')
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(c.hostmask, 'TestNick!tn@host.example.com')
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+
+    def test_join_without_prefix_before_registration(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        c.dispatch_message(irc.protocol.RawMessage('JOIN', ['#chan']))
+        self.assertEquals(c.channels, {'#chan'})
+        self.assertEquals(c.hostmask, None)
+
+    def test_long_privmsg_before_hostmask_is_known(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', username='tn', loop=self.loop)
+        c.send_privmsg('#chan', 'x' * 1000)
+        lines = self.queued_lines(c)
+        worst = len(':TestNick!~tn@ ') + irc.protocol.MAX_HOST_LENGTH
+        self.assertEquals([worst + len(line) for line in lines], [512, 512, len(lines[2]) + worst])
+        self.assertEquals(sum(len(line) - len(b'PRIVMSG #chan :\r\n') for line in lines), 1000)
+
+    def test_send_privmsg_many_splits_text(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        self.isupport(c, 'TARGMAX=PRIVMSG:3')
+        c.send_privmsg_many(['#a', '#b', '#c', '#d'], 'first\nsecond')
+        self.assertEquals(sorted(self.queued_lines(c)), [
+            b'PRIVMSG #a,#b,#c :first\r\n', b'PRIVMSG #a,#b,#c :second\r\n',
+            b'PRIVMSG #d :first\r\n', b'PRIVMSG #d :second\r\n'])
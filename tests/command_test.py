@@ -1,4 +1,5 @@
 import unittest
+import pickle
 import irc.command
 
 class CommandTest(unittest.TestCase):
@@ -26,3 +27,12 @@ class CommandTest(unittest.TestCase):
     def test_incorrect_param_length_raises_parse_error(self):
         parse_fn = irc.command.make_params_parser('test', ['a', 'b', 'c'])
         self.assertRaises(irc.command.ParamsParseError, parse_fn, 'a b c d e')
+
+    def test_command_with_params_pickles(self):
+        parse_fn = irc.command.make_params_parser('test', ['a', 'b'], irc.command.LastParamType.list_)
+        command = irc.command.Command('Nick', 'test', '#chan', parse_fn('a b c'))
+        copy = pickle.loads(pickle.dumps(command))
+        self.assertEquals(copy.sender, 'Nick')
+        self.assertEquals(copy.params.a, 'a')
+        self.assertEquals(copy.params.b, ['b', 'c'])
+        self.assertEquals(copy.params, command.params)
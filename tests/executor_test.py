@@ -0,0 +1,57 @@
+import unittest
+import asyncio
+import threading
+import irc.executor
+
+
+def double(n):
+    return n * 2
+
+
+def fail(n):
+    raise ValueError(n)
+
+
+class TestHandlerExecutor(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.executor = irc.executor.HandlerExecutor(loop=self.loop, thread_workers=2, process_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+        self.loop.close()
+
+    def test_thread_mode_runs_off_loop_thread(self):
+        result = self.loop.run_until_complete(
+            self.executor.run(irc.executor.Mode.thread, lambda _: threading.current_thread(), None))
+        self.assertFalse(result is threading.current_thread())
+
+    def test_process_mode(self):
+        result = self.loop.run_until_complete(self.executor.run(irc.executor.Mode.process, double, 21))
+        self.assertEquals(result, 42)
+        stats = self.executor.stats()['process']
+        self.assertEquals(stats.submitted, 1)
+        self.assertEquals(stats.in_flight, 0)
+        self.assertTrue(stats.latency >= stats.queue_time >= 0)
+
+    def test_failures_are_counted(self):
+        coro = self.executor.run(irc.executor.Mode.thread, fail, 1)
+        self.assertRaises(ValueError, self.loop.run_until_complete, coro)
+        self.assertEquals(self.executor.stats()['thread'].failed, 1)
+
+    def test_inline_mode_has_no_pool(self):
+        coro = self.executor.run(irc.executor.Mode.inline, double, 1)
+        self.assertRaises(ValueError, self.loop.run_until_complete, coro)
+
+    def test_wrap_delivers_result(self):
+        delivered = []
+
+        @asyncio.coroutine
+        def deliver(client, arg, result):
+            delivered.append((client, arg, result))
+
+        handler = self.executor.wrap(irc.executor.Mode.thread, double, deliver)
+        self.assertTrue(asyncio.iscoroutinefunction(handler))
+        self.loop.run_until_complete(handler('client', 4))
+        self.assertEquals(delivered, [('client', 4, 8)])
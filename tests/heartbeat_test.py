@@ -0,0 +1,93 @@
+import unittest
+import unittest.mock
+import asyncio
+import irc.client
+import irc.codes
+import irc.heartbeat
+import irc.messages
+import irc.parser
+import irc.protocol
+import tests.utils
+
+
+class TestLagHistogram(unittest.TestCase):
+    def test_window_and_buckets(self):
+        histogram = irc.heartbeat.LagHistogram(window=4, bounds=(0.1, 1.0))
+        for lag in (5.0, 0.05, 0.5, 0.07, 2.0):
+            histogram.add(lag)
+        self.assertEquals(len(histogram), 4)
+        self.assertEquals(histogram.counts(), [2, 1, 1])
+        self.assertEquals(histogram.last, 2.0)
+        self.assertEquals(histogram.percentile(50), 0.5)
+        self.assertEquals(histogram.percentile(100), 2.0)
+
+    def test_empty(self):
+        histogram = irc.heartbeat.LagHistogram()
+        self.assertTrue(histogram.last is None and histogram.mean is None and histogram.percentile(99) is None)
+
+
+class TestHeartbeat(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.stream = irc.parser.StreamProtocol(loop=self.loop)
+        self.transport = unittest.mock.Mock()
+
+        @asyncio.coroutine
+        def connect(*args):
+            return self.transport, self.stream
+
+        patcher = unittest.mock.patch('irc.client._connect', new=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def start_client(self, **kwargs):
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop, **kwargs)
+        self.loop.run_until_complete(c.start())
+        self.stream.feed_data(irc.protocol.RawMessage(irc.codes.RPL_WELCOME, ['hi']).encode())
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+        return c
+
+    def test_pong_measures_lag(self):
+        c = self.start_client(heartbeat_interval=10)
+        self.assertEquals(tests.utils.written_lines(self.transport)[-1], b'PING hb1\r\n')
+        self.assertTrue(c.lag >= 0)
+
+        self.stream.feed_data(b':irc.example.com PONG irc.example.com :hb1\r\n')
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(len(c.heartbeat.histogram), 1)
+        self.assertEquals(c.lag, c.heartbeat.histogram.last)
+        self.assertEquals(c.heartbeat.stats()['unanswered_pings'], 0)
+        c.heartbeat.stop()
+
+    def test_stops_when_read_loop_ends(self):
+        c = self.start_client(heartbeat_interval=0.01)
+        self.stream.feed_eof()
+        self.loop.run_until_complete(c._read_handler)
+        tests.utils.run_briefly(self.loop)
+        self.assertTrue(c.heartbeat._task is None)
+        written = len(tests.utils.written_lines(self.transport))
+        self.loop.run_until_complete(asyncio.sleep(0.03, loop=self.loop))
+        self.assertEquals(len(tests.utils.written_lines(self.transport)), written)
+
+    def test_late_pong_drops_older_pings(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', heartbeat_interval=10, loop=self.loop)
+        heartbeat = c.heartbeat
+        heartbeat.ping()
+        heartbeat.ping()
+        heartbeat.ping()
+        self.assertTrue(heartbeat.pong(irc.messages.Pong(['irc.example.com', 'hb2'])))
+        self.assertEquals(list(heartbeat._outstanding), ['hb3'])
+        self.assertFalse(heartbeat.pong(irc.messages.Pong(['irc.example.com', 'hb1'])))
+
+    def test_timeout_aborts_transport(self):
+        c = self.start_client(heartbeat_interval=0.01, heartbeat_timeout=0.03)
+        self.loop.run_until_complete(asyncio.sleep(0.06, loop=self.loop))
+        self.transport.abort.assert_called_once_with()
+        self.assertEquals(c.heartbeat.timeouts, 1)
+        self.assertTrue(c.lag >= 0.03)
+        self.assertTrue(len(tests.utils.written_lines(self.transport)) >= 4)
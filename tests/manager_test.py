@@ -0,0 +1,76 @@
+import unittest
+import unittest.mock
+import asyncio
+import irc.client
+import irc.codes
+import irc.manager
+import irc.parser
+import irc.protocol
+import tests.utils
+
+
+@asyncio.coroutine
+def noop(client, message):
+    pass
+
+
+class TestClientManager(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.connected = []
+
+        @asyncio.coroutine
+        def connect(host, *args):
+            if host == 'down.example.com':
+                raise OSError('refused')
+            self.connected.append((host, self.loop.time()))
+            return unittest.mock.Mock(), irc.parser.StreamProtocol(loop=self.loop)
+
+        patcher = unittest.mock.patch('irc.client._connect', new=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_clients_share_defaults_and_handlers(self):
+        manager = irc.manager.ClientManager(loop=self.loop, config={'STARTING_CHANNELS': []}, throttle=1)
+        manager.add_handler('PRIVMSG', noop)
+        a = manager.add('a', 'a.example.com', 'Bot')
+        b = manager.add('b', 'b.example.com', 'Bot', throttle=None)
+        self.assertTrue(noop in a.msg_handlers['PRIVMSG'])
+        self.assertTrue(a.rate_limiter is not None)
+        self.assertTrue(b.rate_limiter is None)
+        self.assertTrue(a.executor is b.executor is manager.executor)
+        self.assertTrue(a.config is b.config)
+
+        manager.add_command_handler('ping', noop)
+        self.assertTrue('ping' in a.command_handlers and 'ping' in b.command_handlers)
+        self.assertRaises(ValueError, manager.add, 'a', 'a.example.com', 'Bot')
+
+    def test_start_is_staggered(self):
+        manager = irc.manager.ClientManager(loop=self.loop, client_class=irc.client.IrcClient, stagger=0.02)
+        for name in 'abc':
+            manager.add(name, name + '.example.com', 'Bot')
+        manager.add('down', 'down.example.com', 'Bot')
+
+        failed = self.loop.run_until_complete(manager.start())
+        self.assertEquals(failed, ['down'])
+        self.assertEquals([host for host, _ in self.connected], ['a.example.com', 'b.example.com', 'c.example.com'])
+        times = [t for _, t in self.connected]
+        self.assertTrue(times[2] - times[0] >= 0.035)
+
+        for name in 'ab':
+            manager[name]._protocol.feed_data(irc.protocol.RawMessage(irc.codes.RPL_WELCOME, ['hi']).encode())
+        # nothing sends for the client that failed to connect
+        manager['down'].send_privmsg('#chan', 'hi')
+        tests.utils.run_briefly(self.loop)
+        stats = manager.stats()
+        self.assertEquals(stats['clients'], 4)
+        self.assertEquals(stats['registered'], 2)
+        self.assertEquals(manager.start_failures, 1)
+        self.assertEquals(stats['queued_lines'], 1)
+
+        self.loop.run_until_complete(manager.quit())
+        tests.utils.run_briefly(self.loop)
@@ -0,0 +1,157 @@
+import unittest
+import unittest.mock
+import asyncio
+import irc.client
+import irc.metrics
+import irc.messages
+import irc.parser
+import tests.utils
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = irc.metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('lines_total', 'Lines', ('command',))
+        counter.inc(('PING',))
+        counter.inc(('PING',), 2)
+        self.assertEquals(counter.value(('PING',)), 3)
+        self.assertTrue(self.registry.counter('lines_total', 'Lines', ('command',)) is counter)
+        self.assertEquals(self.registry.render(),
+                          '# HELP lines_total Lines\n# TYPE lines_total counter\nlines_total{command="PING"} 3\n')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('wait_seconds', 'Waits', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe((), value)
+        self.assertEquals(histogram.value(), (3, 5.55))
+        self.assertEquals(self.registry.render().splitlines()[2:], [
+            'wait_seconds_bucket{le="0.1"} 1',
+            'wait_seconds_bucket{le="1.0"} 2',
+            'wait_seconds_bucket{le="+Inf"} 3',
+            'wait_seconds_sum 5.55',
+            'wait_seconds_count 3',
+        ])
+
+    def test_callback_gauge_and_collect(self):
+        depth = [4]
+        gauge = self.registry.callback_gauge('depth', 'Depth', ('client',))
+        gauge.add_callback(('a',), lambda: depth[0])
+        depth[0] = 7
+        self.assertEquals(self.registry.collect(), {'depth': {(('client', 'a'),): 7}})
+
+    def test_label_escaping(self):
+        counter = self.registry.counter('c', 'C', ('name',))
+        counter.inc(('say "hi"\\',))
+        self.assertTrue('c{name="say \\"hi\\"\\\\"} 1' in self.registry.render())
+
+    def test_duplicate_register(self):
+        self.registry.register(irc.metrics.Counter('c', 'C'))
+        self.assertRaises(ValueError, self.registry.register, irc.metrics.Counter('c', 'C'))
+
+
+class TestClientMetrics(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_client_records(self):
+        stream = irc.parser.StreamProtocol(loop=self.loop)
+        stream.feed_data(b':a!b@c PRIVMSG #chan :hi\r\n')
+        stream.feed_data(b'PING :1\r\n')
+        stream.feed_data(b':only.a.prefix\r\n')
+        stream.feed_eof()
+        transport = unittest.mock.Mock()
+
+        @asyncio.coroutine
+        def connect(*args):
+            return transport, stream
+
+        metrics = irc.metrics.ClientMetrics(name='net', handler_latency=True)
+        c = irc.client.IrcClient('example.com', 'TestNick', metrics=metrics, loop=self.loop)
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def handler(client, message):
+            pass
+
+        with unittest.mock.patch('irc.client._connect', new=connect):
+            self.loop.run_until_complete(c.start())
+        self.loop.run_until_complete(c._read_handler)
+        tests.utils.run_briefly(self.loop)
+
+        self.assertEquals(metrics.received_messages.value(('net', 'PRIVMSG')), 1)
+        self.assertEquals(metrics.received_bytes.value(('net', 'PING')), len(b'PING :1\r\n'))
+        self.assertEquals(metrics.parse_errors.value(('net',)), 1)
+        self.assertEquals(metrics.sent_messages.value(('net', 'PONG')), 1)
+        self.assertEquals(metrics.sent_messages.value(('net', 'NICK')), 1)
+        self.assertEquals(metrics.handler_latency.value(('net', 'PRIVMSG'))[0], 1)
+        self.assertEquals(metrics.handlers_in_flight.value(('net',)), 0)
+        self.assertEquals(metrics.send_queue_depth.value(('net',)), c.send_queue_depth)
+        self.assertTrue('irc_sent_bytes_total{client="net",command="USER"}' in metrics.registry.render())
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+
+
+    def test_handler_latency_is_optional(self):
+        metrics = irc.metrics.ClientMetrics(name='net')
+        self.assertTrue(metrics.handler_latency is None)
+        self.assertFalse('irc_handler_seconds' in metrics.registry.render())
+
+    def test_throttle_wait_counted_once_per_line(self):
+        @asyncio.coroutine
+        def connect(*args):
+            return unittest.mock.Mock(), irc.parser.StreamProtocol(loop=self.loop)
+
+        metrics = irc.metrics.ClientMetrics(name='net')
+        c = irc.client.IrcClient('example.com', 'TestNick', throttle=0.05, metrics=metrics, loop=self.loop)
+        with unittest.mock.patch('irc.client._connect', new=connect):
+            self.loop.run_until_complete(c.start())
+        delivery = c.send_privmsg('#chan', 'waits')
+        for i in range(3):
+            # each wakes the send loop while the PRIVMSG waits
+            c.send_message(irc.messages.Pong([str(i)]))
+            tests.utils.run_briefly(self.loop)
+        self.loop.run_until_complete(delivery)
+        count, total = metrics.throttle_delay.value(('net',))
+        self.assertEquals(count, 1)
+        self.assertTrue(total > 0)
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def fetch(self, port, request):
+        reader, writer = yield from asyncio.open_connection('127.0.0.1', port, loop=self.loop)
+        writer.write(request)
+        response = yield from reader.read()
+        writer.close()
+        return response
+
+    def test_serves_metrics(self):
+        registry = irc.metrics.Registry()
+        registry.counter('up_total', 'Up').inc()
+        server = self.loop.run_until_complete(irc.metrics.serve(registry, port=0, loop=self.loop))
+        port = server.sockets[0].getsockname()[1]
+        try:
+            response = self.loop.run_until_complete(self.fetch(port, b'GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n'))
+            head, body = response.split(b'\r\n\r\n', 1)
+            self.assertTrue(head.startswith(b'HTTP/1.0 200 OK'))
+            self.assertTrue(b'text/plain; version=0.0.4' in head)
+            self.assertEquals(body, registry.render().encode('utf-8'))
+
+            response = self.loop.run_until_complete(self.fetch(port, b'GET /other HTTP/1.1\r\n\r\n'))
+            self.assertTrue(response.startswith(b'HTTP/1.0 404'))
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
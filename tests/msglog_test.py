@@ -0,0 +1,84 @@
+import unittest
+import logging
+import irc.messages
+import irc.msglog
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class CountingMessage(irc.messages.PrivMsg):
+    __slots__ = ()
+    formatted = 0
+
+    def __repr__(self):
+        CountingMessage.formatted += 1
+        return super().__repr__()
+
+
+class TestLazyMessage(unittest.TestCase):
+    def test_formats_only_when_emitted(self):
+        CountingMessage.formatted = 0
+        logger = logging.getLogger('tests.msglog.lazy')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = ListHandler()
+        handler.setLevel(logging.WARNING)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        message = CountingMessage('#chan', 'hi')
+        logger.info(irc.msglog.LazyMessage('{dir} {message}', 'RECV', message))
+        self.assertEquals(CountingMessage.formatted, 0)
+
+        handler.setLevel(logging.INFO)
+        logger.info(irc.msglog.LazyMessage('{dir} {message}', 'RECV', message))
+        self.assertEquals(CountingMessage.formatted, 1)
+        self.assertEquals(handler.lines, ['RECV ' + repr(message)])
+
+
+class TestSampler(unittest.TestCase):
+    def test_sampled_command(self):
+        sampler = irc.msglog.Sampler({'PRIVMSG': 3})
+        self.assertEquals([sampler('PRIVMSG') for _ in range(7)],
+                          [True, False, False, True, False, False, True])
+
+    def test_unsampled_command(self):
+        sampler = irc.msglog.Sampler({'PRIVMSG': 3})
+        self.assertTrue(all(sampler('PING') for _ in range(5)))
+
+
+class TestBackgroundLog(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('tests.msglog.background')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def test_records_reach_handlers_after_stop(self):
+        background = irc.msglog.log_in_background(self.logger)
+        self.assertEquals(self.logger.handlers, [background._queue_handler])
+        for i in range(5):
+            self.logger.info(irc.msglog.LazyMessage('{dir} {message}', 'SEND', i))
+        background.stop()
+
+        self.assertEquals(self.logger.handlers, [self.handler])
+        self.assertEquals(self.handler.lines, ['SEND {}'.format(i) for i in range(5)])
+
+    def test_full_queue_drops(self):
+        background = irc.msglog.BackgroundLog(self.logger, maxsize=2)
+        # not started, so nothing drains the queue
+        self.logger.removeHandler(self.handler)
+        self.logger.addHandler(background._queue_handler)
+        self.addCleanup(self.logger.removeHandler, background._queue_handler)
+        for i in range(5):
+            self.logger.info('line %d', i)
+        self.assertEquals(background.dropped, 3)
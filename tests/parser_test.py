@@ -0,0 +1,203 @@
+import unittest
+import asyncio
+import irc.parser
+import irc.protocol
+
+
+class TestBufferedStreamProtocol(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def read_all(self, stream):
+        messages = []
+        while True:
+            try:
+                messages.extend(self.loop.run_until_complete(stream.read_batch()))
+            except irc.parser.EofStream:
+                return messages
+
+    def test_parse_lines_across_chunks(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop)
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        protocol.data_received(b'PING :one\r\nPRIVMSG #chan')
+        protocol.data_received(b' :two\r\n')
+        protocol.eof_received()
+
+        messages = self.read_all(stream)
+        self.assertEquals([m.command for m in messages], ['PING', 'PRIVMSG'])
+        self.assertEquals(messages[1].params, ['#chan', 'two'])
+
+    def test_data_before_parser(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop)
+        protocol.data_received(b'PING :one\r\n')
+        protocol.eof_received()
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+
+        messages = self.read_all(stream)
+        self.assertEquals([m.params for m in messages], [['one']])
+
+    def test_buffer_is_reused(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop, buffer_size=64)
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        buffer = protocol._buffer
+        lines = [b'PRIVMSG #chan :message ' + bytes(str(i), 'ascii') + b'\r\n' for i in range(50)]
+        data = b''.join(lines)
+        for i in range(0, len(data), 7):
+            protocol.data_received(data[i:i + 7])
+        protocol.eof_received()
+
+        messages = self.read_all(stream)
+        self.assertTrue(protocol._buffer is buffer)
+        self.assertEquals(len(buffer), 64)
+        self.assertEquals([m.params[1] for m in messages], ['message {0}'.format(i) for i in range(50)])
+
+    def test_get_buffer_and_buffer_updated(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop)
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        data = b'PING :one\r\n'
+        buf = protocol.get_buffer(-1)
+        buf[:len(data)] = data
+        protocol.buffer_updated(len(data))
+        protocol.eof_received()
+
+        self.assertEquals([m.params for m in self.read_all(stream)], [['one']])
+
+    def test_long_line_is_dropped(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop)
+        stream = protocol.set_parser(irc.protocol.MessageParser(max_line_length=32))
+        protocol.data_received(b'PRIVMSG #chan :' + b'x' * 20)
+        protocol.data_received(b'x' * 100)
+        protocol.data_received(b'x' * 10 + b'\r\nPING :ok\r\n')
+        protocol.eof_received()
+
+        self.assertEquals([m.params for m in self.read_all(stream)], [['ok']])
+        self.assertEquals(protocol.dropped_lines, 1)
+
+    def test_line_longer_than_buffer_is_dropped(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop, buffer_size=16)
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        protocol.data_received(b'PRIVMSG #chan :' + b'x' * 40 + b'\r\nPING :ok\r\n')
+        protocol.eof_received()
+
+        self.assertEquals([m.params for m in self.read_all(stream)], [['ok']])
+        self.assertEquals(protocol.dropped_lines, 1)
+
+
+class TestParserBuffer(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_long_line_is_dropped(self):
+        protocol = irc.parser.StreamProtocol(loop=self.loop)
+        stream = protocol.set_parser(irc.protocol.MessageParser(max_line_length=32))
+        protocol.data_received(b'PING :one\r\nPRIVMSG #chan :' + b'x' * 40)
+        protocol.data_received(b'x' * 40 + b'\r\n')
+        protocol.data_received(b'PRIVMSG #chan :' + b'x' * 40 + b'\r\nPING :two\r\n')
+
+        self.assertEquals([m.params for m in stream._buffer], [['one'], ['two']])
+        self.assertEquals(protocol.dropped_lines, 2)
+        self.assertTrue(len(protocol._input) - protocol._input.offset < 32)
+
+    def test_eol_split_across_chunks(self):
+        protocol = irc.parser.StreamProtocol(loop=self.loop)
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        protocol.data_received(b'PING :one\r')
+        protocol.data_received(b'\nPING :two\r\n')
+
+        self.assertEquals([m.params for m in stream._buffer], [['one'], ['two']])
+
+    def test_scan_resumes_where_it_stopped(self):
+        buf = irc.parser.ParserBuffer()
+        scanner = irc.parser.LineScanner(b'\r\n')
+        buf.extend(b'PING :one')
+        self.assertEquals(scanner.scan(buf, 0, len(buf)), ([], 0))
+        self.assertEquals(scanner._scan_pos, len(buf) - 1)
+        buf.extend(b'\r\n')
+        self.assertEquals(scanner.scan(buf, 0, len(buf)), ([(0, 11)], 11))
+
+    def test_max_size_drops_unconsumed_data(self):
+        buf = irc.parser.ParserBuffer(max_size=16)
+        buf.feed_data(b'x' * 10)
+        buf.feed_data(b'x' * 10)
+        self.assertEquals(buf.size, 0)
+        self.assertEquals(buf.dropped_bytes, 20)
+
+    def test_max_size_skips_rest_of_cut_line(self):
+        buf = irc.parser.ParserBuffer(max_size=16)
+        buf.feed_data(b'PING :one\r\nPING :' + b't' * 20 + b'\r')
+        buf.feed_data(b'\nPING :3\r\n')
+        self.assertEquals(bytes(buf), b'PING :one\r\nPING :3\r\n')
+        self.assertEquals(buf.dropped_lines, 1)
+        self.assertEquals(buf.dropped_bytes, 28)
+
+        protocol = irc.parser.StreamProtocol(loop=self.loop, max_buffer_size=16)
+        protocol.data_received(b'PING :' + b't' * 20)
+        protocol.data_received(b'x' * 20)
+        protocol.data_received(b'x\r\nPING :one\r\n')
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        protocol.data_received(b'PING :3\r\n')
+        self.assertEquals([m.params for m in stream._buffer], [['one'], ['3']])
+        self.assertEquals(protocol.dropped_lines, 1)
+        self.assertEquals(protocol._input.dropped_bytes, 49)
+
+    def test_max_size_keeps_complete_lines(self):
+        buf = irc.parser.ParserBuffer(max_size=16)
+        buf.feed_data(b'PING :one\r\nPING :two\r\n')
+        buf.feed_data(b'PING :3\r\n')
+        self.assertEquals(bytes(buf), b'PING :one\r\nPING :two\r\nPING :3\r\n')
+        self.assertEquals(buf.dropped_lines, 0)
+
+    def test_chunk_over_max_size_is_parsed(self):
+        protocol = irc.parser.StreamProtocol(loop=self.loop, max_buffer_size=4096)
+        stream = protocol.set_parser(irc.protocol.MessageParser())
+        protocol.data_received(b''.join('PING :{}\r\n'.format(i).encode() for i in range(1000)) +
+                               b'PRIVMSG #chan :' + b'x' * 5000)
+        protocol.data_received(b'x\r\nPING :last\r\n')
+        self.assertEquals([m.params[0] for m in stream._buffer], [str(i) for i in range(1000)] + ['last'])
+        self.assertEquals(protocol.dropped_lines, 1)
+        self.assertEquals(protocol._input.dropped_bytes, 5018)
+
+    def test_chunk_over_max_size_while_scanner_discards(self):
+        protocol = irc.parser.StreamProtocol(loop=self.loop, max_buffer_size=64)
+        stream = protocol.set_parser(irc.protocol.MessageParser(max_line_length=32))
+        protocol.data_received(b'PRIVMSG #chan :' + b'x' * 40)
+        protocol.data_received(b'x' * 100)
+        protocol.data_received(b'x\r\nPING :one\r\n')
+        self.assertEquals([m.params for m in stream._buffer], [['one']])
+        self.assertEquals(protocol.dropped_lines, 1)
+
+
+class TestWriteFlowControl(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_drain_waits_while_paused(self):
+        protocol = irc.parser.StreamProtocol(loop=self.loop)
+        protocol.pause_writing()
+        drain = asyncio.Task(protocol.drain(), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertFalse(drain.done())
+        protocol.resume_writing()
+        self.loop.run_until_complete(drain)
+        self.assertEquals(protocol.pause_count, 1)
+        self.assertTrue(protocol.paused_time >= 0.01)
+
+    def test_connection_lost_releases_drain(self):
+        protocol = irc.parser.BufferedStreamProtocol(loop=self.loop)
+        protocol.pause_writing()
+        drain = asyncio.Task(protocol.drain(), loop=self.loop)
+        protocol.connection_lost(None)
+        self.loop.run_until_complete(drain)
+        self.assertFalse(protocol.is_writing_paused())
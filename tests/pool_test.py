@@ -0,0 +1,52 @@
+import unittest
+import asyncio
+import irc.pool
+import tests.utils
+
+
+class TestHandlerPool(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_overall_cap(self):
+        pool = irc.pool.HandlerPool(loop=self.loop, max_in_flight=2)
+        self.assertTrue(pool.try_acquire('PRIVMSG'))
+        self.assertTrue(pool.try_acquire('JOIN'))
+        self.assertFalse(pool.try_acquire('PRIVMSG'))
+        self.assertEquals(pool.in_flight, 2)
+        pool.release('JOIN')
+        self.assertTrue(pool.try_acquire('PRIVMSG'))
+        self.assertEquals(pool.in_flight_for('PRIVMSG'), 2)
+
+    def test_per_command_cap(self):
+        pool = irc.pool.HandlerPool(loop=self.loop, max_per_command={'PRIVMSG': 1})
+        self.assertTrue(pool.try_acquire('PRIVMSG'))
+        self.assertFalse(pool.try_acquire('PRIVMSG'))
+        self.assertTrue(pool.try_acquire('JOIN'))
+        self.assertTrue(pool.try_acquire('JOIN'))
+
+    def test_acquire_waits_for_release(self):
+        pool = irc.pool.HandlerPool(loop=self.loop, max_in_flight=1)
+        pool.try_acquire('PRIVMSG')
+        task = asyncio.Task(pool.acquire('PRIVMSG'), loop=self.loop)
+        tests.utils.run_briefly(self.loop)
+        self.assertFalse(task.done())
+
+        pool.release('PRIVMSG')
+        self.loop.run_until_complete(task)
+        self.assertEquals(pool.in_flight, 1)
+        self.assertEquals(pool.waits, 1)
+        self.assertTrue(pool.wait_time >= 0)
+
+    def test_track_releases_when_done(self):
+        pool = irc.pool.HandlerPool(loop=self.loop, max_in_flight=1)
+        pool.try_acquire('PRIVMSG')
+        future = asyncio.Future(loop=self.loop)
+        pool.track('PRIVMSG', future)
+        future.set_exception(ValueError())
+        tests.utils.run_briefly(self.loop)
+        self.assertEquals(pool.stats()['in_flight'], 0)
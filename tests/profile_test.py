@@ -0,0 +1,127 @@
+import unittest
+import asyncio
+import irc.client
+import irc.messages
+import irc.profile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHandlerProfiler(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.clock = FakeClock()
+        self.profiler = irc.profile.HandlerProfiler(slow_threshold=5, blocking_threshold=1, clock=self.clock)
+        self.events = []
+        self.profiler.on_slow.append(self.events.append)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_counts_yields_and_blocking(self):
+        @asyncio.coroutine
+        def handler(client, message):
+            self.clock.now += 0.5
+            yield from asyncio.sleep(0, loop=self.loop)
+            self.clock.now += 2
+            yield from asyncio.sleep(0, loop=self.loop)
+            return 'done'
+
+        wrapped = self.profiler.wrap(handler, 'handler')
+        self.assertTrue(asyncio.iscoroutinefunction(wrapped))
+        result = self.loop.run_until_complete(wrapped(None, 'message'))
+        self.assertEquals(result, 'done')
+
+        stats = self.profiler.stats()['handler']
+        self.assertEquals(stats['calls'], 1)
+        self.assertEquals(stats['yields'], 2)
+        self.assertEquals(stats['blocking'], 2.5)
+        self.assertEquals(stats['max_blocking'], 2.5)
+        self.assertEquals(stats['slow'], 1)
+        self.assertEquals(self.events, [irc.profile.SlowHandler('handler', 2.5, 2.5, 2, 'message')])
+
+    def test_waiting_is_not_blocking(self):
+        future = asyncio.Future(loop=self.loop)
+
+        @asyncio.coroutine
+        def handler(client, message):
+            return (yield from future)
+
+        task = asyncio.Task(self.profiler.wrap(handler, 'handler')(None, 'message'), loop=self.loop)
+        self.loop.call_soon(self.advance_and_resolve, future)
+        self.assertEquals(self.loop.run_until_complete(task), 42)
+        stats = self.profiler.stats()['handler']
+        self.assertEquals((stats['wall'], stats['blocking']), (10, 0))
+        self.assertEquals(len(self.events), 1)
+
+    def advance_and_resolve(self, future):
+        self.clock.now += 10
+        future.set_result(42)
+
+    def test_errors_are_recorded_and_raised(self):
+        @asyncio.coroutine
+        def handler(client, message):
+            yield from asyncio.sleep(0, loop=self.loop)
+            raise ValueError
+
+        wrapped = self.profiler.wrap(handler)
+        self.assertRaises(ValueError, self.loop.run_until_complete, wrapped(None, 'message'))
+        self.assertEquals(list(self.profiler.stats().values())[0]['calls'], 1)
+
+    def test_cancel_reaches_handler(self):
+        cancelled = []
+
+        @asyncio.coroutine
+        def handler(client, message):
+            try:
+                yield from asyncio.sleep(10, loop=self.loop)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        task = asyncio.Task(self.profiler.wrap(handler)(None, 'message'), loop=self.loop)
+        self.loop.call_soon(task.cancel)
+        self.assertRaises(asyncio.CancelledError, self.loop.run_until_complete, task)
+        self.assertEquals(cancelled, [True])
+
+    def test_client_wraps_handlers(self):
+        c = irc.client.IrcClient('example.com', 'TestNick', profiler=self.profiler, loop=self.loop)
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def greet(client, message):
+            pass
+
+        self.loop.run_until_complete(c.dispatch_message(irc.messages.PrivMsg('#chan', 'hi')))
+        self.assertEquals(self.profiler.stats()[greet.__qualname__]['calls'], 1)
+
+
+class TestProfileFor(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_top_entries(self):
+        def busy():
+            sum(range(10000))
+
+        self.loop.call_later(0.001, busy)
+        lines = self.loop.run_until_complete(irc.profile.profile_for(0.01, loop=self.loop, limit=50))
+        self.assertTrue(0 < len(lines) <= 50)
+        self.assertTrue(any('(busy)' in line for line in lines))
+
+    def test_one_at_a_time(self):
+        first = asyncio.Task(irc.profile.profile_for(0.01, loop=self.loop), loop=self.loop)
+        second = asyncio.Task(irc.profile.profile_for(0.01, loop=self.loop), loop=self.loop)
+        self.loop.run_until_complete(first)
+        self.assertRaises(RuntimeError, self.loop.run_until_complete, second)
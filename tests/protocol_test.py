@@ -1,4 +1,7 @@
 import unittest
+import asyncio
+import pickle
+import irc.parser
 import irc.protocol as protocol
 
 
@@ -38,6 +41,101 @@ class TestSpliteMessage(unittest.TestCase):
         self.assertEquals(message.command, 'USER')
         self.assertEquals(message.params, ['Test', 'Test', 'arg', 'A Real Name'])
 
+    def test_split_with_full_prefix(self):
+        message = protocol.split_message(b':Wiz!wiz@example.com PRIVMSG #chan :hi\r\n')
+        self.assertEquals(message.nick, 'Wiz')
+        self.assertEquals(message.username, 'wiz')
+        self.assertEquals(message.host, 'example.com')
+        self.assertEquals(message.params, ['#chan', 'hi'])
+
+    def test_split_invalid_utf8_falls_back_to_latin1(self):
+        message = protocol.split_message(b':Wiz PRIVMSG #chan :caf\xe9\r\n')
+        self.assertEquals(message.params, ['#chan', 'caf\u00e9'])
+
+    def test_split_keeps_raw_line(self):
+        message = protocol.split_message(b'PING :12345\r\n')
+        self.assertEquals(message.raw, b'PING :12345')
+        self.assertEquals(message.command, 'PING')
+
+    def test_message_has_no_dict(self):
+        message = protocol.split_message(b'PING :12345\r\n')
+        self.assertFalse(hasattr(message, '__dict__'))
+
+    def test_setting_prefix_updates_nick(self):
+        message = protocol.split_message(b':Old!old@host NICK New\r\n')
+        self.assertEquals(message.nick, 'Old')
+        message.prefix = 'Other!other@host'
+        self.assertEquals(message.nick, 'Other')
+        self.assertEquals(message.username, 'other')
+
+    def test_pickle_decodes_lazy_message(self):
+        message = protocol.split_message(b':Wiz!wiz@host PRIVMSG #chan :hi there\r\n')
+        copy = pickle.loads(pickle.dumps(message))
+        self.assertEquals(copy.prefix, 'Wiz!wiz@host')
+        self.assertEquals(copy.nick, 'Wiz')
+        self.assertEquals(copy.command, 'PRIVMSG')
+        self.assertEquals(copy.params, ['#chan', 'hi there'])
+
+
+class TestSplitMessageAt(unittest.TestCase):
+    def test_split_message_at_offset(self):
+        buf = bytearray(b'NICK Old\r\n:Wiz USER Test Test arg :A Real Name\r\nPING')
+        message = protocol.split_message_at(buf, 10, 48)
+        self.assertEquals(message.prefix, 'Wiz')
+        self.assertEquals(message.command, 'USER')
+        self.assertEquals(message.params, ['Test', 'Test', 'arg', 'A Real Name'])
+
+    def test_split_message_at_without_EOL_raises_error(self):
+        buf = bytearray(b'NICK Old\r\nNICK Test')
+        self.assertRaises(protocol.ProtocolViolationError,
+                          protocol.split_message_at, buf, 10, 19)
+
+    def test_split_message_at_with_non_ascii(self):
+        buf = bytearray(':Wiz PRIVMSG #chan :caf\u00e9 au lait\r\n'.encode('utf-8'))
+        message = protocol.split_message_at(buf, 0, len(buf))
+        self.assertEquals(message.params, ['#chan', 'caf\u00e9 au lait'])
+
+    def test_scan(self):
+        raw = b':Wiz PRIVMSG #chan :hi there\r\n'
+        prefix, command, params = protocol.scan(raw)
+        self.assertEquals(raw[prefix[0]:prefix[1]], b'Wiz')
+        self.assertEquals(raw[command[0]:command[1]], b'PRIVMSG')
+        self.assertEquals([raw[s:e] for s, e in params], [b'#chan', b'hi there'])
+
+
+class TestMessageParser(unittest.TestCase):
+    def test_parse_lines_split_across_chunks(self):
+        stream = irc.parser.StreamParser()
+        out = stream.set_parser(protocol.MessageParser())
+        stream.feed_data(b'PING :one\r\nPRIVMSG #chan')
+        stream.feed_data(b' :two\r\n')
+        messages = list(out._buffer)
+        self.assertEquals([m.command for m in messages], ['PING', 'PRIVMSG'])
+        self.assertEquals(messages[1].params, ['#chan', 'two'])
+
+    def test_bad_line_does_not_stop_parser(self):
+        stream = irc.parser.StreamParser()
+        out = stream.set_parser(protocol.MessageParser())
+        stream.feed_data(b'PING :one\r\nBAD\r\nPING :two\r\n')
+        items = list(out._buffer)
+        self.assertEquals(len(items), 3)
+        self.assertTrue(isinstance(items[1], protocol.ProtocolViolationError))
+        self.assertEquals(items[2].params, ['two'])
+
+    def test_read_batch(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        stream = irc.parser.StreamParser(loop=loop)
+        out = stream.set_parser(protocol.MessageParser())
+        stream.feed_data(b''.join(b'PING :' + bytes(str(i), 'ascii') + b'\r\n' for i in range(5)))
+        stream.feed_eof()
+
+        first = loop.run_until_complete(out.read_batch(3))
+        second = loop.run_until_complete(out.read_batch(3))
+        self.assertEquals([m.params[0] for m in first], ['0', '1', '2'])
+        self.assertEquals([m.params[0] for m in second], ['3', '4'])
+        self.assertRaises(irc.parser.EofStream, loop.run_until_complete, out.read_batch(3))
+
 
 class TestUnsplit(unittest.TestCase):
     def test_unsplit_without_prefix(self):
@@ -51,3 +149,24 @@ class TestUnsplit(unittest.TestCase):
     def test_unsplit_with_long_param(self):
         raw = protocol.unsplit(b'Wiz', b'USER', [b'Test', b'Test', b'arg', b'a long one'])
         self.assertEquals(raw, b':Wiz USER Test Test arg :a long one\r\n')
+
+
+class TestSplitText(unittest.TestCase):
+    def test_short_text_is_one_piece(self):
+        self.assertEquals(protocol.split_text(b'hello there', 20), [b'hello there'])
+
+    def test_prefers_whitespace(self):
+        self.assertEquals(protocol.split_text(b'aaaa bbbb cccc', 10), [b'aaaa bbbb', b'cccc'])
+
+    def test_splits_on_character_boundaries(self):
+        data = ('é' * 30).encode('utf-8')
+        pieces = protocol.split_text(data, 11)
+        self.assertTrue(all(len(piece) <= 11 for piece in pieces))
+        self.assertEquals(''.join(str(piece, 'utf-8') for piece in pieces), 'é' * 30)
+
+    def test_splits_line_breaks(self):
+        self.assertEquals(protocol.split_text(b'one\r\ntwo\n\nthree', 10), [b'one', b'two', b'three'])
+
+    def test_rejects_non_positive_limit(self):
+        self.assertRaises(ValueError, protocol.split_text, b'abc', 0)
+        self.assertRaises(ValueError, protocol.split_text, b'abc', -5)
@@ -0,0 +1,153 @@
+import unittest
+import unittest.mock
+import asyncio
+import os
+import shutil
+import tempfile
+import irc.client
+import irc.messages
+import irc.parser
+import irc.record
+import tests.utils
+
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'capture')
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def test_frames_round_trip(self):
+        times = iter([1.0, 2.5, 4.0])
+        recorder = irc.record.Recorder(self.path, clock=lambda: next(times))
+        recorder.received(b'PING :1\r\n')
+        recorder.sent(b'PONG :1\r\n')
+        recorder.close()
+        # appending keeps the earlier frames
+        recorder = irc.record.Recorder(self.path, clock=lambda: next(times))
+        recorder.received(b'PING :2\r\n')
+        recorder.close()
+
+        with irc.record.Capture(self.path) as capture:
+            self.assertEquals(list(capture.frames()), [
+                (1.0, irc.record.RECEIVED, b'PING :1\r\n'),
+                (2.5, irc.record.SENT, b'PONG :1\r\n'),
+                (4.0, irc.record.RECEIVED, b'PING :2\r\n')])
+            self.assertEquals([data for _, _, data in capture.frames(irc.record.SENT)], [b'PONG :1\r\n'])
+
+    def test_truncated_frame_ends_capture(self):
+        recorder = irc.record.Recorder(self.path)
+        recorder.received(b'PING :1\r\n')
+        recorder.received(b'PING :2\r\n')
+        recorder.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+        with irc.record.Capture(self.path) as capture:
+            self.assertEquals(len(list(capture.frames())), 1)
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a capture')
+        self.assertRaises(irc.record.CaptureError, irc.record.Capture, self.path)
+        self.assertRaises(irc.record.CaptureError, irc.record.Recorder, self.path)
+
+    def record_session(self, protocol_class):
+        recorder = irc.record.Recorder(self.path)
+        protocol = recorder.wrap_protocol(protocol_class)(loop=self.loop)
+        transport = unittest.mock.Mock()
+
+        @asyncio.coroutine
+        def connect(*args):
+            return transport, protocol
+
+        c = irc.client.IrcClient('example.com', 'TestNick', recorder=recorder, loop=self.loop)
+        with unittest.mock.patch('irc.client._connect', new=connect):
+            self.loop.run_until_complete(c.start())
+        protocol.data_received(b':irc.example.com 001 TestNick :Welcome\r\nPING :a')
+        protocol.data_received(b'bc\r\n')
+        tests.utils.run_briefly(self.loop)
+        tests.utils.run_briefly(self.loop)
+        protocol.connection_lost(None)
+        self.loop.run_until_complete(c._read_handler)
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+        recorder.close()
+        return c
+
+    def test_client_records_both_directions(self):
+        self.record_session(irc.parser.StreamProtocol)
+        with irc.record.Capture(self.path) as capture:
+            frames = [(direction, data) for _, direction, data in capture.frames()]
+        self.assertEquals(frames[0][0], irc.record.SENT)
+        self.assertTrue(frames[0][1].startswith(b'NICK TestNick\r\n'))
+        self.assertEquals(frames[1:], [
+            (irc.record.RECEIVED, b':irc.example.com 001 TestNick :Welcome\r\nPING :a'),
+            (irc.record.RECEIVED, b'bc\r\n'),
+            (irc.record.SENT, b'PONG abc\r\n')])
+
+    def test_quit_flushes_recorder(self):
+        recorder = irc.record.Recorder(self.path)
+        self.addCleanup(recorder.close)
+
+        @asyncio.coroutine
+        def connect(host, port, ssl, loop, protocol_class, *args):
+            return unittest.mock.Mock(), protocol_class(loop=loop)
+
+        c = irc.client.IrcClient('example.com', 'TestNick', recorder=recorder, loop=self.loop)
+        with unittest.mock.patch('irc.client._connect', new=connect):
+            self.loop.run_until_complete(c.start())
+        self.loop.run_until_complete(c.quit())
+        tests.utils.run_briefly(self.loop)
+        with irc.record.Capture(self.path) as capture:
+            sent = b''.join(data for _, _, data in capture.frames(irc.record.SENT))
+        self.assertTrue(sent.endswith(b'QUIT\r\n'))
+
+    def test_buffered_protocol_recorded_once(self):
+        self.record_session(irc.parser.BufferedStreamProtocol)
+        with irc.record.Capture(self.path) as capture:
+            received = b''.join(data for _, _, data in capture.frames(irc.record.RECEIVED))
+        self.assertEquals(received, b':irc.example.com 001 TestNick :Welcome\r\nPING :abc\r\n')
+
+    def test_replay(self):
+        recorder = irc.record.Recorder(self.path)
+        recorder.received(b':irc.example.com 001 TestNick :Welcome\r\n')
+        for i in range(100):
+            recorder.received(irc.messages.PrivMsg('#chan', str(i), prefix='a!b@c').encode())
+        recorder.received(b'PING :end\r\n')
+        recorder.close()
+
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        seen = []
+
+        @c.handles('PRIVMSG')
+        @asyncio.coroutine
+        def handler(client, message):
+            seen.append(message.params[1])
+
+        transport = self.loop.run_until_complete(irc.record.replay(c, self.path, yield_every=10))
+        self.loop.run_until_complete(c.tasks.join())
+        tests.utils.run_briefly(self.loop)
+        self.assertTrue(c.registered)
+        self.assertEquals(seen, [str(i) for i in range(100)])
+        self.assertTrue(transport.written_bytes > 0)
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
+
+    def test_realtime_replay(self):
+        times = iter([0.0, 0.05])
+        recorder = irc.record.Recorder(self.path, clock=lambda: next(times))
+        recorder.received(b'PING :1\r\n')
+        recorder.received(b'PING :2\r\n')
+        recorder.close()
+
+        c = irc.client.IrcClient('example.com', 'TestNick', loop=self.loop)
+        start = self.loop.time()
+        self.loop.run_until_complete(irc.record.replay(c, self.path, realtime=True, speed=2))
+        self.assertTrue(self.loop.time() - start >= 0.02)
+        c._send_handler.cancel()
+        tests.utils.run_briefly(self.loop)
@@ -0,0 +1,148 @@
+import unittest
+import asyncio
+import irc.sendqueue
+
+
+class TestSendQueue(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def drain(self, queue):
+        lines = []
+        while queue:
+            lines.append(queue.get_nowait()[0])
+        return lines
+
+    def test_round_robin_across_targets(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        for i in range(3):
+            queue.put_nowait(b'a' + bytes(str(i), 'ascii'), '#a')
+        queue.put_nowait(b'b0', '#b')
+        queue.put_nowait(b'c0', 'nick')
+        self.assertEquals(self.drain(queue), [b'a0', b'b0', b'c0', b'a1', b'a2'])
+
+    def test_fifo_without_targets(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        for line in (b'PASS', b'NICK', b'USER'):
+            queue.put_nowait(line)
+        self.assertEquals(self.drain(queue), [b'PASS', b'NICK', b'USER'])
+
+    def test_get_waits_for_line(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        self.loop.call_soon(queue.put_nowait, b'PING')
+        self.assertEquals(self.loop.run_until_complete(queue.get())[0], b'PING')
+        self.assertTrue(queue.empty())
+
+    def test_get_nowait_on_empty_raises_error(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        self.assertRaises(asyncio.QueueEmpty, queue.get_nowait)
+
+    def test_control_lane_goes_first(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        queue.put_nowait(b'bulk', priority=irc.sendqueue.Priority.bulk)
+        queue.put_nowait(b'privmsg', '#a')
+        queue.put_nowait(b'pong', priority=irc.sendqueue.Priority.control)
+        self.assertEquals(queue.next_priority(), irc.sendqueue.Priority.control)
+        self.assertEquals(self.drain(queue), [b'pong', b'privmsg', b'bulk'])
+        self.assertTrue(queue.next_priority() is None)
+
+    def test_wait_control_returns_early_for_control_line(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        self.loop.call_soon(queue.put_nowait, b'pong', None, irc.sendqueue.Priority.control)
+        start = self.loop.time()
+        self.loop.run_until_complete(queue.wait_control(10))
+        self.assertTrue(self.loop.time() - start < 1)
+
+    def test_wait_control_times_out(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        queue.put_nowait(b'privmsg', '#a')
+        self.loop.run_until_complete(queue.wait_control(0.01))
+        self.assertEquals(queue.depth(irc.sendqueue.Priority.normal), 1)
+
+    def test_default_priority(self):
+        self.assertEquals(irc.sendqueue.default_priority('PONG'), irc.sendqueue.Priority.control)
+        self.assertEquals(irc.sendqueue.default_priority('PRIVMSG'), irc.sendqueue.Priority.normal)
+
+    def test_overflow_raise(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop, high_water=10,
+                                        overflow=irc.sendqueue.Overflow.raise_)
+        queue.put_nowait(b'x' * 8)
+        self.assertRaises(irc.sendqueue.SendQueueFull, queue.put_nowait, b'x' * 8)
+        queue.put_nowait(b'pong', priority=irc.sendqueue.Priority.control)
+        self.assertEquals(queue.queued_bytes, 12)
+
+    def test_overflow_drop_only_drops_bulk(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop, high_water=10,
+                                        overflow=irc.sendqueue.Overflow.drop)
+        queue.put_nowait(b'x' * 8)
+        delivery = queue.put_nowait(b'y' * 8, priority=irc.sendqueue.Priority.bulk)
+        queue.put_nowait(b'z' * 8)
+        self.assertTrue(delivery.cancelled())
+        self.assertEquals(queue.dropped_lines, 1)
+        self.assertEquals(self.drain(queue), [b'x' * 8, b'z' * 8])
+
+    def test_overflow_block_waits_for_space(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop, high_water=10,
+                                        overflow=irc.sendqueue.Overflow.block)
+        queue.put_nowait(b'x' * 8)
+        queue.put_nowait(b'y' * 8)
+        self.assertTrue(queue.is_full())
+        waiter = asyncio.Task(queue.wait_writable(), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.assertFalse(waiter.done())
+        queue.get_nowait()
+        self.loop.run_until_complete(waiter)
+        self.assertEquals(queue.queued_bytes, 8)
+
+    def test_hold_serves_only_control_lane(self):
+        q = irc.sendqueue.SendQueue(loop=self.loop)
+        q.hold()
+        q.put_nowait(b'PRIVMSG #a :hi\r\n', '#a')
+        self.assertTrue(q.empty())
+        waiter = asyncio.Task(q.get(), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.assertFalse(waiter.done())
+        q.put_nowait(b'PONG x\r\n', priority=irc.sendqueue.Priority.control)
+        self.assertEquals(self.loop.run_until_complete(waiter)[0], b'PONG x\r\n')
+        self.assertRaises(asyncio.QueueEmpty, q.get_nowait)
+        q.release()
+        self.assertEquals(self.drain(q), [b'PRIVMSG #a :hi\r\n'])
+
+    def test_clear_fails_deliveries(self):
+        q = irc.sendqueue.SendQueue(loop=self.loop)
+        first = q.put_nowait(b'PRIVMSG #a :hi\r\n', '#a')
+        rest = q.put_many([b'PRIVMSG #b :one\r\n', b'PRIVMSG #b :two\r\n'], '#b')
+        q.clear(ConnectionResetError())
+        self.assertTrue(q.empty())
+        self.assertEquals(q.queued_bytes, 0)
+        self.assertIsInstance(first.exception(), ConnectionResetError)
+        self.assertIsInstance(rest.exception(), ConnectionResetError)
+
+    def test_next_size(self):
+        q = irc.sendqueue.SendQueue(loop=self.loop)
+        q.put_nowait(b'PRIVMSG #a :hi\r\n', '#a')
+        q.put_nowait(b'PONG x\r\n', priority=irc.sendqueue.Priority.control)
+        self.assertEquals(q.next_size(), 8)
+        q.get_nowait()
+        self.assertEquals(q.next_size(), 16)
+        q.get_nowait()
+        self.assertRaises(asyncio.QueueEmpty, q.next_size)
+
+    def test_put_many_keeps_order_with_one_future(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop)
+        delivery = queue.put_many([b'a0', b'a1', b'a2'], '#a')
+        queue.put_nowait(b'b0', '#b')
+        self.assertEquals(len(queue), 4)
+        entries = [queue.get_nowait() for _ in range(4)]
+        self.assertEquals([raw for raw, _ in entries], [b'a0', b'b0', b'a1', b'a2'])
+        self.assertTrue(entries[-1][1] is delivery)
+        self.assertEquals(entries[0][1], None)
+
+    def test_put_many_over_high_water(self):
+        queue = irc.sendqueue.SendQueue(loop=self.loop, high_water=5, overflow=irc.sendqueue.Overflow.raise_)
+        self.assertRaises(irc.sendqueue.SendQueueFull, queue.put_many, [b'abc', b'def'])
+        self.assertEquals(len(queue), 0)
@@ -0,0 +1,166 @@
+import unittest
+import asyncio
+import os
+import socket
+import irc.bot
+import irc.client
+import irc.messages
+import irc.server
+
+CERTFILE = os.path.join(os.path.dirname(__file__), 'keycert.pem')
+
+
+class TestFakeServer(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.server = irc.server.FakeServer(loop=self.loop)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            self.wait(client.quit())
+        self.wait(self.server.close())
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.loop.close()
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, 5, loop=self.loop))
+
+    @asyncio.coroutine
+    def until(self, predicate):
+        while not predicate():
+            yield from asyncio.sleep(0.005, loop=self.loop)
+
+    def connect(self, nick, client_class=irc.client.IrcClient, ssl=None, **kwargs):
+        if self.server.port is None:
+            self.wait(self.server.start(ssl=ssl[0] if ssl else None))
+        client = client_class('127.0.0.1', nick, port=self.server.port, ssl=ssl[1] if ssl else False,
+                              loop=self.loop, **kwargs)
+        self.clients.append(client)
+        self.wait(client.start())
+        self.wait(self.until(lambda: client.registered))
+        return client
+
+    def received(self, client, command):
+        seen = []
+
+        @client.handles(command)
+        @asyncio.coroutine
+        def handler(client, message):
+            seen.append(message)
+
+        return seen
+
+    def test_registration(self):
+        c = self.connect('TestNick')
+        self.assertEquals(c.nick, 'TestNick')
+        self.assertEquals(self.server.stats()['users'], 1)
+
+    def test_nick_in_use(self):
+        self.connect('TestNick')
+        c = self.connect('TestNick')
+        self.assertEquals(c.nick, 'TestNick_')
+
+    def test_channel_fan_out(self):
+        a = self.connect('alice')
+        b = self.connect('bob')
+        names = self.received(b, irc.codes.RPL_NAMREPLY)
+        messages = self.received(b, 'PRIVMSG')
+        a.send_message(irc.messages.Join('#chan'))
+        self.wait(self.until(lambda: '#chan' in a.channels))
+        b.send_message(irc.messages.Join('#chan'))
+        self.wait(self.until(lambda: names))
+        self.assertEquals(names[0].params[3], 'alice bob')
+        a.send_privmsg('#chan', 'hello there')
+        self.wait(self.until(lambda: messages))
+        self.assertEquals(messages[0].nick, 'alice')
+        self.assertEquals(messages[0].params, ['#chan', 'hello there'])
+
+        quits = self.received(b, 'PART')
+        a.send_message(irc.messages.Part('#chan'))
+        self.wait(self.until(lambda: quits))
+        self.assertEquals(self.server.channels['#chan'], {self.server.users['bob']})
+
+    def test_errors_and_ping(self):
+        c = self.connect('TestNick')
+        errors = self.received(c, irc.codes.ERR_NOSUCHNICK)
+        pongs = self.received(c, 'PONG')
+        c.send_privmsg('nobody', 'hi')
+        c.send_message(irc.messages.Ping(['token']))
+        self.wait(self.until(lambda: errors and pongs))
+        self.assertEquals(errors[0].params[1], 'nobody')
+        self.assertEquals(pongs[0].params, [self.server.name, 'token'])
+
+    def test_bot_command_over_tcp(self):
+        bot = self.connect('bot', irc.bot.IrcBot, config={'STARTING_CHANNELS': []})
+
+        @bot.handles_command('echo', ['text'])
+        @asyncio.coroutine
+        def echo(bot, command):
+            yield from command.reply(bot, command.params.text)
+
+        user = self.connect('user')
+        replies = self.received(user, 'PRIVMSG')
+        user.send_privmsg('bot', ';echo hi')
+        self.wait(self.until(lambda: replies))
+        self.assertEquals(replies[0].params, ['user', 'hi'])
+
+    def test_tls(self):
+        c = self.connect('TestNick', ssl=irc.server.tls_contexts(CERTFILE))
+        self.assertTrue(c._transport.get_extra_info('sslcontext') is not None)
+        self.assertEquals(c.nick, 'TestNick')
+
+    def test_flood(self):
+        c = self.connect('TestNick')
+        messages = self.received(c, 'PRIVMSG')
+        c.send_message(irc.messages.Join('#flood'))
+        self.wait(self.until(lambda: '#flood' in c.channels))
+        self.server.add_users(10, ['#flood'])
+        start = self.loop.time()
+        sent = self.wait(self.server.flood('#flood', rate=2000, count=200))
+        self.assertEquals(sent, 200)
+        self.assertTrue(self.loop.time() - start >= 0.09)
+        self.wait(self.until(lambda: len(messages) == 200))
+        self.assertEquals(len({m.nick for m in messages}), 10)
+
+    def test_netsplit(self):
+        c = self.connect('TestNick')
+        quits = self.received(c, 'QUIT')
+        joins = self.received(c, 'JOIN')
+        c.send_message(irc.messages.Join('#chan'))
+        self.wait(self.until(lambda: joins))
+        self.server.add_users(5, ['#chan'])
+        self.wait(self.server.netsplit(rejoin_after=0.01))
+        self.wait(self.until(lambda: len(joins) == 11))
+        self.assertEquals(len(quits), 5)
+        self.assertEquals(quits[0].params, [irc.server.NETSPLIT_REASON])
+        self.assertEquals(len(self.server.channels['#chan']), 6)
+
+    def test_slow_reader_pauses_writes(self):
+        self.server.read_delay = 0.05
+        c = self.connect('TestNick')
+        # otherwise the kernel soaks up megabytes before the transport fills
+        c._transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        line = 'x' * 400
+        for _ in range(2000):
+            c.send_privmsg('TestNick', line)
+        self.wait(self.until(lambda: c.send_stats()['pause_count'] > 0))
+        self.assertTrue(c.send_stats()['queued_lines'] > 0)
+
+    def test_privmsg_many_uses_targmax(self):
+        a = self.connect('alice')
+        b = self.connect('bob')
+        self.assertEquals(a.max_targets('PRIVMSG'), 4)
+        channels = ['#chan{}'.format(i) for i in range(10)]
+        for channel in channels:
+            a.send_message(irc.messages.Join(channel))
+            b.send_message(irc.messages.Join(channel))
+        self.wait(self.until(lambda: len(a.channels) == 10 and len(b.channels) == 10))
+        messages = self.received(b, 'PRIVMSG')
+        sent = []
+        self.server.add_listener(lambda user, message: message.command == 'PRIVMSG' and sent.append(message))
+        self.wait(a.send_privmsg_many(channels, 'announcement'))
+        self.wait(self.until(lambda: len(messages) == 10))
+        self.assertEquals(len(sent), 3)
+        self.assertEquals(sorted(m.params[0] for m in messages), sorted(channels))
@@ -0,0 +1,144 @@
+import unittest
+import unittest.mock
+import asyncio
+import os
+import signal
+import socket
+import irc.parser
+import irc.shard
+import tests.utils
+
+
+def setup(manager):
+    manager.defaults['config'] = {'STARTING_CHANNELS': []}
+
+
+@asyncio.coroutine
+def fake_connect(host, port, ssl, loop, *args):
+    return unittest.mock.Mock(), irc.parser.StreamProtocol(loop=loop)
+
+
+class TestSharding(unittest.TestCase):
+    def test_hash_is_stable(self):
+        self.assertEquals(irc.shard.shard_by_hash('net1', None, 4), irc.shard.shard_by_hash('net1', 'other', 4))
+        spread = {irc.shard.shard_by_hash('net{}'.format(i), None, 4) for i in range(50)}
+        self.assertEquals(spread, {0, 1, 2, 3})
+
+    def test_network_keeps_connections_together(self):
+        policy = irc.shard.ShardByNetwork()
+        self.assertEquals(policy('a1', 'efnet', 2), 0)
+        self.assertEquals(policy('b1', 'freenode', 2), 1)
+        self.assertEquals(policy('a2', 'efnet', 2), 0)
+        self.assertEquals(policy('c1', 'quakenet', 2), 0)
+
+
+class TestShardSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        # workers are forked, so they inherit the patched connect
+        patcher = unittest.mock.patch('irc.client._connect', new=fake_connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.supervisor = irc.shard.ShardSupervisor(2, shard_by='network', setup=setup, loop=self.loop,
+                                                    restart_delay=0.01, stagger=0)
+        self.supervisor.add('efnet1', 'irc.efnet.org', 'Bot', network='efnet')
+        self.supervisor.add('freenode1', 'chat.freenode.net', 'Bot', network='freenode')
+        self.supervisor.add('efnet2', 'irc.efnet.org', 'Bot2', network='efnet')
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.supervisor.stop())
+        self.loop.close()
+
+    def run_with_timeout(self, coro):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, 5, loop=self.loop))
+
+    def test_commands_and_stats(self):
+        self.supervisor.start()
+        self.run_with_timeout(self.supervisor.join('efnet2', '#chan'))
+        self.run_with_timeout(self.supervisor.send('freenode1', '#chan', 'hello'))
+
+        stats = self.run_with_timeout(self.supervisor.stats())
+        self.assertEquals([s['clients'] for s in stats], [2, 1])
+        self.assertEquals([s['connections'] for s in stats], [2, 1])
+        self.assertNotEqual(stats[0]['pid'], stats[1]['pid'])
+
+        with self.assertRaises(irc.shard.WorkerError):
+            self.run_with_timeout(self.supervisor._request(0, 'join', 'nobody', '#chan'))
+
+    def test_add_after_start(self):
+        self.supervisor.start()
+        self.run_with_timeout(self.supervisor.add('freenode2', 'chat.freenode.net', 'Bot2', network='freenode'))
+        stats = self.run_with_timeout(self.supervisor.stats())
+        self.assertEquals(stats[1]['clients'], 2)
+
+    def test_crashed_worker_restarts(self):
+        self.supervisor.start()
+        before = self.run_with_timeout(self.supervisor.stats())
+        os.kill(before[1]['pid'], signal.SIGKILL)
+
+        @asyncio.coroutine
+        def restarted():
+            while True:
+                yield from asyncio.sleep(0.02, loop=self.loop)
+                stats = yield from self.supervisor.stats()
+                if 'pid' in stats[1]:
+                    return stats
+
+        after = self.run_with_timeout(restarted())
+        self.assertEquals(after[1]['restarts'], 1)
+        self.assertEquals(after[1]['clients'], 1)
+        self.assertNotEqual(after[1]['pid'], before[1]['pid'])
+
+
+class TestRequestPipe(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_full_socket_does_not_block(self):
+        supervisor = irc.shard.ShardSupervisor(1, loop=self.loop)
+        supervisor._placement['net'] = 0
+        parent, child = socket.socketpair()
+        worker = supervisor._workers[0]
+        worker.channel = irc.shard._open_channel(self.loop, parent, None, lambda: None)
+
+        # nothing reads the socket until every request is queued
+        message = 'x' * 65536
+        for _ in range(100):
+            supervisor.send('net', '#chan', message)
+        tests.utils.run_briefly(self.loop)
+        self.assertTrue(worker.channel.transport.get_write_buffer_size() > 0)
+
+        received = []
+        done = asyncio.Future(loop=self.loop)
+
+        def on_message(request):
+            received.append(request)
+            if len(received) == 100:
+                done.set_result(None)
+
+        reader = irc.shard._open_channel(self.loop, child, on_message, lambda: None)
+        self.loop.run_until_complete(asyncio.wait_for(done, 5, loop=self.loop))
+        self.assertEquals(received[0][1:], ('send', ('net', '#chan', message)))
+        self.assertEquals([r[0] for r in received], list(range(1, 101)))
+        self.assertEquals(worker.channel.transport.get_write_buffer_size(), 0)
+        worker.channel.close()
+        reader.close()
+        tests.utils.run_briefly(self.loop)
+
+    def test_frames_split_across_reads(self):
+        received = []
+        channel = irc.shard._Channel(received.append, lambda: None)
+        frames = []
+        for obj in ('one', ('two', 2), None):
+            sender = irc.shard._Channel(None, None)
+            sender.send(obj)
+            frames.extend(sender._unsent)
+        data = b''.join(frames)
+        for i in range(0, len(data), 3):
+            channel.data_received(data[i:i + 3])
+        self.assertEquals(received, ['one', ('two', 2), None])
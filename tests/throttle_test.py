@@ -0,0 +1,59 @@
+import unittest
+import irc.throttle
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_is_free(self):
+        bucket = irc.throttle.TokenBucket(0.5, burst=5, clock=self.clock)
+        for _ in range(5):
+            self.assertEquals(bucket.delay(), 0.0)
+            bucket.consume()
+        self.assertEquals(bucket.delay(), 2.0)
+
+    def test_tokens_refill_at_rate(self):
+        bucket = irc.throttle.TokenBucket(0.5, burst=5, clock=self.clock)
+        bucket.consume(5)
+        self.clock.now = 3.0
+        self.assertEquals(bucket.tokens, 1.5)
+        self.clock.now = 100.0
+        self.assertEquals(bucket.tokens, 5)
+
+    def test_delay_for_several_lines(self):
+        bucket = irc.throttle.TokenBucket(2, burst=2, clock=self.clock)
+        self.assertEquals(bucket.delay(4), 1.0)
+
+    def test_from_interval(self):
+        bucket = irc.throttle.TokenBucket.from_interval(2, clock=self.clock)
+        bucket.consume()
+        self.assertEquals(bucket.delay(), 2.0)
+
+    def test_invalid_rate_raises_error(self):
+        self.assertRaises(ValueError, irc.throttle.TokenBucket, 0)
+
+
+class TestBackoff(unittest.TestCase):
+    def test_grows_to_maximum(self):
+        backoff = irc.throttle.Backoff(initial=1, maximum=5, jitter=0)
+        self.assertEquals([backoff.next() for _ in range(5)], [1, 2, 4, 5, 5])
+
+    def test_jitter(self):
+        backoff = irc.throttle.Backoff(initial=4, jitter=0.5, random=lambda: 1.0)
+        self.assertEquals(backoff.next(), 2.0)
+
+    def test_reset(self):
+        backoff = irc.throttle.Backoff(initial=1, jitter=0)
+        backoff.next()
+        backoff.next()
+        backoff.reset()
+        self.assertEquals(backoff.next(), 1)
@@ -6,3 +6,9 @@ def run_briefly(loop):
         pass
     t = asyncio.Task(once(), loop=loop)
     loop.run_until_complete(t)
+
+
+def written_lines(transport):
+    """Every line written to a mock transport, however the writes were batched."""
+    data = b''.join(c[1][0] for c in transport.mock_calls if c[0] == 'write')
+    return [line + b'\r\n' for line in data.split(b'\r\n')[:-1]]